@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AnonymizationConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "anonymization"
+
+    def ready(self):
+        from .stats import connect_signals
+        connect_signals()
@@ -0,0 +1,264 @@
+import os
+import platform
+import tempfile
+import time
+import uuid
+from cryptography.fernet import Fernet
+
+from .encryption import (
+    KeyRing, LayerEncryption, SecureSessionManager, get_key_ring, get_encryption_instance,
+    encrypt_many, decrypt_many, ENVELOPE_V2_HEADER, ENVELOPE_V3,
+)
+
+
+BENCHMARK_FORMAT = 1  # À incrémenter si la structure du JSON change
+
+
+def _stored_size(encrypted_data, nonce, salt) -> int:
+    """Octets réellement écrits dans la ligne AnonymousMessage"""
+    return len(encrypted_data) + len(nonce) + (len(salt) if salt else 0)
+
+
+def _timed(func, iterations: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return time.perf_counter() - start_time
+
+
+def _rates(seconds: float, operations: int, bytes_per_op: int = 0) -> dict:
+    """Débit d'une mesure : ops/s, octets/s et latence moyenne"""
+    seconds = max(seconds, 1e-9)
+    return {
+        'ops_per_sec': round(operations / seconds, 1),
+        'bytes_per_sec': round(operations * bytes_per_op / seconds, 1),
+        'us_per_op': round(seconds / operations * 1e6, 2),
+    }
+
+
+def _payload(size: int) -> str:
+    # Texte aléatoire imprimable : pas de compression possible côté base
+    return os.urandom(size).hex()[:size]
+
+
+def benchmark_envelopes(sizes=(64, 1024, 16384), iterations: int = 2000) -> dict:
+    """Compare taille de ligne et coût CPU des enveloppes v1 (Fernet) et v2 (AES-GCM)"""
+    key_ring = get_key_ring()
+    layer_id = str(uuid.uuid4())
+    results = {}
+
+    for size in sizes:
+        message = _payload(size)
+        by_version = {}
+
+        for version in (1, 2):
+            encryptor = LayerEncryption(key_ring=key_ring, envelope_version=version)
+            encrypted_data, nonce, salt = encryptor.encrypt_message(message, layer_id, 'benchmark')
+
+            encrypt_seconds = _timed(lambda: encryptor.encrypt_message(message, layer_id, 'benchmark'), iterations)
+            decrypt_seconds = _timed(lambda: encryptor.decrypt_message(encrypted_data, nonce, salt), iterations)
+
+            by_version[f'v{version}'] = {
+                'row_bytes': _stored_size(encrypted_data, nonce, salt),
+                'overhead_bytes': _stored_size(encrypted_data, nonce, salt) - size,
+                'encrypt_us': round(encrypt_seconds / iterations * 1e6, 2),
+                'decrypt_us': round(decrypt_seconds / iterations * 1e6, 2),
+            }
+
+        v1, v2 = by_version['v1'], by_version['v2']
+        by_version['row_bytes_saved_pct'] = round((1 - v2['row_bytes'] / v1['row_bytes']) * 100, 1)
+        by_version['encrypt_speedup'] = round(v1['encrypt_us'] / v2['encrypt_us'], 2)
+        by_version['decrypt_speedup'] = round(v1['decrypt_us'] / v2['decrypt_us'], 2)
+        results[str(size)] = by_version
+
+    return {'iterations': iterations, 'payload_sizes': results}
+
+
+def benchmark_messages(sizes=(64, 1024, 16384), iterations: int = 2000) -> dict:
+    """Chiffrement/déchiffrement unitaire avec l'enveloppe configurée"""
+    encryptor = get_encryption_instance()
+    layer_id = uuid.uuid4()
+    results = {}
+
+    try:
+        layer_aead = _benchmark_layer_aead(encryptor, layer_id)
+        for size in sizes:
+            message = _payload(size)
+            encrypted_data, nonce, salt = encryptor.encrypt_message(message, str(layer_id), 'benchmark', layer_aead)
+
+            results[str(size)] = {
+                'encrypt': _rates(
+                    _timed(lambda: encryptor.encrypt_message(message, str(layer_id), 'benchmark', layer_aead), iterations),
+                    iterations, size
+                ),
+                'decrypt': _rates(
+                    _timed(lambda: encryptor.decrypt_message(encrypted_data, nonce, salt), iterations),
+                    iterations, size
+                ),
+                'row_bytes': _stored_size(encrypted_data, nonce, salt),
+            }
+    finally:
+        _forget_layer_key(layer_id)
+
+    return {'envelope_version': encryptor.envelope_version, 'payload_sizes': results}
+
+
+def benchmark_batches(batch_size: int = 2000, size: int = 1024, rounds: int = 3) -> dict:
+    """encrypt_many/decrypt_many comparés à la boucle unitaire"""
+    encryptor = get_encryption_instance()
+    messages = [_payload(size) for _ in range(batch_size)]
+    sealed = [result.value for result in encrypt_many(messages)]
+
+    sequential = _timed(lambda: [encryptor.encrypt_message(message) for message in messages], rounds)
+    batch_encrypt = _timed(lambda: encrypt_many(messages), rounds)
+    batch_decrypt = _timed(lambda: decrypt_many(sealed), rounds)
+
+    return {
+        'batch_size': batch_size,
+        'payload_bytes': size,
+        'sequential_encrypt': _rates(sequential, batch_size * rounds, size),
+        'encrypt_many': _rates(batch_encrypt, batch_size * rounds, size),
+        'decrypt_many': _rates(batch_decrypt, batch_size * rounds, size),
+        'batch_speedup': round(sequential / max(batch_encrypt, 1e-9), 2),
+    }
+
+
+def benchmark_primitives(hash_iterations: int = 5, session_iterations: int = 20000, load_iterations: int = 20) -> dict:
+    """KDF, génération d'identifiants de session et chargement du trousseau"""
+    encryptor = get_encryption_instance()
+
+    # Trousseau jetable : load() peut créer ou faire tourner des clés, jamais celles du processus
+    with tempfile.TemporaryDirectory() as keys_dir:
+        key_ring = KeyRing(keys_dir=keys_dir, poll_interval=0)
+        key_ring_load = _timed(key_ring.load, load_iterations)
+
+    return {
+        'generate_secure_hash': _rates(
+            _timed(lambda: encryptor.generate_secure_hash('benchmark'), hash_iterations), hash_iterations
+        ),
+        'session_id': _rates(
+            _timed(SecureSessionManager.generate_anonymous_session, session_iterations), session_iterations, 64
+        ),
+        'key_ring_load': _rates(key_ring_load, load_iterations),
+    }
+
+
+def run_benchmarks(sizes=(64, 1024, 16384), iterations: int = 2000, batch_size: int = 2000) -> dict:
+    """Rapport complet, stable d'une version à l'autre pour suivre les régressions"""
+    return {
+        'format': BENCHMARK_FORMAT,
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'messages': benchmark_messages(sizes, iterations),
+        'envelopes': benchmark_envelopes(sizes, iterations),
+        'batches': benchmark_batches(batch_size),
+        'primitives': benchmark_primitives(),
+    }
+
+
+def _benchmark_layer_aead(encryptor, layer_id):
+    """Graine créée pour un layer de mesure (sans TrueAnonymousLayer), supprimée ensuite"""
+    from .layer_keys import create_layer_key
+    create_layer_key(layer_id)
+    return encryptor.resolve_layer_aead(layer_id)
+
+
+def _forget_layer_key(layer_id):
+    """Supprime la graine créée pour un layer de mesure"""
+    from .models import LayerKey
+    LayerKey.objects.filter(pk=layer_id).delete()
+
+
+def run_self_test() -> list:
+    """Vérifie les propriétés du chiffrement ; renvoie [(nom, réussi, détail)]"""
+    key_ring = get_key_ring()
+    layer_id = uuid.uuid4()
+    layer_aead = None
+    results = []
+
+    def check(name, func):
+        try:
+            func()
+            results.append((name, True, ''))
+        except Exception as e:
+            results.append((name, False, str(e) or e.__class__.__name__))
+
+    def round_trip(version):
+        encryptor = LayerEncryption(key_ring=key_ring, envelope_version=version)
+        for message in ('', 'present day, present time', 'é' * 5000):
+            encrypted_data, nonce, salt = encryptor.encrypt_message(message, str(layer_id), 'self_test', layer_aead)
+            assert encryptor.decrypt_message(encrypted_data, nonce, salt) == message, "round trip mismatch"
+            assert message.encode() not in encrypted_data or not message, "plaintext visible in ciphertext"
+
+    def tamper(version):
+        encryptor = LayerEncryption(key_ring=key_ring, envelope_version=version)
+        encrypted_data, nonce, salt = encryptor.encrypt_message('integrity', str(layer_id), 'self_test', layer_aead)
+        tampered = bytearray(encrypted_data)
+        tampered[-1] ^= 0x01
+        try:
+            encryptor.decrypt_message(bytes(tampered), nonce, salt)
+        except ValueError:
+            return
+        raise AssertionError("tampered ciphertext accepted")
+
+    def nonce_uniqueness():
+        encryptor = LayerEncryption(key_ring=key_ring)
+        nonces = {encryptor.encrypt_message('x', str(layer_id), layer_aead=layer_aead)[1] for _ in range(1000)}
+        assert len(nonces) == 1000, "nonce reused"
+
+    def batch_order():
+        messages = [f"message {i}" for i in range(200)]
+        sealed = [result.value for result in encrypt_many(messages, str(layer_id), layer_aead=layer_aead)]
+        sealed[7] = (b'\x02corrupted', '', None)
+        decrypted = decrypt_many(sealed)
+        assert not decrypted[7].ok, "corrupted item not reported"
+        assert all(decrypted[i].value == messages[i] for i in range(200) if i != 7), "batch order lost"
+
+    def rotation():
+        # Trousseau jetable : la rotation ne doit pas toucher les clés du processus
+        with tempfile.TemporaryDirectory() as keys_dir:
+            scratch_ring = KeyRing(keys_dir=keys_dir, poll_interval=0)
+            v1, v2 = (LayerEncryption(key_ring=scratch_ring, envelope_version=version) for version in (1, 2))
+            sealed_v1 = v1.encrypt_message('rotate me', str(layer_id))
+            sealed_v2 = v2.encrypt_message('rotate me', str(layer_id))
+            old_key_id = scratch_ring.current_key_id
+
+            scratch_ring.rotate()
+            assert scratch_ring.current_key_id != old_key_id, "master key unchanged by rotation"
+
+            for encryptor, (encrypted_data, nonce, salt) in ((v1, sealed_v1), (v2, sealed_v2)):
+                assert encryptor.decrypt_message(encrypted_data, nonce, salt) == 'rotate me', \
+                    "old ciphertext unreadable through the backup key"
+                assert encryptor.decrypt_message(encryptor.rotate_token(encrypted_data), nonce, salt) == 'rotate me', \
+                    "rotated token unreadable"
+
+            # Les tokens réécrits ne dépendent plus de l'ancienne clé
+            Fernet(scratch_ring.master_key).decrypt(v1.rotate_token(sealed_v1[0]))
+            rotated_key_id = ENVELOPE_V2_HEADER.unpack_from(v2.rotate_token(sealed_v2[0]))[1]
+            assert rotated_key_id == scratch_ring.current_key_id, "rotated v2 envelope still on the old key"
+
+    def secure_hash():
+        encryptor = get_encryption_instance()
+        first, salt = encryptor.generate_secure_hash('self_test', iterations=1000)
+        second, _ = encryptor.generate_secure_hash('self_test', salt, iterations=1000)
+        assert first == second, "hash not deterministic for a given salt"
+
+    def session_ids():
+        ids = {SecureSessionManager.generate_anonymous_session() for _ in range(1000)}
+        assert len(ids) == 1000, "duplicate session id"
+
+    try:
+        layer_aead = _benchmark_layer_aead(LayerEncryption(key_ring=key_ring, envelope_version=ENVELOPE_V3), layer_id)
+        for version in (1, 2, ENVELOPE_V3):
+            check(f'round_trip_v{version}', lambda: round_trip(version))
+            check(f'tamper_detection_v{version}', lambda: tamper(version))
+        check('nonce_uniqueness', nonce_uniqueness)
+        check('batch_order_and_errors', batch_order)
+        check('key_rotation', rotation)
+        check('secure_hash', secure_hash)
+        check('session_ids', session_ids)
+    finally:
+        _forget_layer_key(layer_id)
+
+    return results
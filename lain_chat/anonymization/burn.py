@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from django.db import OperationalError, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TrueAnonymousLayer, LayerMapping, DataFragment, LayerKey, EmergencyBurn
+
+
+logger = logging.getLogger('lain_models')
+
+GRAVEYARD_PREFIX = 'lain_burned_'
+
+_reap_lock = threading.Lock()
+
+
+def _graveyard_table(burn_id: uuid.UUID, table: str) -> str:
+    return f'{GRAVEYARD_PREFIX}{burn_id.hex}_{table}'
+
+
+def _swap_out(model, graveyard: str, using: str):
+    """Remplace la table du modèle par une table vide, l'ancienne partant au cimetière
+
+    Renommer une table ne touche pas à ses pages. Seuls ses index nommés sont
+    supprimés (leurs noms doivent être repris par la table neuve) : le coût
+    ne dépend plus du volume de données, seulement de la taille des index.
+    """
+    from .partitions import create_table
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA index_list({quote(table)})')
+        # origin 'c' : CREATE INDEX ; les index implicites (pk, unique) suivent la table
+        indexes = [row[1] for row in cursor.fetchall() if row[3] == 'c']
+
+        cursor.execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(graveyard)}')
+        for index in indexes:
+            cursor.execute(f'DROP INDEX {quote(index)}')
+
+    create_table(model, using)
+
+
+def burn_all(burn_type: str, triggered_by_hash: str, reason: str, messages_only: bool = False) -> dict:
+    """Burn d'urgence par échange de tables
+
+    1. Crypto-shredding de toutes les graines de layer, committé avant le reste :
+       les messages sont illisibles même si la suite échoue.
+    2. Chaque table (messages et partitions ; sauf messages_only : layers,
+       graines, mappings, fragments) est renommée au cimetière et recréée
+       vide, en une transaction par base. Les graines détruites partent aussi :
+       leurs dates ne relient plus d'UUID de layer à une période d'activité.
+    3. Caches vidés, ligne EmergencyBurn écrite ; le comptage et la suppression
+       des tables du cimetière se font en arrière-plan (reap_burned_tables).
+    """
+    from .layer_keys import shred_all_layers
+    from .partitions import message_models
+    from .plaintext_cache import get_plaintext_cache
+    from .fragments import get_fragment_store
+    from .stats import get_system_stats
+
+    start_time = time.perf_counter()
+
+    shredded = shred_all_layers()
+    get_plaintext_cache().clear()
+
+    targets = [(model, router.db_for_write(model)) for model in message_models()]
+    if not messages_only:
+        targets += [
+            (TrueAnonymousLayer, router.db_for_write(TrueAnonymousLayer)),
+            (LayerKey, router.db_for_write(LayerKey)),
+            (LayerMapping, router.db_for_write(LayerMapping)),
+        ]
+        targets += [(DataFragment, alias) for alias in dict.fromkeys(get_fragment_store().databases)]
+
+    burn_id = uuid.uuid4()
+    aliases = [alias for _, alias in targets] + [router.db_for_write(LayerKey)]
+
+    with ExitStack() as stack:
+        for alias in dict.fromkeys(aliases):
+            stack.enter_context(transaction.atomic(using=alias))
+
+        for model, alias in targets:
+            _swap_out(model, _graveyard_table(burn_id, model._meta.db_table), alias)
+
+        if messages_only:
+            # Plus rien à purger : le LayerPurger ne rescannera pas les messages
+            LayerKey.objects.filter(shredded_at__isnull=False, purged_at__isnull=True).update(purged_at=timezone.now())
+
+    stats = get_system_stats()
+    stats.set('messages', 0)
+    if not messages_only:
+        stats.set('layers', 0)
+
+    # Nombre d'objets ajouté par reap_burned_tables au fil des suppressions
+    EmergencyBurn.objects.create(
+        burn_id=burn_id,
+        burn_type=burn_type,
+        objects_destroyed_count=0,
+        triggered_by_hash=triggered_by_hash,
+        reason=reason
+    )
+
+    threading.Thread(target=_reap_in_background, name='lain-burn-reaper', daemon=True).start()
+
+    elapsed = time.perf_counter() - start_time
+    logger.critical(f"EMERGENCY BURN: {len(targets)} tables swapped out in {elapsed * 1000:.1f} ms")
+
+    return {
+        'burn_id': str(burn_id),
+        'tables': len(targets),
+        'shredded_keys': shredded,
+        'seconds': round(elapsed, 3),
+    }
+
+
+def _reap_table(alias: str, table: str):
+    """Compte puis supprime une table du cimetière ; None si un autre processus l'a déjà fait"""
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+
+    try:
+        with transaction.atomic(using=alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {quote(table)}')
+                count = cursor.fetchone()[0]
+                cursor.execute(f'DROP TABLE {quote(table)}')
+    except OperationalError:
+        return None
+
+    return count
+
+
+def reap_burned_tables() -> int:
+    """Supprime les tables laissées par burn_all (reprise possible après redémarrage)"""
+    destroyed = 0
+
+    with _reap_lock:
+        try:
+            for alias in connections:
+                for table in connections[alias].introspection.table_names():
+                    if not table.startswith(GRAVEYARD_PREFIX):
+                        continue
+
+                    count = _reap_table(alias, table)
+                    if count is None:
+                        continue
+
+                    burn_hex = table[len(GRAVEYARD_PREFIX):].split('_', 1)[0]
+                    EmergencyBurn.objects.filter(pk=uuid.UUID(burn_hex)).update(
+                        objects_destroyed_count=F('objects_destroyed_count') + count
+                    )
+                    destroyed += count
+        except Exception as e:
+            # Les tables restantes seront reprises au prochain passage d'expiration
+            logger.error(f"Burned table reaping failed: {e}")
+
+    if destroyed:
+        logger.info(f"Reaped {destroyed} burned objects")
+    return destroyed
+
+
+def _reap_in_background():
+    try:
+        reap_burned_tables()
+    finally:
+        connections.close_all()
@@ -0,0 +1,166 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from django.db import OperationalError, connections, transaction
+
+
+BENCH_TABLE = 'lain_write_benchmark'
+
+
+@contextmanager
+def scratch_databases(profiles: dict):
+    """Alias temporaires {label: réglages}, chacun sur un fichier SQLite neuf
+
+    Le benchmark crée et supprime BENCH_TABLE : il ne touche jamais les bases réelles.
+    """
+    directory = tempfile.mkdtemp(prefix='lain_dbbench_')
+    aliases = []
+    try:
+        for label, settings_dict in profiles.items():
+            alias = f'lain_bench_{label}'
+            connections.settings[alias] = {
+                **settings_dict,
+                'NAME': os.path.join(directory, f'{label}.sqlite3'),
+            }
+            aliases.append(alias)
+        yield aliases
+    finally:
+        for alias in aliases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _prepare(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {BENCH_TABLE} '
+            '(id INTEGER PRIMARY KEY AUTOINCREMENT, worker INTEGER, payload BLOB, created_at REAL)'
+        )
+
+
+def _cleanup(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {BENCH_TABLE}')
+    connections[alias].close()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _writer(alias, worker, writes, payload_size, latencies, errors, read_before_write):
+    try:
+        for _ in range(writes):
+            payload = os.urandom(payload_size)
+            start_time = time.perf_counter()
+            try:
+                # Une écriture = une transaction courte, comme une vue ou database_sync_to_async
+                with transaction.atomic(using=alias):
+                    with connections[alias].cursor() as cursor:
+                        if read_before_write:
+                            # Lecture puis écriture (get_or_create, exists() puis create...)
+                            cursor.execute(f'SELECT COUNT(*) FROM {BENCH_TABLE} WHERE worker = %s', [worker])
+                        cursor.execute(
+                            f'INSERT INTO {BENCH_TABLE} (worker, payload, created_at) VALUES (%s, %s, %s)',
+                            [worker, payload, time.time()]
+                        )
+                latencies.append(time.perf_counter() - start_time)
+            except OperationalError:
+                errors.append(worker)
+    finally:
+        connections[alias].close()
+
+
+def benchmark_concurrent_writes(aliases, threads: int = 8, writes: int = 200, payload_size: int = 256,
+                                read_before_write: bool = False) -> dict:
+    """Écritures concurrentes, le thread i écrivant dans aliases[i % len(aliases)]
+
+    aliases=['default'] reproduit une base unique ; ['default', 'anonymous_mapping']
+    répartit la charge entre les deux fichiers SQLite (et leurs deux verrous).
+    """
+    aliases = list(aliases)
+    for alias in dict.fromkeys(aliases):
+        _prepare(alias)
+
+    latencies = []
+    errors = []
+    workers = [
+        threading.Thread(
+            target=_writer,
+            args=(aliases[i % len(aliases)], i, writes, payload_size, latencies, errors, read_before_write)
+        )
+        for i in range(threads)
+    ]
+
+    start_time = time.perf_counter()
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start_time
+    finally:
+        for alias in dict.fromkeys(aliases):
+            _cleanup(alias)
+
+    return {
+        'databases': list(dict.fromkeys(aliases)),
+        'engines': sorted({connections[alias].settings_dict['ENGINE'] for alias in aliases}),
+        'threads': threads,
+        'writes': len(latencies),
+        'locked_errors': len(errors),
+        'writes_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+def benchmark_database_split(threads: int = 8, writes: int = 200, payload_size: int = 256) -> dict:
+    """Base unique contre default + anonymous_mapping, sur des copies vides des deux profils"""
+    profiles = {alias: connections.settings[alias] for alias in ('default', 'anonymous_mapping')}
+    params = {'threads': threads, 'writes': writes, 'payload_size': payload_size}
+
+    with scratch_databases(profiles) as aliases:
+        single = benchmark_concurrent_writes(aliases[:1], **params)
+        split = benchmark_concurrent_writes(aliases, **params)
+
+    return {
+        'single_database': single,
+        'split_databases': split,
+        'throughput_gain': round(split['writes_per_sec'] / max(single['writes_per_sec'], 1e-9), 2),
+    }
+
+
+def compare_engine_profiles(threads: int = 8, writes: int = 200, payload_size: int = 256) -> dict:
+    """Même charge lecture+écriture sur SQLite par défaut et sur le profil réglé
+
+    Chaque moteur écrit dans un fichier neuf : journal_mode=WAL est persistant
+    et fausserait une comparaison sur la même base.
+    """
+    engines = {
+        'stock': 'django.db.backends.sqlite3',
+        'tuned': 'lain_chat.sqlite_backend',
+    }
+    profiles = {label: {**connections.settings['default'], 'ENGINE': engine} for label, engine in engines.items()}
+    results = {}
+
+    with scratch_databases(profiles) as aliases:
+        for label, alias in zip(profiles, aliases):
+            results[label] = benchmark_concurrent_writes(
+                [alias], threads=threads, writes=writes,
+                payload_size=payload_size, read_before_write=True
+            )
+
+    results['throughput_gain'] = round(
+        results['tuned']['writes_per_sec'] / max(results['stock']['writes_per_sec'], 1e-9), 2
+    )
+    return results
@@ -3,97 +3,324 @@ import hashlib
 import secrets
 import time
 import base64
-from typing import Tuple, Optional
-from cryptography.fernet import Fernet
+import struct
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Iterable, List, Mapping, NamedTuple, Tuple, Optional
+from cryptography.fernet import Fernet, MultiFernet
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from django.conf import settings
 from django.core.cache import cache
 import logging
 
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus pour la rotation
+    fcntl = None
+
 
 logger = logging.getLogger('lain_encryption')
 
-class LayerEncryption:
+def _key_id(key: bytes) -> str:
+    """Identifiant court et non réversible d'une clé"""
+    return hashlib.sha256(key).hexdigest()[:8]
+
+
+# Enveloppe v2 : version (1 octet) | id de clé (4 octets) | nonce (12 octets) | AES-GCM
+ENVELOPE_V2 = 0x02
+ENVELOPE_V2_HEADER = struct.Struct('>B4s12s')
+
+# Enveloppe v3 : comme v2, avec l'UUID du layer (16 octets) dont la sous-clé a chiffré
+ENVELOPE_V3 = 0x03
+ENVELOPE_V3_HEADER = struct.Struct('>B4s16s12s')
+
+def _derive_aead_key(key: bytes) -> AESGCM:
+    """Clé AES-256-GCM dérivée (HKDF) d'une clé Fernet du trousseau"""
+    return AESGCM(HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'lain-envelope-v2',
+    ).derive(base64.urlsafe_b64decode(key)))
+
+
+class KeySnapshot(NamedTuple):
+    """État du trousseau à un instant donné, publié en une seule affectation
+
+    Un appel qui a lu le snapshot voit des clés, un MultiFernet et des index
+    cohérents entre eux, même si un rechargement a lieu pendant l'appel.
+    """
+    keys: tuple
+    multi_fernet: MultiFernet
+    aead_keys: Mapping
+    keys_by_id: Mapping
+    key_creation_date: float
+    loaded_at: float
+    load_duration: float
     
+    @property
+    def master_key(self) -> bytes:
+        return self.keys[0]
     
-    def __init__(self):
-        self.master_key = self._get_or_create_master_key()
-        self.fernet = Fernet(self.master_key)
-        self.key_creation_date = self._get_key_creation_date()
-        
-        # Vérifier si rotation nécessaire (tous les 7 jours)
-        if self._should_rotate_key():
-            self._rotate_master_key()
+    @property
+    def current_key_id(self) -> bytes:
+        return bytes.fromhex(_key_id(self.keys[0]))
+
+
+class KeyRing:
+    """Trousseau de clés du processus
+
+    Chargé une seule fois, puis rafraîchi par un thread qui surveille les
+    mtimes de .lain_keys. La clé courante chiffre, les anciennes clés
+    (master.key.backup.*) restent utilisables en déchiffrement via MultiFernet.
+
+    Le rechargement est en lecture seule : une clé illisible lève une erreur
+    et le snapshot en place reste utilisé, jamais la clé n'est régénérée.
+    Seules la création initiale et la rotation écrivent, sous verrou
+    inter-processus (fcntl), par fichier temporaire puis os.replace().
+    """
+    
+    ROTATION_INTERVAL = 7 * 24 * 3600  # Rotation tous les 7 jours
+    BACKUP_PREFIX = 'master.key.backup.'
+    LOCK_FILE = 'keys.lock'
+    TEMP_PREFIX = '.tmp-'
+    
+    def __init__(self, keys_dir: str = None, poll_interval: float = 30):
+        keys_dir = keys_dir or getattr(settings, 'ENCRYPTION_CONFIG', {}).get('KEYS_DIR')
+        self.keys_dir = os.fspath(keys_dir or os.path.join(settings.BASE_DIR, '.lain_keys'))
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self._snapshot = None
+        
+        self.refresh_count = 0
+        self.refresh_errors = 0
+        
+        self.load()
     
     def _get_master_key_path(self) -> str:
         """Chemin sécurisé pour la clé maître"""
-        keys_dir = os.path.join(settings.BASE_DIR, '.lain_keys')
-        
+        if not os.path.exists(self.keys_dir):
+            os.makedirs(self.keys_dir, mode=0o700)  
         
-        if not os.path.exists(keys_dir):
-            os.makedirs(keys_dir, mode=0o700)  
-        
-        return os.path.join(keys_dir, 'master.key')
+        return os.path.join(self.keys_dir, 'master.key')
     
-    def _get_or_create_master_key(self) -> bytes:
-        """Génère ou récupère la clé maître AES-256"""
-        key_path = self._get_master_key_path()
-        
-        try:
-            # Essayer de charger la clé existante
-            if os.path.exists(key_path):
-                with open(key_path, 'rb') as f:
-                    key_data = f.read()
-                
-                # Vérifier que c'est une clé Fernet valide
-                test_fernet = Fernet(key_data)
-                # Test de chiffrement/déchiffrement
-                test_data = b"test_integrity"
-                encrypted = test_fernet.encrypt(test_data)
-                decrypted = test_fernet.decrypt(encrypted)
-                
-                if decrypted == test_data:
-                    logger.info("Master key loaded successfully")
-                    return key_data
-                else:
-                    raise ValueError("Key integrity check failed")
+    def load(self):
+        """Charge (ou recharge) toutes les clés depuis le disque"""
+        with self._lock:
+            start_time = time.perf_counter()
+            
+            if self._needs_new_key():
+                self._create_or_rotate()
+            
+            # Signature prise avant la lecture : une rotation concurrente sera revue au prochain tour
+            signature = self._directory_signature()
+            master_key = self._read_master_key()
+            key_creation_date = self._get_key_creation_date()
+            
+            keys = tuple([master_key] + [key for key in self._load_backup_keys() if key != master_key])
+            
+            self._snapshot = KeySnapshot(
+                keys=keys,
+                multi_fernet=MultiFernet([Fernet(key) for key in keys]),
+                aead_keys=MappingProxyType({bytes.fromhex(_key_id(key)): _derive_aead_key(key) for key in keys}),
+                keys_by_id=MappingProxyType({bytes.fromhex(_key_id(key)): key for key in keys}),
+                key_creation_date=key_creation_date,
+                loaded_at=time.time(),
+                load_duration=time.perf_counter() - start_time,
+            )
+            self._signature = signature
             
-        except Exception as e:
-            logger.warning(f"Could not load existing key: {e}")
-        
-        # Générer nouvelle clé 
-        return self._generate_new_master_key()
+            logger.info(f"Key ring loaded ({len(keys)} keys, current: {_key_id(master_key)})")
+    
+    @property
+    def snapshot(self) -> KeySnapshot:
+        return self._snapshot
+    
+    @property
+    def keys(self) -> tuple:
+        return self._snapshot.keys
+    
+    @property
+    def multi_fernet(self) -> MultiFernet:
+        return self._snapshot.multi_fernet
+    
+    @property
+    def aead_keys(self) -> Mapping:
+        return self._snapshot.aead_keys
+    
+    @property
+    def keys_by_id(self) -> Mapping:
+        return self._snapshot.keys_by_id
     
-    def _generate_new_master_key(self) -> bytes:
-        """Génère une nouvelle clé maître"""
-        logger.info("Generating new master key")
+    @property
+    def key_creation_date(self) -> float:
+        return self._snapshot.key_creation_date
+    
+    @property
+    def master_key(self) -> bytes:
+        return self._snapshot.master_key
+    
+    @property
+    def current_key_id(self) -> bytes:
+        return self._snapshot.current_key_id
+    
+    def _directory_signature(self):
+        try:
+            entries = os.scandir(self.keys_dir)
+        except OSError:
+            return None
+        
+        with entries:
+            return tuple(sorted(
+                (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in entries
+                if entry.is_file() and entry.name != self.LOCK_FILE and not entry.name.startswith(self.TEMP_PREFIX)
+            ))
+    
+    def _load_backup_keys(self) -> list:
+        """Anciennes clés, de la plus récente à la plus ancienne"""
+        backups = []
+        
+        for name in os.listdir(self.keys_dir):
+            if not name.startswith(self.BACKUP_PREFIX):
+                continue
+            
+            try:
+                rotated_at = int(name[len(self.BACKUP_PREFIX):])
+                with open(os.path.join(self.keys_dir, name), 'rb') as f:
+                    key_data = f.read().strip()
+                Fernet(key_data)
+                backups.append((rotated_at, key_data))
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable backup key {name}: {e}")
+        
+        backups.sort(reverse=True)
+        return [key_data for _, key_data in backups]
+    
+    def start_watching(self):
+        """Démarre la surveillance des fichiers de clés (une fois par processus)"""
+        if self._watcher is not None or not self.poll_interval:
+            return
         
-        # Générer clé Fernet 
-        new_key = Fernet.generate_key()
+        self._watcher = threading.Thread(target=self._watch, name='lain-key-ring', daemon=True)
+        self._watcher.start()
+    
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+    
+    def _watch(self):
+        while not self._stop_watching.wait(self.poll_interval):
+            try:
+                expired = (time.time() - self.key_creation_date) > self.ROTATION_INTERVAL
+                if expired or self._directory_signature() != self._signature:
+                    self.load()
+                    self.refresh_count += 1
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.error(f"Key ring refresh failed: {e}")
+    
+    def status(self) -> dict:
+        """Métriques du trousseau (aucune donnée secrète)"""
+        snapshot = self._snapshot
+        return {
+            'current_key_id': _key_id(snapshot.master_key),
+            'key_count': len(snapshot.keys),
+            'key_age_hours': round((time.time() - snapshot.key_creation_date) / 3600, 2),
+            'loaded_at': int(snapshot.loaded_at),
+            'load_ms': round(snapshot.load_duration * 1000, 3),
+            'refresh_count': self.refresh_count,
+            'refresh_errors': self.refresh_errors,
+            'watching': self._watcher is not None,
+        }
+    
+    def rotate(self):
+        """Rotation immédiate, sans attendre ROTATION_INTERVAL (l'ancienne clé reste en déchiffrement)"""
+        with self._interprocess_lock():
+            self._rotate_master_key()
+        self.load()
+    
+    def _read_master_key(self) -> bytes:
+        """Lit et vérifie la clé maître ; lève une erreur plutôt que d'y toucher"""
+        with open(self._get_master_key_path(), 'rb') as f:
+            key_data = f.read()
+        
+        # Vérifier que c'est une clé Fernet valide
+        test_fernet = Fernet(key_data)
+        test_data = b"test_integrity"
+        if test_fernet.decrypt(test_fernet.encrypt(test_data)) != test_data:
+            raise ValueError("Key integrity check failed")
+        
+        return key_data
+    
+    def _needs_new_key(self) -> bool:
+        if not os.path.exists(self._get_master_key_path()):
+            return True
+        return (time.time() - self._get_key_creation_date()) > self.ROTATION_INTERVAL
+    
+    @contextmanager
+    def _interprocess_lock(self):
+        """Sérialise création et rotation entre les workers qui partagent keys_dir"""
+        if fcntl is None:  # Windows : un seul processus attendu
+            yield
+            return
+        
+        fd = os.open(os.path.join(self.keys_dir, self.LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # Libère aussi le verrou
+    
+    def _create_or_rotate(self):
+        """Crée la clé maître, ou la fait tourner si elle a expiré (sous verrou)"""
         key_path = self._get_master_key_path()
         
+        with self._interprocess_lock():
+            # Revérifié sous verrou : un autre worker a pu le faire entre-temps
+            if not os.path.exists(key_path):
+                logger.info("Generating new master key")
+                self._write_master_key(Fernet.generate_key())
+            elif (time.time() - self._get_key_creation_date()) > self.ROTATION_INTERVAL:
+                self._rotate_master_key()
+    
+    def _write_file(self, path: str, data: bytes):
+        """Écrit le fichier complet puis le met en place d'un coup (jamais de fichier à moitié écrit)"""
+        fd, temp_path = tempfile.mkstemp(prefix=self.TEMP_PREFIX, dir=self.keys_dir)  # Mode 0600
         try:
-            
-            with open(key_path, 'wb') as f:
-                f.write(new_key)
-            
-            
-            os.chmod(key_path, 0o600)
-            
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+    
+    def _write_master_key(self, key: bytes):
+        try:
+            self._write_file(self._get_master_key_path(), key)
             # Enregistrer la date de création
-            self._save_key_creation_date()
-            
+            self._write_file(os.path.join(self.keys_dir, 'key_date.txt'), str(time.time()).encode())
             logger.info("New master key generated and saved")
-            return new_key
-            
         except Exception as e:
             logger.error(f"Failed to save master key: {e}")
             raise
     
     def _get_key_creation_date(self) -> float:
         """Récupère la date de création de la clé"""
-        date_file = os.path.join(os.path.dirname(self._get_master_key_path()), 'key_date.txt')
+        date_file = os.path.join(self.keys_dir, 'key_date.txt')
         
         try:
             if os.path.exists(date_file):
@@ -104,50 +331,88 @@ class LayerEncryption:
         
         return time.time()  
     
-    def _save_key_creation_date(self):
-        date_file = os.path.join(os.path.dirname(self._get_master_key_path()), 'key_date.txt')
+    def _rotate_master_key(self):
+        """Effectue la rotation de la clé maître (l'ancienne reste dans le trousseau)"""
+        logger.info("Starting master key rotation")
         
-        try:
-            with open(date_file, 'w') as f:
-                f.write(str(time.time()))
-            os.chmod(date_file, 0o600)
-        except Exception as e:
-            logger.warning(f"Could not save key creation date: {e}")
+        # Une clé illisible n'est jamais remplacée : l'erreur remonte
+        old_key = self._read_master_key()
+        
+        # Sauvegarde l'ancienne clé sous un nom encore libre, avant de la remplacer
+        rotated_at = int(time.time())
+        while os.path.exists(os.path.join(self.keys_dir, f'{self.BACKUP_PREFIX}{rotated_at}')):
+            rotated_at += 1
+        self._write_file(os.path.join(self.keys_dir, f'{self.BACKUP_PREFIX}{rotated_at}'), old_key)
+        
+        self._write_master_key(Fernet.generate_key())
+        logger.info("Master key rotation completed")
+
+
+_key_ring = None
+_key_ring_lock = threading.Lock()
+
+def get_key_ring() -> KeyRing:
+    """Récupère le trousseau du processus (chargé au premier appel)"""
+    global _key_ring
+    
+    if _key_ring is None:
+        with _key_ring_lock:
+            if _key_ring is None:
+                config = getattr(settings, 'ENCRYPTION_CONFIG', {})
+                _key_ring = KeyRing(poll_interval=config.get('KEY_RING_POLL_SECONDS', 30))
+                _key_ring.start_watching()
+    
+    return _key_ring
+
+
+class LayerEncryption:
+    
     
-    def _should_rotate_key(self) -> bool:
+    def __init__(self, key_ring: KeyRing = None, envelope_version: int = None):
+        # Aucun accès disque ici : les clés viennent du trousseau du processus
+        self.key_ring = key_ring or get_key_ring()
         
-        # Rotation tous les 7 jours
-        rotation_interval = 7 * 24 * 3600  
-        return (time.time() - self.key_creation_date) > rotation_interval
+        if envelope_version is None:
+            envelope_version = getattr(settings, 'ENCRYPTION_CONFIG', {}).get('ENVELOPE_VERSION', 3)
+        self.envelope_version = envelope_version
     
-    def _rotate_master_key(self):
-        """Effectue la rotation de la clé maître"""
-        logger.info("Starting master key rotation")
-        old_key_path = self._get_master_key_path()
-        backup_path = f"{old_key_path}.backup.{int(time.time())}"
+    @property
+    def master_key(self) -> bytes:
+        return self.key_ring.master_key
+    
+    @property
+    def fernet(self) -> MultiFernet:
+        return self.key_ring.multi_fernet
+    
+    @property
+    def key_creation_date(self) -> float:
+        return self.key_ring.key_creation_date
+    
+    def resolve_layer_aead(self, layer_id):
+        """Sous-clé v3 du layer à passer à encrypt_message ; None hors v3 ou sans layer vivant
+
+        Accès base : à appeler dans le chemin d'écriture (save(), database_sync_to_async).
+        """
+        if self.envelope_version != ENVELOPE_V3:
+            return None
         
-        try:
-            # Sauvegarde l'ancienne clé
-            if os.path.exists(old_key_path):
-                os.rename(old_key_path, backup_path)
-                os.chmod(backup_path, 0o600)
-            
-            # Génére nouvelle clé
-            self.master_key = self._generate_new_master_key()
-            self.fernet = Fernet(self.master_key)
-            
-            logger.info("Master key rotation completed")
-            
-        except Exception as e:
-            logger.error(f"Key rotation failed: {e}")
-            # Restaure l'ancienne clé en cas d'erreur
-            if os.path.exists(backup_path):
-                os.rename(backup_path, old_key_path)
-            raise
+        from .layer_keys import resolve_layer_aead
+        return resolve_layer_aead(self.key_ring, layer_id)
     
-    def encrypt_message(self, message: str, layer_id: str = None, room_name: str = None) -> Tuple[bytes, str, bytes]:
+    def encrypt_message(self, message: str, layer_id: str = None, room_name: str = None,
+                        layer_aead=None) -> Tuple[bytes, str, bytes]:
+        """Chiffre en mémoire uniquement : aucune lecture disque ni base (sûr depuis du code async)"""
         
         try:
+            if self.envelope_version == ENVELOPE_V3:
+                # Sous-clé du layer résolue par l'appelant ; sans elle, enveloppe v2
+                if layer_aead is not None:
+                    return self._encrypt_v3(message, layer_aead)
+                return self._encrypt_v2(message)
+            
+            if self.envelope_version == ENVELOPE_V2:
+                return self._encrypt_v2(message)
+            
             # Génére sel cryptographique unique
             salt = secrets.token_bytes(32)  
             
@@ -178,9 +443,36 @@ class LayerEncryption:
             logger.error(f"Encryption failed: {e}")
             raise ValueError(f"Message encryption failed: {str(e)}")
     
+    def _encrypt_v2(self, message: str) -> Tuple[bytes, str, None]:
+        """Enveloppe binaire v2 : l'en-tête est authentifié comme données associées"""
+        key_ring = self.key_ring.snapshot  # Clé courante et AEAD issus du même chargement
+        key_id = key_ring.current_key_id
+        nonce = secrets.token_bytes(12)
+        
+        header = ENVELOPE_V2_HEADER.pack(ENVELOPE_V2, key_id, nonce)
+        ciphertext = key_ring.aead_keys[key_id].encrypt(nonce, message.encode('utf-8'), header)
+        
+        return header + ciphertext, nonce.hex(), None
+    
+    def _encrypt_v3(self, message: str, layer_aead) -> Tuple[bytes, str, None]:
+        """Enveloppe v3 : sous-clé du layer, détruite avec lui (crypto-shredding)"""
+        nonce = secrets.token_bytes(12)
+        
+        header = ENVELOPE_V3_HEADER.pack(ENVELOPE_V3, layer_aead.key_id, layer_aead.layer_uuid.bytes, nonce)
+        return header + layer_aead.aead.encrypt(nonce, message.encode('utf-8'), header), nonce.hex(), None
+    
     def decrypt_message(self, encrypted_data: bytes, nonce: str, salt: bytes = None) -> str:
        
         try:
+            encrypted_data = bytes(encrypted_data)
+            
+            # Les tokens Fernet (v1) commencent par « g » (base64 de 0x80)
+            if encrypted_data[:1] == bytes((ENVELOPE_V2,)):
+                return self._decrypt_v2(encrypted_data, nonce)
+            if encrypted_data[:1] == bytes((ENVELOPE_V3,)):
+                return self._decrypt_v3(encrypted_data, nonce)
+            if encrypted_data[:1] != b'g':
+                raise ValueError(f"Unknown envelope version {encrypted_data[:1].hex() or '(empty)'}")
             
             decrypted_data = self.fernet.decrypt(encrypted_data)
             salted_payload = decrypted_data.decode('utf-8')
@@ -211,25 +503,89 @@ class LayerEncryption:
             logger.error(f"Decryption failed: {e}")
             raise ValueError(f"Message decryption failed: {str(e)}")
     
+    def _decrypt_v2(self, encrypted_data: bytes, nonce: str = None) -> str:
+        header_size = ENVELOPE_V2_HEADER.size
+        if len(encrypted_data) < header_size + 16:
+            raise ValueError("Truncated v2 envelope")
+        
+        _, key_id, envelope_nonce = ENVELOPE_V2_HEADER.unpack_from(encrypted_data)
+        aead = self.key_ring.aead_keys.get(key_id)
+        if aead is None:
+            raise ValueError(f"Unknown key id {key_id.hex()}")
+        
+        if nonce and envelope_nonce.hex() != nonce:
+            logger.warning("Nonce mismatch during decryption")
+        
+        plaintext = aead.decrypt(envelope_nonce, encrypted_data[header_size:], encrypted_data[:header_size])
+        return plaintext.decode('utf-8')
+    
+    def _decrypt_v3(self, encrypted_data: bytes, nonce: str = None) -> str:
+        from .layer_keys import get_layer_key_cache
+        
+        header_size = ENVELOPE_V3_HEADER.size
+        if len(encrypted_data) < header_size + 16:
+            raise ValueError("Truncated v3 envelope")
+        
+        _, key_id, layer_bytes, envelope_nonce = ENVELOPE_V3_HEADER.unpack_from(encrypted_data)
+        aead = get_layer_key_cache().get_aead(self.key_ring, key_id, uuid.UUID(bytes=layer_bytes))
+        
+        if nonce and envelope_nonce.hex() != nonce:
+            logger.warning("Nonce mismatch during decryption")
+        
+        plaintext = aead.decrypt(envelope_nonce, encrypted_data[header_size:], encrypted_data[:header_size])
+        return plaintext.decode('utf-8')
+    
+    def rotate_token(self, encrypted_data: bytes) -> bytes:
+        """Rechiffre un message existant avec la clé courante du trousseau (même format)"""
+        encrypted_data = bytes(encrypted_data)
+        
+        if encrypted_data[:1] == bytes((ENVELOPE_V3,)):
+            return self._rotate_v3(encrypted_data)
+        
+        if encrypted_data[:1] != bytes((ENVELOPE_V2,)):
+            return self.fernet.rotate(encrypted_data)
+        
+        key_ring = self.key_ring.snapshot  # Clé courante et AEAD issus du même chargement
+        key_id = key_ring.current_key_id
+        _, old_key_id, nonce = ENVELOPE_V2_HEADER.unpack_from(encrypted_data)
+        if old_key_id == key_id:
+            return encrypted_data
+        
+        # Le nonce est conservé (il reste unique sous la nouvelle clé) : encryption_nonce reste valide
+        message = self._decrypt_v2(encrypted_data)
+        header = ENVELOPE_V2_HEADER.pack(ENVELOPE_V2, key_id, nonce)
+        return header + key_ring.aead_keys[key_id].encrypt(nonce, message.encode('utf-8'), header)
+    
+    def _rotate_v3(self, encrypted_data: bytes) -> bytes:
+        from .layer_keys import get_layer_key_cache
+        
+        key_id = self.key_ring.current_key_id
+        _, old_key_id, layer_bytes, nonce = ENVELOPE_V3_HEADER.unpack_from(encrypted_data)
+        if old_key_id == key_id:
+            return encrypted_data
+        
+        message = self._decrypt_v3(encrypted_data)
+        layer_uuid = uuid.UUID(bytes=layer_bytes)
+        aead = get_layer_key_cache().get_aead(self.key_ring, key_id, layer_uuid)
+        header = ENVELOPE_V3_HEADER.pack(ENVELOPE_V3, key_id, layer_bytes, nonce)
+        return header + aead.encrypt(nonce, message.encode('utf-8'), header)
+    
     def generate_secure_hash(self, data: str, salt: bytes = None, iterations: int = 100000) -> Tuple[str, bytes]:
         
+        from security.kdf_pool import get_kdf_pool, pbkdf2_sha256, KDFPoolSaturated
+        
         if salt is None:
             salt = secrets.token_bytes(32)  # 256 bits de sel
         
         try:
-            # PBKDF2 avec SHA-256
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,  # 256 bits de sortie
-                salt=salt,
-                iterations=iterations,
-            )
-            
-            key = kdf.derive(data.encode('utf-8'))
+            # PBKDF2 avec SHA-256, 256 bits de sortie, calculé dans le pool KDF
+            key = get_kdf_pool().run(pbkdf2_sha256, data.encode('utf-8'), salt, iterations, 32)
             hash_b64 = base64.urlsafe_b64encode(key).decode('utf-8')
             
             return hash_b64, salt
             
+        except KDFPoolSaturated:
+            raise
         except Exception as e:
             logger.error(f"Hash generation failed: {e}")
             raise ValueError(f"Hash generation failed: {str(e)}")
@@ -293,14 +649,92 @@ def get_encryption_instance() -> LayerEncryption:
     return _encryption_instance
 
 
-def encrypt_message(message: str, layer_id: str = None, room_name: str = None) -> Tuple[bytes, str, bytes]:
+def encrypt_message(message: str, layer_id: str = None, room_name: str = None,
+                    layer_aead=None) -> Tuple[bytes, str, bytes]:
     """Fonction de convenance pour chiffrer un message"""
-    return get_encryption_instance().encrypt_message(message, layer_id, room_name)
+    return get_encryption_instance().encrypt_message(message, layer_id, room_name, layer_aead)
 
 def decrypt_message(encrypted_data: bytes, nonce: str, salt: bytes = None) -> str:
     """Fonction de convenance pour déchiffrer un message"""
     return get_encryption_instance().decrypt_message(encrypted_data, nonce, salt)
 
+class BatchResult(NamedTuple):
+    """Résultat d'un élément de lot : value, ou error si l'élément a échoué"""
+    value: object = None
+    error: Optional[str] = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+BATCH_INLINE_THRESHOLD = 64  # En dessous, le coût du pool dépasse le gain
+
+class BatchExecutor(ThreadPoolExecutor):
+    """Pool de threads des opérations par lot ; workers sert au découpage en tranches"""
+    
+    def __init__(self, workers: int):
+        super().__init__(max_workers=workers, thread_name_prefix='lain-crypto')
+        self.workers = workers
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+def _get_batch_executor() -> BatchExecutor:
+    """Pool de threads partagé par les opérations de chiffrement par lot"""
+    global _batch_executor
+    
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                config = getattr(settings, 'ENCRYPTION_CONFIG', {})
+                _batch_executor = BatchExecutor(config.get('BATCH_WORKERS') or os.cpu_count() or 4)
+    
+    return _batch_executor
+
+def _run_batch(func, items: list) -> List[BatchResult]:
+    def run_one(item):
+        try:
+            return BatchResult(func(item))
+        except Exception as e:
+            return BatchResult(error=str(e))
+    
+    if len(items) < BATCH_INLINE_THRESHOLD:
+        return [run_one(item) for item in items]
+    
+    # Découpage en tranches : une tâche par message coûterait plus cher que l'AES lui-même
+    executor = _get_batch_executor()
+    chunk_size = max(16, -(-len(items) // (executor.workers * 4)))
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    
+    results = []
+    for chunk_results in executor.map(lambda chunk: [run_one(item) for item in chunk], chunks):
+        results.extend(chunk_results)
+    return results
+
+def encrypt_many(messages: Iterable[str], layer_id: str = None, room_name: str = None,
+                 layer_aead=None) -> List[BatchResult]:
+    """Chiffre un lot de messages en parallèle ; value = (encrypted_data, nonce, salt), ordre conservé
+
+    Sans layer_aead, la sous-clé du layer est résolue une fois pour le lot (accès base).
+    """
+    encryptor = get_encryption_instance()
+    if layer_aead is None and layer_id is not None:
+        layer_aead = encryptor.resolve_layer_aead(layer_id)
+    return _run_batch(
+        lambda message: encryptor.encrypt_message(message, layer_id, room_name, layer_aead),
+        list(messages)
+    )
+
+def decrypt_many(items: Iterable[Tuple[bytes, str, bytes]]) -> List[BatchResult]:
+    """Déchiffre un lot de (encrypted_data, nonce, salt) en parallèle ; value = texte clair, ordre conservé"""
+    encryptor = get_encryption_instance()
+    return _run_batch(
+        lambda item: encryptor.decrypt_message(*item),
+        list(items)
+    )
+
 def generate_secure_session() -> str:
     """Fonction de convenance pour générer une session sécurisée"""
     return SecureSessionManager.generate_anonymous_session()
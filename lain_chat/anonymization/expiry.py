@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import threading
+import time
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TrueAnonymousLayer
+
+
+logger = logging.getLogger('lain_models')
+
+
+class ExpiryWorker:
+    """Suppression des messages et layers expirés par lots bornés de clés primaires
+
+    Chaque lot sélectionne au plus batch_size clés via l'index auto_destroy_at
+    puis supprime par clé primaire : le verrou d'écriture n'est tenu que le
+    temps d'un lot. La taille des lots et la pause entre lots s'adaptent à la
+    latence mesurée (AIMD) pour laisser passer les requêtes concurrentes.
+    """
+
+    def __init__(self, batch_size: int = 1000, min_batch: int = 100, max_batch: int = 5000,
+                 target_latency: float = 0.05, max_pause: float = 2.0, progress=None):
+        self.batch_size = batch_size
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.target_latency = target_latency
+        self.max_pause = max_pause
+        self.pause = 0.0
+        self.progress = progress
+
+    @classmethod
+    def from_settings(cls, **kwargs):
+        config = getattr(settings, 'EXPIRY_CONFIG', {})
+        options = {
+            'batch_size': config.get('BATCH_SIZE', 1000),
+            'target_latency': config.get('TARGET_LATENCY', 0.05),
+            'max_pause': config.get('MAX_PAUSE', 2.0),
+        }
+        options.update(kwargs)
+        return cls(**options)
+
+    def _adapt(self, latency: float):
+        """Lot plus petit et pause plus longue si la base ralentit, et inversement"""
+        if latency > self.target_latency:
+            self.batch_size = max(self.min_batch, self.batch_size // 2)
+            self.pause = min(self.max_pause, max(self.pause * 2, latency))
+        else:
+            self.batch_size = min(self.max_batch, self.batch_size + self.min_batch)
+            self.pause = self.pause / 2 if self.pause > 0.001 else 0.0
+
+    def _expired_pks(self, model, now):
+        return list(
+            model.objects.filter(auto_destroy_at__lt=now)
+            .order_by('auto_destroy_at')
+            .values_list('pk', flat=True)[:self.batch_size]
+        )
+
+    def _delete_layers(self, layer_ids) -> int:
+        from .layer_keys import shred_layer
+        from .stats import get_system_stats
+
+        # Tombstone : messages, mappings et layer sont supprimés par le LayerPurger
+        burned = TrueAnonymousLayer.objects.filter(pk__in=layer_ids).update(burned_at=timezone.now())
+        for layer_id in layer_ids:
+            shred_layer(layer_id)
+        get_system_stats().add('layers', -burned)
+        return burned
+
+    def _expire(self, model, delete_batch) -> int:
+        now = timezone.now()
+        total = 0
+
+        while True:
+            requested = self.batch_size
+            pks = self._expired_pks(model, now)
+            if not pks:
+                return total
+
+            start_time = time.perf_counter()
+            total += delete_batch(pks)
+            latency = time.perf_counter() - start_time
+
+            self._adapt(latency)
+            if self.progress:
+                self.progress(model.__name__, total, self.batch_size, latency)
+
+            if len(pks) < requested:
+                return total
+            if self.pause:
+                time.sleep(self.pause)
+
+    def expire_messages(self) -> int:
+        from .partitions import message_models
+
+        from .stats import get_system_stats
+
+        total = 0
+        for model in message_models(end=timezone.now()):
+            total += self._expire(model, lambda pks, model=model: model.objects.filter(pk__in=pks).delete()[0])
+        get_system_stats().add('messages', -total)
+        return total
+
+    def expire_layers(self) -> int:
+        # Équivalent SQL de TrueAnonymousLayer.is_expired() (NULL ne satisfait pas <)
+        return self._expire(TrueAnonymousLayer, self._delete_layers)
+
+    def run_once(self) -> dict:
+        """Un passage complet ; renvoie le nombre de lignes et le débit
+
+        Les messages des layers expirés sont supprimés par le LayerPurger, en
+        arrière-plan : ce passage ne fait que planifier leur purge.
+        """
+        from .burn import reap_burned_tables
+        from .layer_keys import get_layer_purger
+        from .partitions import drop_expired_partitions
+        from .plaintext_cache import get_plaintext_cache
+
+        start_time = time.perf_counter()
+        dropped = drop_expired_partitions()
+        messages = self.expire_messages()
+        layers = self.expire_layers()
+        get_layer_purger().resume_pending()  # Purges non abouties (redémarrage, échec)
+        purged = reap_burned_tables()
+        get_plaintext_cache().evict_expired()
+        elapsed = time.perf_counter() - start_time
+
+        rows = messages + layers + purged
+        if rows:
+            logger.info(f"Expiry pass removed {messages} messages, {layers} layers, {purged} burned rows")
+        if dropped:
+            logger.info(f"Expiry pass dropped {len(dropped)} message partitions")
+
+        return {
+            'messages': messages,
+            'layers': layers,
+            'burned_rows': purged,
+            'dropped_partitions': len(dropped),
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed, 1) if elapsed else 0.0,
+            'batch_size': self.batch_size,
+            'pause': round(self.pause, 3),
+        }
+
+
+_expiry_task = None
+_expiry_task_lock = threading.Lock()
+
+async def _expiry_loop(interval: float):
+    worker = ExpiryWorker.from_settings()
+    # database_sync_to_async ferme les connexions périmées avant et après chaque passage ;
+    # hors du thread partagé des consumers, qu'un long passage bloquerait
+    run_once = database_sync_to_async(worker.run_once, thread_sensitive=False)
+
+    while True:
+        try:
+            await run_once()
+        except Exception as e:
+            logger.error(f"Expiry pass failed: {e}")
+        await asyncio.sleep(interval)
+
+def ensure_expiry_task():
+    """Démarre la tâche d'expiration dans la boucle courante (une par processus, si activée)"""
+    global _expiry_task
+
+    config = getattr(settings, 'EXPIRY_CONFIG', {})
+    if not config.get('IN_PROCESS', False):
+        return None
+
+    with _expiry_task_lock:
+        if _expiry_task is None or _expiry_task.done():
+            _expiry_task = asyncio.get_running_loop().create_task(_expiry_loop(config.get('INTERVAL', 30)))
+
+    return _expiry_task
@@ -0,0 +1,193 @@
+import hashlib
+import heapq
+import logging
+import uuid
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+from django.conf import settings
+
+from .models import DataFragment
+
+
+logger = logging.getLogger('lain_models')
+
+
+class FragmentIntegrityError(ValueError):
+    """Fragment manquant, dupliqué ou altéré"""
+
+
+class FragmentManifest(NamedTuple):
+    """Résumé d'un blob fragmenté, à conserver pour vérifier la relecture"""
+    belongs_to_id: uuid.UUID
+    fragment_count: int
+    total_bytes: int
+    sha256: str
+
+
+class FragmentStore:
+    """Découpe de gros blobs chiffrés (exports, archives) en fragments DataFragment
+
+    L'écriture consomme la source en flux et insère par bulk_create, fragment i
+    dans databases[i % len(databases)]. La lecture fusionne les curseurs des
+    bases par fragment_index (heapq.merge) et vérifie chaque checksum au fil de
+    l'eau : le blob entier n'est jamais en mémoire.
+    """
+
+    def __init__(self, fragment_size: int = 64 * 1024, databases=None, batch_size: int = 32):
+        self.fragment_size = fragment_size
+        self.databases = list(databases or ['default'])
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'FRAGMENT_CONFIG', {})
+        return cls(
+            fragment_size=config.get('FRAGMENT_SIZE', 64 * 1024),
+            databases=config.get('DATABASES', ['default']),
+            batch_size=config.get('BATCH_SIZE', 32),
+        )
+
+    def _split(self, source) -> Iterator[bytes]:
+        """Découpe en fragments de taille fixe (le dernier peut être plus court)"""
+        size = self.fragment_size
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source)
+            for offset in range(0, len(view), size):
+                yield bytes(view[offset:offset + size])
+            return
+
+        if hasattr(source, 'read'):
+            while True:
+                fragment = source.read(size)
+                if not fragment:
+                    return
+                yield fragment
+
+        buffer = bytearray()
+        for chunk in source:
+            buffer += chunk
+            while len(buffer) >= size:
+                yield bytes(buffer[:size])
+                del buffer[:size]
+        if buffer:
+            yield bytes(buffer)
+
+    def write(self, source: Union[bytes, Iterable[bytes]], belongs_to_type: str,
+              belongs_to_id: uuid.UUID = None) -> FragmentManifest:
+        """Fragmente et stocke source (bytes, fichier binaire ou itérable de chunks)
+
+        Un belongs_to_id qui a déjà des fragments est refusé : on ne complète
+        ni n'écrase un blob existant.
+        """
+        if belongs_to_id is None:
+            belongs_to_id = uuid.uuid4()
+        elif self.exists(belongs_to_id):
+            raise FragmentIntegrityError(f"Blob {belongs_to_id} already has fragments")
+
+        pending = {database: [] for database in self.databases}
+        written = {database: [] for database in self.databases}  # fragment_id insérés par cet appel
+        digest = hashlib.sha256()
+        total_bytes = 0
+        count = 0
+
+        try:
+            for count, fragment in enumerate(self._split(source), start=1):
+                digest.update(fragment)
+                total_bytes += len(fragment)
+
+                database = self.databases[(count - 1) % len(self.databases)]
+                pending[database].append(DataFragment(
+                    fragment_index=count - 1,
+                    encrypted_data=fragment,
+                    checksum=hashlib.sha256(fragment).hexdigest(),
+                    belongs_to_type=belongs_to_type,
+                    belongs_to_id=belongs_to_id,
+                ))
+
+                if len(pending[database]) >= self.batch_size:
+                    self._insert(database, pending[database], written)
+                    pending[database] = []
+
+            for database, fragments in pending.items():
+                if fragments:
+                    self._insert(database, fragments, written)
+
+        except Exception:
+            # Pas de transaction entre bases : on retire les fragments écrits par cet appel, et eux seuls
+            for database, fragment_ids in written.items():
+                if fragment_ids:
+                    DataFragment.objects.using(database).filter(pk__in=fragment_ids).delete()
+            raise
+
+        logger.info(f"Stored {count} fragments ({total_bytes} bytes) for {belongs_to_type}")
+        return FragmentManifest(belongs_to_id, count, total_bytes, digest.hexdigest())
+
+    @staticmethod
+    def _insert(database, fragments, written):
+        DataFragment.objects.using(database).bulk_create(fragments)
+        written[database].extend(fragment.pk for fragment in fragments)
+
+    def exists(self, belongs_to_id: uuid.UUID) -> bool:
+        return any(
+            DataFragment.objects.using(database).filter(belongs_to_id=belongs_to_id).exists()
+            for database in self.databases
+        )
+
+    def _rows(self, database, belongs_to_id):
+        return (
+            DataFragment.objects.using(database)
+            .filter(belongs_to_id=belongs_to_id)
+            .order_by('fragment_index')
+            .values_list('fragment_index', 'encrypted_data', 'checksum')
+            .iterator(chunk_size=self.batch_size)
+        )
+
+    def read(self, belongs_to_id: uuid.UUID, manifest: Optional[FragmentManifest] = None) -> Iterator[bytes]:
+        """Relit les fragments dans l'ordre en vérifiant checksums et continuité"""
+        rows = heapq.merge(
+            *(self._rows(database, belongs_to_id) for database in self.databases),
+            key=lambda row: row[0]
+        )
+        digest = hashlib.sha256()
+        expected_index = 0
+
+        for fragment_index, data, checksum in rows:
+            if fragment_index != expected_index:
+                raise FragmentIntegrityError(
+                    f"Fragment {expected_index} of {belongs_to_id} is missing or duplicated"
+                )
+
+            data = bytes(data)
+            if hashlib.sha256(data).hexdigest() != checksum:
+                raise FragmentIntegrityError(f"Fragment {fragment_index} of {belongs_to_id} is corrupted")
+
+            digest.update(data)
+            expected_index += 1
+            yield data
+
+        if manifest is not None:
+            # Seul le manifeste permet de détecter des fragments manquants en fin de blob
+            if expected_index != manifest.fragment_count or digest.hexdigest() != manifest.sha256:
+                raise FragmentIntegrityError(f"Blob {belongs_to_id} does not match its manifest")
+
+    def read_all(self, belongs_to_id: uuid.UUID, manifest: Optional[FragmentManifest] = None) -> bytes:
+        """Commodité pour les petits blobs"""
+        return b''.join(self.read(belongs_to_id, manifest))
+
+    def delete(self, belongs_to_id: uuid.UUID) -> int:
+        return sum(
+            DataFragment.objects.using(database).filter(belongs_to_id=belongs_to_id).delete()[0]
+            for database in self.databases
+        )
+
+
+_fragment_store = None
+
+def get_fragment_store() -> FragmentStore:
+    """Récupère le FragmentStore configuré (FRAGMENT_CONFIG)"""
+    global _fragment_store
+
+    if _fragment_store is None:
+        _fragment_store = FragmentStore.from_settings()
+
+    return _fragment_store
@@ -0,0 +1,354 @@
+import base64
+import logging
+import queue
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from django.conf import settings
+from django.db import OperationalError, connection, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+logger = logging.getLogger('lain_encryption')
+
+
+class LayerKeyShredded(ValueError):
+    """La graine du layer a été détruite : ses messages sont illisibles"""
+
+
+class LayerKeyMissing(LayerKeyShredded):
+    """Aucune graine n'existe pour ce layer"""
+
+
+class LayerAEAD(NamedTuple):
+    """Sous-clé résolue d'un layer, à passer à encrypt_message (key_id : clé maître d'origine)"""
+    layer_uuid: uuid.UUID
+    key_id: bytes
+    aead: AESGCM
+
+
+def as_layer_uuid(layer_id) -> uuid.UUID:
+    """UUID du layer, ou None si l'identifiant n'en est pas un (hash de session, 'anonymous')"""
+    if isinstance(layer_id, uuid.UUID):
+        return layer_id
+    try:
+        return uuid.UUID(str(layer_id))
+    except (TypeError, ValueError):
+        return None
+
+
+class LayerKeyCache:
+    """Sous-clés AES-GCM par layer, dérivées par HKDF et gardées en LRU
+
+    Sous-clé = HKDF(clé maître, sel = graine aléatoire du layer). Le TTL borne
+    le temps pendant lequel un autre processus peut encore utiliser la clé
+    d'un layer brûlé.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (key_id, layer_uuid) -> (AESGCM, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_aead(self, key_ring, key_id: bytes, layer_uuid: uuid.UUID) -> AESGCM:
+        """Sous-clé d'un layer existant (lit la graine en base en cas d'absence du cache)"""
+        cache_key = (key_id, layer_uuid)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        master_key = key_ring.keys_by_id.get(key_id)
+        if master_key is None:
+            raise ValueError(f"Unknown key id {key_id.hex()}")
+
+        aead = AESGCM(HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=self._load_seed(layer_uuid),
+            info=b'lain-layer-v3:' + layer_uuid.bytes,
+        ).derive(base64.urlsafe_b64decode(master_key)))
+
+        with self._lock:
+            self._entries[cache_key] = (aead, now + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return aead
+
+    @staticmethod
+    def _load_seed(layer_uuid: uuid.UUID) -> bytes:
+        from .models import LayerKey
+
+        layer_key = LayerKey.objects.filter(pk=layer_uuid).first()
+        if layer_key is None:
+            raise LayerKeyMissing(f"No layer key for {str(layer_uuid)[:8]}...")
+        if layer_key.seed is None:
+            raise LayerKeyShredded(f"Layer key {str(layer_uuid)[:8]}... is shredded")
+
+        return bytes(layer_key.seed)
+
+    def evict_layer(self, layer_uuid: uuid.UUID):
+        self.evict_layers([layer_uuid])
+
+    def evict_layers(self, layer_uuids):
+        layer_uuids = set(layer_uuids)
+        with self._lock:
+            for cache_key in [key for key in self._entries if key[1] in layer_uuids]:
+                del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class LayerPurger:
+    """Suppression physique différée des messages des layers brûlés
+
+    Seul chemin de purge du processus : un thread unique traite dans l'ordre
+    les layers planifiés par shred_layer() et les reprises (resume_pending),
+    jamais deux purges en parallèle.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._resume_queued = False
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='lain-layer-purge', daemon=True)
+                    self._worker.start()
+
+    def schedule(self, layer_uuid: uuid.UUID):
+        self._ensure_worker()
+        self.queue.put(layer_uuid)
+
+    def resume_pending(self):
+        """Reprend en arrière-plan les purges non abouties (démarrage, passage d'expiration)"""
+        with self._worker_lock:
+            if self._resume_queued:
+                return
+            self._resume_queued = True
+
+        self._ensure_worker()
+        self.queue.put(None)  # Requête faite dans le thread de purge, après les layers déjà planifiés
+
+    def wait(self):
+        """Attend la fin des purges en file (commandes qui se terminent ensuite)"""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            layer_uuid = self.queue.get()
+            try:
+                if layer_uuid is None:
+                    with self._worker_lock:
+                        self._resume_queued = False
+                    purge_shredded_layers()
+                else:
+                    self.purge(layer_uuid)
+            except Exception as e:
+                # Les lignes restent illisibles ; purge_shredded_layers() les reprendra
+                logger.error(f"Layer purge failed for {str(layer_uuid)[:8]}...: {e}")
+            finally:
+                connection.close()
+                self.queue.task_done()
+
+    def purge(self, layer_uuid: uuid.UUID) -> int:
+        """Supprime les messages par lots, puis les mappings et le tombstone du layer
+
+        Chaque lot est committé avec sa progression (LayerKey.purged_count) :
+        après un redémarrage, purge_shredded_layers() reprend sans tout rescanner.
+        """
+        from .models import LayerKey, LayerMapping, TrueAnonymousLayer
+        from .partitions import message_models
+
+        if LayerKey.objects.filter(pk=layer_uuid, purged_at__isnull=False).exists():
+            return 0  # Déjà purgé (planifié deux fois)
+
+        deleted = 0
+        for model in message_models():
+            while True:
+                pks = list(
+                    model.objects.filter(layer_id=layer_uuid)
+                    .values_list('pk', flat=True)[:self.batch_size]
+                )
+                if not pks:
+                    break
+                count = model.objects.filter(pk__in=pks).delete()[0]
+                LayerKey.objects.filter(pk=layer_uuid).update(purged_count=F('purged_count') + count)
+                deleted += count
+                logger.debug(f"Layer {str(layer_uuid)[:8]}...: {deleted} messages purged")
+
+        from .stats import get_system_stats
+        get_system_stats().add('messages', -deleted)
+
+        LayerMapping.objects.filter(layer_id=layer_uuid).delete()
+        TrueAnonymousLayer.all_objects.filter(pk=layer_uuid).delete()
+        LayerKey.objects.filter(pk=layer_uuid).update(purged_at=timezone.now())
+        logger.info(f"Purged {deleted} messages of shredded layer {str(layer_uuid)[:8]}...")
+        return deleted
+
+
+_layer_key_cache = None
+_layer_purger = None
+_layer_keys_lock = threading.Lock()
+
+def get_layer_key_cache() -> LayerKeyCache:
+    """Récupère le cache de sous-clés du processus"""
+    global _layer_key_cache
+
+    if _layer_key_cache is None:
+        with _layer_keys_lock:
+            if _layer_key_cache is None:
+                config = getattr(settings, 'ENCRYPTION_CONFIG', {})
+                _layer_key_cache = LayerKeyCache(
+                    max_entries=config.get('LAYER_KEY_CACHE_SIZE', 1024),
+                    ttl=config.get('LAYER_KEY_CACHE_TTL', 60),
+                )
+
+    return _layer_key_cache
+
+def get_layer_purger() -> LayerPurger:
+    global _layer_purger
+
+    if _layer_purger is None:
+        with _layer_keys_lock:
+            if _layer_purger is None:
+                _layer_purger = LayerPurger()
+
+    return _layer_purger
+
+
+def create_layer_key(layer_uuid: uuid.UUID):
+    """Crée la graine du layer si elle n'existe pas (une graine détruite le reste)"""
+    from .models import LayerKey
+
+    LayerKey.objects.get_or_create(pk=layer_uuid, defaults={'seed': secrets.token_bytes(32)})
+
+def resolve_layer_aead(key_ring, layer_id) -> Optional[LayerAEAD]:
+    """Sous-clé courante du layer pour encrypt_message (accès base : hors de la boucle async)
+
+    La graine n'est créée que pour un TrueAnonymousLayer vivant. Tout autre
+    identifiant (hash de session, UUID tapé par un client) donne None : le
+    message part en enveloppe v2 et aucune ligne LayerKey n'est créée.
+    """
+    from .models import TrueAnonymousLayer
+
+    layer_uuid = as_layer_uuid(layer_id)
+    if layer_uuid is None:
+        return None
+
+    snapshot = key_ring.snapshot
+    key_id = snapshot.current_key_id
+    cache = get_layer_key_cache()
+
+    try:
+        return LayerAEAD(layer_uuid, key_id, cache.get_aead(snapshot, key_id, layer_uuid))
+    except LayerKeyMissing:
+        if not TrueAnonymousLayer.objects.filter(pk=layer_uuid).exists():
+            return None
+
+    create_layer_key(layer_uuid)
+    return LayerAEAD(layer_uuid, key_id, cache.get_aead(snapshot, key_id, layer_uuid))
+
+def checkpoint_layer_keys() -> bool:
+    """Recopie le WAL de la base des graines puis le tronque (faux si un lecteur l'en empêche)
+
+    Avec secure_delete, l'UPDATE seed = NULL efface la graine de sa page, mais
+    l'ancienne page reste dans le fichier principal et la graine dans les
+    trames WAL de son insertion jusqu'au checkpoint. Si un lecteur tient un
+    ancien instantané, elles y restent jusqu'au prochain checkpoint complet
+    (auto-checkpoint de SQLite ou checkpoint suivant).
+    """
+    from .models import LayerKey
+
+    using = router.db_for_write(LayerKey)
+    if connections[using].vendor != 'sqlite':
+        return True
+
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            busy = cursor.fetchone()[0]
+    except OperationalError:
+        busy = True  # Transaction encore ouverte sur cette connexion
+
+    if busy:
+        logger.warning("Layer key WAL checkpoint incomplete: shredded seeds stay on disk until the next one")
+    return not busy
+
+def shred_layer(layer_id) -> bool:
+    """Détruit la graine du layer (O(1)) ; les lignes sont supprimées en arrière-plan"""
+    from .models import LayerKey
+    from .plaintext_cache import get_plaintext_cache
+
+    layer_uuid = as_layer_uuid(layer_id)
+    if layer_uuid is None:
+        return False
+
+    # Une ligne vide empêche aussi de recréer une clé pour ce layer
+    LayerKey.objects.update_or_create(
+        pk=layer_uuid,
+        defaults={'seed': None, 'shredded_at': timezone.now()}
+    )
+
+    get_layer_key_cache().evict_layer(layer_uuid)
+    get_plaintext_cache().evict_layer(layer_uuid)
+
+    def shredded():
+        checkpoint_layer_keys()
+        get_layer_purger().schedule(layer_uuid)
+
+    transaction.on_commit(shredded, using=router.db_for_write(LayerKey))
+    return True
+
+def shred_all_layers() -> int:
+    """Crypto-shredding de toutes les graines (burn d'urgence)"""
+    from .models import LayerKey
+
+    shredded = LayerKey.objects.filter(seed__isnull=False).update(seed=None, shredded_at=timezone.now())
+    get_layer_key_cache().clear()
+    transaction.on_commit(checkpoint_layer_keys, using=router.db_for_write(LayerKey))
+    return shredded
+
+def purge_shredded_layers() -> int:
+    """Reprend la suppression des layers brûlés dont la purge n'a pas abouti"""
+    from .models import LayerKey
+
+    purger = get_layer_purger()
+    deleted = 0
+    for layer_uuid in LayerKey.objects.filter(
+        shredded_at__isnull=False,
+        purged_at__isnull=True
+    ).values_list('pk', flat=True):
+        deleted += purger.purge(layer_uuid)
+    return deleted
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from anonymization.db_benchmark import benchmark_database_split, compare_engine_profiles
+
+
+class Command(BaseCommand):
+    help = ("Measure concurrent SQLite write throughput (database split, or engine profile with --engines) "
+            "on temporary database files")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent writer threads")
+        parser.add_argument('--writes', type=int, default=200, help="Writes per thread")
+        parser.add_argument('--payload', type=int, default=256, help="Payload bytes per row")
+        parser.add_argument('--engines', action='store_true',
+                            help="Compare the stock SQLite backend with the tuned profile instead")
+
+    def handle(self, *args, **options):
+        params = {
+            'threads': options['threads'],
+            'writes': options['writes'],
+            'payload_size': options['payload'],
+        }
+
+        if options['engines']:
+            self.stdout.write(json.dumps(compare_engine_profiles(**params), indent=2))
+            return
+
+        self.stdout.write(json.dumps(benchmark_database_split(**params), indent=2))
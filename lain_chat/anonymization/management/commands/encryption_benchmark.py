@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from anonymization.benchmark import benchmark_envelopes, run_benchmarks, run_self_test
+
+
+class Command(BaseCommand):
+    help = "Benchmark the encryption subsystem (JSON report) and run its self-test"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help="Operations per measurement")
+        parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024, 16384], help="Payload sizes in bytes")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Messages per encrypt_many/decrypt_many call")
+        parser.add_argument('--envelopes-only', action='store_true', help="Only compare the v1 and v2 envelopes")
+        parser.add_argument('--self-test', action='store_true', help="Run the self-test instead of the benchmark")
+        parser.add_argument('--output', help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        if options['self_test']:
+            return self._self_test()
+
+        if options['envelopes_only']:
+            results = benchmark_envelopes(sizes=options['sizes'], iterations=options['iterations'])
+        else:
+            results = run_benchmarks(
+                sizes=options['sizes'],
+                iterations=options['iterations'],
+                batch_size=options['batch_size'],
+            )
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+        self.stdout.write(report)
+
+    def _self_test(self):
+        results = run_self_test()
+        for name, passed, detail in results:
+            if passed:
+                self.stdout.write(self.style.SUCCESS(f"PASS {name}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"FAIL {name}: {detail}"))
+
+        failed = [name for name, passed, _ in results if not passed]
+        if failed:
+            raise CommandError(f"Encryption self-test failed: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} checks passed"))
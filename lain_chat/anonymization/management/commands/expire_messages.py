@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from anonymization.expiry import ExpiryWorker
+from anonymization.layer_keys import get_layer_purger
+
+
+class Command(BaseCommand):
+    help = "Delete expired messages and layers in bounded batches (long-running unless --once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run a single pass and exit")
+        parser.add_argument('--interval', type=float, default=30.0, help="Seconds between passes")
+        parser.add_argument('--batch-size', type=int, default=None, help="Initial rows per batch")
+
+    def handle(self, *args, **options):
+        def progress(model_name, total, batch_size, latency):
+            self.stdout.write(f"{model_name}: {total} deleted (next batch {batch_size}, {latency * 1000:.1f} ms)")
+
+        overrides = {'progress': progress if options['verbosity'] > 1 else None}
+        if options['batch_size']:
+            overrides['batch_size'] = options['batch_size']
+        worker = ExpiryWorker.from_settings(**overrides)
+
+        while True:
+            stats = worker.run_once()
+            self.stdout.write(
+                f"{stats['messages']} messages, {stats['layers']} layers, "
+                f"{stats['burned_rows']} burned rows reaped in {stats['seconds']}s ({stats['rows_per_sec']} rows/s)"
+            )
+
+            if options['once']:
+                get_layer_purger().wait()  # Les purges planifiées tournent dans un thread
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from anonymization.routers import move_mapping_rows
+
+
+class Command(BaseCommand):
+    help = ("Move mapping rows (LayerMapping...) left in the default database into the mapping database. "
+            "Run once after migrate --database anonymous_mapping on installs that predate the router")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='default', help="Database holding the old rows")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per batch")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows to move")
+
+    def handle(self, *args, **options):
+        moved = move_mapping_rows(options['source'], options['batch_size'], options['dry_run'])
+        verb = "to move" if options['dry_run'] else "moved"
+        for label, count in moved.items():
+            self.stdout.write(f"{label}: {count} rows {verb}")
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anonymization", "0002_anonymousmessage_encryption_salt_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="keyrotation",
+            name="completed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="keyrotation",
+            name="key_id",
+            field=models.CharField(blank=True, default="", max_length=16),
+        ),
+        migrations.AddField(
+            model_name="keyrotation",
+            name="last_processed_id",
+            field=models.UUIDField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anonymization", "0003_keyrotation_checkpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LayerKey",
+            fields=[
+                ("layer_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("seed", models.BinaryField(null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("shredded_at", models.DateTimeField(blank=True, null=True)),
+                ("purged_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "layer_keys",
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anonymization", "0004_layerkey"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trueanonymouslayer",
+            index=models.Index(fields=["auto_destroy_at"], name="anonymous_l_auto_de_a9feea_idx"),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anonymization", "0005_layer_expiry_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="keyrotation",
+            name="last_processed_table",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("anonymization", "0006_keyrotation_last_processed_table"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="layerkey",
+            name="purged_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="trueanonymouslayer",
+            name="burned_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,17 +1,37 @@
 import uuid
 import os
 import hashlib
+import hmac
 import time
 from django.db import models
 from django.utils import timezone
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
 import base64
 import logging
 
 logger = logging.getLogger('lain_models')
 
+_blind_index_key = None
+
+def get_blind_index_key() -> bytes:
+    """Secret serveur de l'index aveugle (LAYER_SALT_KEY, sinon dérivé de SECRET_KEY)"""
+    global _blind_index_key
+    
+    if _blind_index_key is None:
+        secret = getattr(settings, 'ENCRYPTION_CONFIG', {}).get('LAYER_SALT_KEY') or settings.SECRET_KEY
+        _blind_index_key = hmac.new(secret.encode(), b'lain-layer-blind-index', hashlib.sha256).digest()
+    
+    return _blind_index_key
+
+class LiveLayerManager(models.Manager):
+    """Layers non brûlés : un layer tombstoné disparaît aussitôt des lectures"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(burned_at__isnull=True)
+
 class TrueAnonymousLayer(models.Model):
     layer_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     layer_name = models.CharField(max_length=50)
@@ -19,11 +39,19 @@ class TrueAnonymousLayer(models.Model):
     last_active = models.DateTimeField(auto_now=True)
     auto_destroy_at = models.DateTimeField(null=True, blank=True)
     corruption_level = models.IntegerField(default=0)
+    # Tombstone : la ligne est supprimée par le LayerPurger après ses messages
+    burned_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = LiveLayerManager()
+    all_objects = models.Manager()
     
     class Meta:
         db_table = 'anonymous_layers'
         verbose_name = 'Anonymous Layer'
         verbose_name_plural = 'Anonymous Layers'
+        indexes = [
+            models.Index(fields=['auto_destroy_at']),
+        ]
     
     def __str__(self):
         return f"Layer: {self.layer_name} ({str(self.layer_id)[:8]}...)"
@@ -35,8 +63,14 @@ class TrueAnonymousLayer(models.Model):
         return False
     
     def burn_layer(self):
-        """Destruction définitive du layer"""
-        self.delete()
+        """Destruction définitive du layer (tombstone immédiat, purge en arrière-plan)"""
+        from .layer_keys import shred_layer
+        from .stats import get_system_stats
+        
+        self.burned_at = timezone.now()
+        if TrueAnonymousLayer.objects.filter(pk=self.pk).update(burned_at=self.burned_at):
+            get_system_stats().add('layers', -1)
+        shred_layer(self.layer_id)
         return True
 
 class LayerMapping(models.Model):
@@ -52,6 +86,42 @@ class LayerMapping(models.Model):
         db_table = 'anonymous_mapping'
         unique_together = ['user_hash', 'layer_id']
     
+    @staticmethod
+    def blind_index(user_id, epoch: int = None, layer_id=None) -> str:
+        """Index aveugle déterministe : HMAC-SHA256 sous le secret serveur, par époque
+
+        Avec layer_id, l'index est propre au layer (fragments d'identité) : deux
+        fragments du même utilisateur n'ont rien en commun dans la table.
+        """
+        if epoch is None:
+            epoch = getattr(settings, 'ENCRYPTION_CONFIG', {}).get('BLIND_INDEX_EPOCH', 0)
+        
+        data = f"{epoch}:{user_id}" if layer_id is None else f"{epoch}:{user_id}:{layer_id}"
+        return hmac.new(get_blind_index_key(), data.encode(), hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def _epochs():
+        # Époque courante et précédente, le temps de la rotation
+        epoch = getattr(settings, 'ENCRYPTION_CONFIG', {}).get('BLIND_INDEX_EPOCH', 0)
+        return [e for e in (epoch, epoch - 1) if e >= 0]
+    
+    @classmethod
+    def for_user(cls, user_id):
+        """Layers de l'utilisateur (hors fragments, introuvables sans leur layer_id)"""
+        user_hashes = [cls.blind_index(user_id, e) for e in cls._epochs()]
+        
+        # Recherche indexée : user_hash est la première colonne de unique_together
+        return cls.objects.filter(user_hash__in=user_hashes)
+    
+    @classmethod
+    def for_user_layer(cls, user_id, layer_id):
+        """Mapping d'un layer donné de l'utilisateur, layer ordinaire ou fragment"""
+        user_hashes = []
+        for e in cls._epochs():
+            user_hashes += [cls.blind_index(user_id, e), cls.blind_index(user_id, e, layer_id)]
+        
+        return cls.objects.filter(user_hash__in=user_hashes, layer_id=layer_id)
+    
     @staticmethod
     def generate_user_hash(user_id, salt=None):
         """Génère hash anonyme pour l'utilisateur"""
@@ -88,8 +158,8 @@ class DataFragment(models.Model):
         computed_checksum = hashlib.sha256(self.encrypted_data).hexdigest()
         return computed_checksum == self.checksum
 
-class AnonymousMessage(models.Model):
-    """Messages AES-256"""
+class AbstractAnonymousMessage(models.Model):
+    """Messages AES-256 : champs et méthodes communs à la table unique et aux partitions"""
     message_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     layer_id = models.UUIDField()
     room_name = models.CharField(max_length=100)
@@ -105,23 +175,20 @@ class AnonymousMessage(models.Model):
     auto_destroy_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
-        db_table = 'anonymous_messages'
-        indexes = [
-            models.Index(fields=['layer_id', 'timestamp']),
-            models.Index(fields=['room_name', 'timestamp']),
-            models.Index(fields=['auto_destroy_at']),  
-        ]
+        abstract = True
     
     def save_encrypted(self, plaintext_message: str, layer_id: str, room_name: str = None):
         
         try:
-            from .encryption import encrypt_message  
-            
+            from .encryption import encrypt_message, get_encryption_instance
             
+            # Graine du layer lue (ou créée pour un layer vivant) ici, pas dans le chiffrement
+            layer_aead = get_encryption_instance().resolve_layer_aead(layer_id)
             encrypted_data, nonce, salt = encrypt_message(
                 message=plaintext_message,
                 layer_id=layer_id,
-                room_name=room_name or self.room_name
+                room_name=room_name or self.room_name,
+                layer_aead=layer_aead
             )
             
             # Stockage des données chiffrées
@@ -146,10 +213,20 @@ class AnonymousMessage(models.Model):
             logger.error(f"Failed to save encrypted message: {e}")
             raise ValueError(f"Could not save encrypted message: {str(e)}")
     
+    def _cache_deadline(self):
+        return self.auto_destroy_at.timestamp() if self.auto_destroy_at else None
+    
     def get_decrypted_content(self) -> str:
         
         try:
             from .encryption import decrypt_message  
+            from .plaintext_cache import get_plaintext_cache
+            
+            # Messages chauds (rejoués à chaque arrivant) : simple lecture de dictionnaire
+            plaintext_cache = get_plaintext_cache()
+            plaintext = plaintext_cache.get(self.message_id)
+            if plaintext is not None:
+                return plaintext
             
             if not self.encrypted_content:
                 raise ValueError("No encrypted content to decrypt")
@@ -166,16 +243,61 @@ class AnonymousMessage(models.Model):
             if computed_hash != self.content_hash:
                 logger.warning(f"Content hash mismatch for message {self.message_id}")
             
+            plaintext_cache.put(self.message_id, plaintext, self.layer_id, self._cache_deadline())
+            
             return plaintext
             
         except Exception as e:
             logger.error(f"Failed to decrypt message {self.message_id}: {e}")
             raise ValueError(f"Could not decrypt message: {str(e)}")
     
+    @staticmethod
+    def decrypt_batch(messages) -> list:
+        """Déchiffre une liste de messages en parallèle (BatchResult par message, ordre conservé)"""
+        from .encryption import decrypt_many, BatchResult
+        from .plaintext_cache import get_plaintext_cache
+        
+        plaintext_cache = get_plaintext_cache()
+        messages = list(messages)
+        checked = [None] * len(messages)
+        
+        missing = []
+        for position, message in enumerate(messages):
+            plaintext = plaintext_cache.get(message.message_id)
+            if plaintext is not None:
+                checked[position] = BatchResult(plaintext)
+            else:
+                missing.append(position)
+        
+        results = decrypt_many(
+            (bytes(messages[position].encrypted_content), messages[position].encryption_nonce,
+             messages[position].encryption_salt)
+            for position in missing
+        )
+        
+        for position, result in zip(missing, results):
+            message = messages[position]
+            if result.ok:
+                if hashlib.sha256(result.value.encode()).hexdigest() != message.content_hash:
+                    logger.warning(f"Content hash mismatch for message {message.message_id}")
+                plaintext_cache.put(message.message_id, result.value, message.layer_id, message._cache_deadline())
+            else:
+                result = BatchResult(error=f"Could not decrypt message: {result.error}")
+            checked[position] = result
+        
+        return checked
+    
     def verify_integrity(self) -> bool:
         
         try:
-            plaintext = self.get_decrypted_content()
+            from .encryption import decrypt_message
+            
+            # Toujours depuis le chiffré stocké : le cache ne dit rien de l'état de la base
+            plaintext = decrypt_message(
+                encrypted_data=self.encrypted_content,
+                nonce=self.encryption_nonce,
+                salt=self.encryption_salt
+            )
             computed_hash = hashlib.sha256(plaintext.encode()).hexdigest()
             return computed_hash == self.content_hash
         except:
@@ -190,6 +312,41 @@ class AnonymousMessage(models.Model):
     def __str__(self):
         return f"Encrypted Msg from Layer {str(self.layer_id)[:8]}... at {self.timestamp}"
 
+def message_indexes():
+    """Index des tables de messages (nommés d'après chaque table, partitions comprises)"""
+    return [
+        models.Index(fields=['layer_id', 'timestamp']),
+        models.Index(fields=['room_name', 'timestamp']),
+        models.Index(fields=['auto_destroy_at']),  
+    ]
+
+class AnonymousMessage(AbstractAnonymousMessage):
+    """Table de messages unique (et messages antérieurs au partitionnement)"""
+    
+    class Meta:
+        db_table = 'anonymous_messages'
+        indexes = message_indexes()
+
+class LayerKey(models.Model):
+    """Graine de la sous-clé d'un layer (enveloppe v3)
+
+    Sans la graine, la clé du layer ne peut plus être dérivée : effacer la
+    graine rend tous les messages du layer illisibles (crypto-shredding).
+    """
+    layer_id = models.UUIDField(primary_key=True)
+    seed = models.BinaryField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    shredded_at = models.DateTimeField(null=True, blank=True)
+    purged_at = models.DateTimeField(null=True, blank=True)
+    purged_count = models.IntegerField(default=0)  # Progression de la purge, lot par lot
+    
+    class Meta:
+        db_table = 'layer_keys'
+    
+    def __str__(self):
+        state = 'shredded' if self.shredded_at else 'active'
+        return f"Layer key {str(self.layer_id)[:8]}... ({state})"
+
 class KeyRotation(models.Model):
     """Historique de rotation des clés"""
     rotation_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -198,6 +355,12 @@ class KeyRotation(models.Model):
     affected_objects_count = models.IntegerField()  
     rotation_reason = models.CharField(max_length=100, default='scheduled')
     
+    # Checkpoint des jobs de rechiffrement (reprise après arrêt)
+    key_id = models.CharField(max_length=16, blank=True, default='')
+    last_processed_id = models.UUIDField(null=True, blank=True)
+    last_processed_table = models.CharField(max_length=64, blank=True, default='')  # Partition en cours
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         db_table = 'key_rotations'
     
@@ -226,13 +389,19 @@ class MessageCleanupManager:
     def cleanup_expired_messages():
         """Nettoie les messages expirés"""
         try:
-            expired_count = AnonymousMessage.objects.filter(
-                auto_destroy_at__lt=timezone.now()
-            ).delete()[0]
+            from .expiry import ExpiryWorker
+            from .partitions import drop_expired_partitions
+            from .plaintext_cache import get_plaintext_cache
+            
+            drop_expired_partitions()
+            # Lots bornés de clés primaires plutôt qu'un DELETE unique sur toute la table
+            expired_count = ExpiryWorker.from_settings().expire_messages()
             
             if expired_count > 0:
                 logger.info(f"Cleaned up {expired_count} expired messages")
             
+            get_plaintext_cache().evict_expired()
+            
             return expired_count
             
         except Exception as e:
@@ -243,20 +412,16 @@ class MessageCleanupManager:
     def emergency_burn_all_messages():
         """Destruction d'urgence de tous les messages"""
         try:
-            total_count = AnonymousMessage.objects.count()
-            AnonymousMessage.objects.all().delete()
+            from .burn import burn_all
             
-       
-            EmergencyBurn.objects.create(
+            result = burn_all(
                 burn_type='all_messages',
-                objects_destroyed_count=total_count,
                 triggered_by_hash='emergency_protocol',
-                reason='Emergency burn executed'
+                reason='Emergency burn executed',
+                messages_only=True
             )
             
-            logger.critical(f"EMERGENCY BURN: {total_count} messages destroyed")
-            
-            return total_count
+            return result['burn_id']
             
         except Exception as e:
             logger.error(f"Emergency burn failed: {e}")
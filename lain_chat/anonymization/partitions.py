@@ -0,0 +1,194 @@
+import datetime
+import logging
+import threading
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AbstractAnonymousMessage, AnonymousMessage, message_indexes
+
+
+logger = logging.getLogger('lain_models')
+
+PARTITION_PREFIX = 'anonymous_messages_p'
+
+_partition_models = {}
+_known_tables = set()
+_partition_lock = threading.Lock()
+
+
+def partitioning_enabled() -> bool:
+    return getattr(settings, 'ANONYMIZATION_CONFIG', {}).get('PARTITIONED_MESSAGES', False)
+
+
+def partition_table(day: datetime.date) -> str:
+    return f'{PARTITION_PREFIX}{day:%Y%m%d}'
+
+
+def partition_model(day: datetime.date):
+    """Modèle (non géré par les migrations) de la partition journalière day"""
+    with _partition_lock:
+        model = _partition_models.get(day)
+        if model is None:
+            meta = type('Meta', (), {
+                'app_label': 'anonymization',
+                'db_table': partition_table(day),
+                'indexes': message_indexes(),
+                'managed': False,  # Créée et supprimée à l'exécution, jamais par migrate
+            })
+            model = type(f'AnonymousMessageP{day:%Y%m%d}', (AbstractAnonymousMessage,), {
+                '__module__': __name__,
+                'Meta': meta,
+            })
+            _partition_models[day] = model
+
+    return model
+
+
+def create_table(model, using: str):
+    """CREATE TABLE/INDEX IF NOT EXISTS d'un modèle (utilisable dans une transaction)"""
+    # Pas de schema_editor() en contexte : SQLite le refuse dans un bloc atomic
+    connection = connections[using]
+    editor = connection.schema_editor()
+    editor.deferred_sql = []  # unique_together y est ajouté sous forme de CREATE UNIQUE INDEX
+    sql, params = editor.table_sql(model)
+    indexes = [index.create_sql(model, editor) for index in model._meta.indexes] + editor.deferred_sql
+
+    statements = [(sql.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1), params)]
+    statements += [
+        (str(index).replace(' INDEX ', ' INDEX IF NOT EXISTS ', 1), None)
+        for index in indexes
+    ]
+
+    with connection.cursor() as cursor:
+        for statement, statement_params in statements:
+            cursor.execute(statement, statement_params)
+
+
+def ensure_partition(day: datetime.date):
+    """Crée la table de la partition si besoin (utilisable dans une transaction)"""
+    model = partition_model(day)
+    alias = router.db_for_write(model)
+    table = model._meta.db_table
+
+    if (alias, table) in _known_tables:
+        return model
+
+    create_table(model, alias)
+
+    # DDL transactionnel : la table n'existe pour de bon qu'après le commit
+    transaction.on_commit(lambda: _known_tables.add((alias, table)), using=alias)
+    logger.info(f"Message partition {table} ready")
+    return model
+
+
+def existing_partitions(using: str = None) -> list:
+    """[(jour, table)] des partitions présentes en base, de la plus ancienne à la plus récente"""
+    alias = using or router.db_for_write(AnonymousMessage)
+    partitions = []
+
+    for table in connections[alias].introspection.table_names():
+        if not table.startswith(PARTITION_PREFIX):
+            continue
+        try:
+            day = datetime.datetime.strptime(table[len(PARTITION_PREFIX):], '%Y%m%d').date()
+        except ValueError:
+            continue
+        partitions.append((day, table))
+
+    return sorted(partitions)
+
+
+def message_model_for_write():
+    """Modèle où écrire un nouveau message : partition du jour, ou table unique"""
+    if not partitioning_enabled():
+        return AnonymousMessage
+    return ensure_partition(timezone.now().date())
+
+
+def message_models(start: datetime.datetime = None, end: datetime.datetime = None) -> list:
+    """Modèles à interroger pour des messages dont le timestamp est dans [start, end]
+
+    La table unique reste incluse : elle garde les messages antérieurs au
+    partitionnement.
+    """
+    if not partitioning_enabled():
+        return [AnonymousMessage]
+
+    models = [AnonymousMessage]
+    for day, _ in existing_partitions():
+        if start is not None and day < start.date():
+            continue
+        if end is not None and day > end.date():
+            continue
+        models.append(partition_model(day))
+
+    return models
+
+
+def find_message(message_id):
+    """Cherche un message par clé primaire, des partitions récentes vers les anciennes"""
+    for model in reversed(message_models()):
+        message = model.objects.filter(pk=message_id).first()
+        if message is not None:
+            return message
+    return None
+
+
+def recent_room_messages(room_name: str, limit: int) -> list:
+    """Derniers messages non expirés d'une salle, du plus ancien au plus récent
+
+    Parcourt les partitions de la plus récente à la plus ancienne et s'arrête
+    dès que limit messages sont trouvés.
+    """
+    now = timezone.now()
+    messages = []
+    for model in reversed(message_models()):
+        if len(messages) >= limit:
+            break
+        messages.extend(
+            model.objects
+            .filter(room_name=room_name)
+            .filter(Q(auto_destroy_at__isnull=True) | Q(auto_destroy_at__gt=now))
+            .order_by('-timestamp')[:limit - len(messages)]
+        )
+
+    messages.sort(key=lambda message: message.timestamp)
+    return messages[-limit:]
+
+
+def _drop_partition(day: datetime.date, table: str):
+    alias = router.db_for_write(AnonymousMessage)
+    connection = connections[alias]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {connection.ops.quote_name(table)}')
+    _known_tables.discard((alias, table))
+
+
+def drop_expired_partitions(retention_days: int = None) -> list:
+    """Rétention : supprime les partitions entièrement plus vieilles que retention_days
+
+    Coût constant par jour, quel que soit le nombre de lignes.
+    """
+    if not partitioning_enabled():
+        return []
+
+    if retention_days is None:
+        retention_days = getattr(settings, 'ANONYMIZATION_CONFIG', {}).get('MESSAGE_RETENTION_DAYS', 7)
+    # Partition du jour J : messages de [J, J+1[, tous périmés si J+1 <= maintenant - rétention
+    cutoff = (timezone.now() - datetime.timedelta(days=retention_days)).date()
+
+    dropped = []
+    for day, table in existing_partitions():
+        if day < cutoff:
+            _drop_partition(day, table)
+            dropped.append(table)
+
+    if dropped:
+        from .stats import get_system_stats
+        get_system_stats().invalidate()  # Lignes non comptées : recomptage au prochain snapshot
+        logger.info(f"Dropped {len(dropped)} expired message partitions")
+    return dropped
+
@@ -0,0 +1,181 @@
+import datetime
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+
+logger = logging.getLogger('lain_encryption')
+
+
+class PlaintextCache:
+    """Cache LRU des messages déchiffrés, en mémoire du processus uniquement
+
+    Jamais écrit dans le cache Django (partagé, potentiellement persistant).
+    Une entrée ne survit ni à son TTL ni à l'auto_destroy_at du message, et
+    les burns du processus l'évincent explicitement.
+
+    Les burns faits par un autre worker sont relus en base (LayerKey.shredded_at,
+    EmergencyBurn) par un thread d'arrière-plan, relancé par get() toutes les
+    revocation_interval secondes : get() ne touche jamais la base et reste
+    utilisable depuis le code async. Une entrée n'est servie que si la
+    dernière relecture réussie date de moins de 2 × revocation_interval :
+    c'est le délai max pendant lequel un texte clair brûlé ailleurs peut
+    encore sortir de ce cache.
+    """
+
+    # Recouvrement entre deux relectures : horloges des workers et commits tardifs
+    REVOCATION_OVERLAP = datetime.timedelta(seconds=5)
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 300, revocation_interval: float = 1):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revocation_interval = revocation_interval
+        self._entries = OrderedDict()  # message_id -> (plaintext, layer_id, expires_at)
+        self._lock = threading.Lock()
+        self._revocation_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # Distinct : sync_revocations garde _revocation_lock pendant la requête
+        self._revocation_refresh = None
+        self._revocations_checked = time.monotonic()
+        self._revocations_since = timezone.now()
+        self.hits = 0
+        self.misses = 0
+
+    def sync_revocations(self):
+        """Applique les burns des autres workers (requêtes ORM : jamais depuis l'event loop)"""
+        from .layer_keys import get_layer_key_cache
+        from .models import LayerKey, EmergencyBurn
+
+        with self._revocation_lock:
+            checked, now = time.monotonic(), timezone.now()
+            since = self._revocations_since - self.REVOCATION_OVERLAP
+            try:
+                if EmergencyBurn.objects.filter(burned_at__gte=since).exists():
+                    self.clear()
+                    get_layer_key_cache().clear()
+                else:
+                    layer_ids = set(LayerKey.objects.filter(shredded_at__gte=since).values_list('pk', flat=True))
+                    if layer_ids:
+                        self.evict_layers(layer_ids)
+                        get_layer_key_cache().evict_layers(layer_ids)
+            except Exception as e:
+                # Sans la liste des burns, on ne sert rien de ce qu'on a gardé
+                logger.warning(f"Plaintext cache revocation check failed, clearing: {e}")
+                self.clear()
+
+            self._revocations_checked, self._revocations_since = checked, now
+
+    def _refresh_revocations(self):
+        try:
+            self.sync_revocations()
+        finally:
+            connections.close_all()
+
+    def _schedule_revocation_sync(self) -> bool:
+        """Relance la relecture des burns en arrière-plan ; False si les entrées ne sont plus servables"""
+        age = time.monotonic() - self._revocations_checked
+        if age >= self.revocation_interval:
+            with self._refresh_lock:
+                if self._revocation_refresh is None or not self._revocation_refresh.is_alive():
+                    self._revocation_refresh = threading.Thread(
+                        target=self._refresh_revocations, name='lain-plaintext-revocations', daemon=True
+                    )
+                    self._revocation_refresh.start()
+        return age < 2 * self.revocation_interval
+
+    def get(self, message_id):
+        if not self.max_entries:
+            return None
+
+        servable = self._schedule_revocation_sync()
+
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None or not servable:
+                self.misses += 1
+                return None
+
+            if entry[2] <= time.time():
+                del self._entries[message_id]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(message_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, message_id, plaintext: str, layer_id=None, expires_at: float = None):
+        if not self.max_entries:
+            return
+
+        now = time.time()
+        deadline = now + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        if deadline <= now:
+            return
+
+        with self._lock:
+            self._entries[message_id] = (plaintext, str(layer_id), deadline)
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def evict(self, message_id):
+        with self._lock:
+            self._entries.pop(message_id, None)
+
+    def evict_layer(self, layer_id) -> int:
+        """Évince tous les messages d'un layer brûlé"""
+        return self.evict_layers([layer_id])
+
+    def evict_layers(self, layer_ids) -> int:
+        layer_ids = {str(layer_id) for layer_id in layer_ids}
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] in layer_ids]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[2] <= now]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_plaintext_cache = None
+_plaintext_cache_lock = threading.Lock()
+
+def get_plaintext_cache() -> PlaintextCache:
+    """Récupère le cache de texte clair du processus"""
+    global _plaintext_cache
+
+    if _plaintext_cache is None:
+        with _plaintext_cache_lock:
+            if _plaintext_cache is None:
+                config = getattr(settings, 'ENCRYPTION_CONFIG', {})
+                _plaintext_cache = PlaintextCache(
+                    max_entries=config.get('PLAINTEXT_CACHE_SIZE', 2048),
+                    ttl=config.get('PLAINTEXT_CACHE_TTL', 300),
+                    revocation_interval=config.get('PLAINTEXT_CACHE_REVOCATION_INTERVAL', 1),
+                )
+
+    return _plaintext_cache
@@ -0,0 +1,140 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.fernet import InvalidToken
+from django.utils import timezone
+
+from .encryption import get_encryption_instance, _key_id
+from .models import KeyRotation
+from .partitions import message_models
+from .routers import atomic_for
+
+
+logger = logging.getLogger('lain_encryption')
+
+
+class MessageReencryptionJob:
+    """Rechiffrement en flux des messages après une rotation de la clé maître
+
+    Les messages sont lus par blocs de clé primaire, rechiffrés dans un pool de
+    threads (cryptography libère le GIL), réécrits avec bulk_update, et la
+    progression est enregistrée dans KeyRotation après chaque bloc : le job
+    reprend là où il s'est arrêté.
+    """
+
+    KEY_TYPE = 'message_master_key'
+
+    def __init__(self, chunk_size: int = 500, workers: int = 4, pause: float = 0.0, progress=None):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.pause = pause  # Pause entre blocs pour tourner sous charge
+        self.progress = progress
+        self.encryption = get_encryption_instance()
+        self.failed = 0
+
+    def _get_checkpoint(self) -> KeyRotation:
+        """Reprend le job en cours pour la clé courante, ou en crée un nouveau"""
+        current_key_id = _key_id(self.encryption.master_key)
+
+        for rotation in KeyRotation.objects.filter(
+            key_type=self.KEY_TYPE,
+            completed_at__isnull=True
+        ).order_by('-rotated_at'):
+            if rotation.key_id == current_key_id:
+                return rotation
+
+            # Job lancé pour une clé qui a depuis été remplacée : à refaire
+            rotation.completed_at = timezone.now()
+            rotation.rotation_reason = 'superseded'
+            rotation.save(update_fields=['completed_at', 'rotation_reason'])
+
+        return KeyRotation.objects.create(
+            key_type=self.KEY_TYPE,
+            key_id=current_key_id,
+            affected_objects_count=0,
+            rotation_reason='master key rotation'
+        )
+
+    def _rotate(self, encrypted_data):
+        try:
+            return self.encryption.rotate_token(encrypted_data)
+        except (InvalidToken, ValueError, TypeError):
+            return None
+
+    def _run_table(self, executor, model, rotation: KeyRotation, processed: int, start_time: float) -> int:
+        """Rechiffre une table de messages à partir du checkpoint ; renvoie le total traité"""
+        last_pk = rotation.last_processed_id
+
+        if last_pk:
+            logger.info(f"Resuming message re-encryption after {str(last_pk)[:8]}...")
+
+        while True:
+            queryset = model.objects.order_by('pk').only('pk', 'encrypted_content')
+            if last_pk:
+                queryset = queryset.filter(pk__gt=last_pk)
+
+            chunk = list(queryset[:self.chunk_size])
+            if not chunk:
+                return processed
+
+            tokens = executor.map(self._rotate, [message.encrypted_content for message in chunk])
+
+            updated = []
+            for message, token in zip(chunk, tokens):
+                if token is None:
+                    self.failed += 1
+                    continue
+                if token == bytes(message.encrypted_content):
+                    continue  # Déjà sous la clé courante
+                message.encrypted_content = token
+                updated.append(message)
+
+            last_pk = chunk[-1].pk
+
+            with atomic_for(model, KeyRotation):
+                model.objects.bulk_update(updated, ['encrypted_content'])
+                rotation.last_processed_id = last_pk
+                rotation.affected_objects_count += len(updated)
+                rotation.save(update_fields=['last_processed_id', 'affected_objects_count'])
+
+            processed += len(chunk)
+            if self.progress:
+                elapsed = time.perf_counter() - start_time
+                self.progress(processed, rotation.affected_objects_count, processed / elapsed if elapsed else 0.0)
+
+            if self.pause:
+                time.sleep(self.pause)
+
+    def run(self) -> KeyRotation:
+        rotation = self._get_checkpoint()
+        models = message_models()
+        tables = [model._meta.db_table for model in models]
+
+        if rotation.last_processed_id and not rotation.last_processed_table:
+            rotation.last_processed_table = tables[0]  # Checkpoint antérieur aux partitions : table unique
+
+        if rotation.last_processed_table in tables:
+            # Tables (partitions) déjà traitées : on reprend à celle du checkpoint
+            models = models[tables.index(rotation.last_processed_table):]
+            logger.info(f"Resuming message re-encryption in {rotation.last_processed_table}")
+
+        start_time = time.perf_counter()
+        processed = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for model in models:
+                if rotation.last_processed_table != model._meta.db_table:
+                    rotation.last_processed_table = model._meta.db_table
+                    rotation.last_processed_id = None
+                    rotation.save(update_fields=['last_processed_table', 'last_processed_id'])
+
+                processed = self._run_table(executor, model, rotation, processed, start_time)
+
+        rotation.completed_at = timezone.now()
+        rotation.save(update_fields=['completed_at'])
+
+        if self.failed:
+            logger.warning(f"Message re-encryption skipped {self.failed} undecryptable messages")
+        logger.info(f"Message re-encryption completed ({rotation.affected_objects_count} messages)")
+
+        return rotation
@@ -0,0 +1,104 @@
+from contextlib import ExitStack
+from django.conf import settings
+from django.apps import apps
+from django.db import connections, router, transaction
+
+
+class AnonymousMappingRouter:
+    """Place les tables de liaison (LayerMapping...) dans la base anonymous_mapping
+
+    Les deux fichiers SQLite ont chacun leur verrou d'écriture : les écritures
+    de mappings ne bloquent plus celles des messages et des layers.
+    """
+
+    def __init__(self):
+        config = getattr(settings, 'DATABASE_ROUTING', {})
+        self.mapping_database = config.get('MAPPING_DATABASE', 'anonymous_mapping')
+        self.mapping_models = {label.lower() for label in config.get('MAPPING_MODELS', ['anonymization.LayerMapping'])}
+        # Bases utilisables explicitement par FragmentStore (using(...))
+        self.fragment_databases = set(getattr(settings, 'FRAGMENT_CONFIG', {}).get('DATABASES', []))
+
+    def _is_mapping_model(self, model):
+        return model._meta.label_lower in self.mapping_models
+
+    def db_for_read(self, model, **hints):
+        if self._is_mapping_model(model):
+            return self.mapping_database
+        return None
+
+    def db_for_write(self, model, **hints):
+        if self._is_mapping_model(model):
+            return self.mapping_database
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is None:
+            return None
+
+        label = f'{app_label}.{model_name}'
+        if label == 'anonymization.datafragment' and db in self.fragment_databases:
+            return True
+
+        if label in self.mapping_models:
+            return db == self.mapping_database
+
+        # La base de mapping ne reçoit que les modèles routés
+        return db != self.mapping_database
+
+
+def atomic_for(*models) -> ExitStack:
+    """transaction.atomic sur chaque base où ces modèles écrivent
+
+    Les bases sont committées l'une après l'autre (pas de commit à deux phases).
+    """
+    stack = ExitStack()
+    for alias in dict.fromkeys(router.db_for_write(model) for model in models):
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+def move_mapping_rows(source: str = 'default', batch_size: int = 500, dry_run: bool = False) -> dict:
+    """Déplace les lignes des modèles routés restées dans source vers leur base de mapping
+
+    Pour une installation antérieure au routeur : ses mappings sont encore dans
+    default, alors que le code ne les lit plus que dans anonymous_mapping.
+    Chaque lot est inséré (ignore_conflicts) puis supprimé de source : une
+    reprise après interruption ne duplique rien.
+    """
+    moved = {}
+    for label in getattr(settings, 'DATABASE_ROUTING', {}).get('MAPPING_MODELS', ['anonymization.LayerMapping']):
+        model = apps.get_model(label)
+        target = router.db_for_write(model)
+        if target == source or model._meta.db_table not in connections[source].introspection.table_names():
+            moved[label] = 0
+            continue
+
+        rows = model.objects.using(source).order_by('pk')
+        if dry_run:
+            moved[label] = rows.count()
+            continue
+
+        # bulk_create passe par pre_save : auto_now(_add) écraserait les dates d'origine
+        dates = [
+            field.attname for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        ]
+        moved[label] = 0
+        while True:
+            batch = list(rows[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic(using=target):
+                original = [{name: getattr(row, name) for name in dates} for row in batch]
+                model.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+                if dates:
+                    for row, values in zip(batch, original):
+                        row.__dict__.update(values)
+                    model.objects.using(target).bulk_update(batch, dates)
+            with transaction.atomic(using=source):
+                model.objects.using(source).filter(pk__in=[row.pk for row in batch]).delete()
+            moved[label] += len(batch)
+    return moved
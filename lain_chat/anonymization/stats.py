@@ -0,0 +1,272 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from lain_chat.singleflight import is_shared_cache
+
+
+logger = logging.getLogger('lain_models')
+
+
+class HyperLogLog:
+    """Estimation de cardinalité en 2^precision octets (~1.6 % d'erreur à precision=12)"""
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, value: str):
+        digest = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        index = digest >> (64 - self.precision)
+        remaining = digest & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog'):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Petites cardinalités : comptage linéaire, plus précis
+            estimate = self.size * math.log(self.size / zeros)
+
+        return int(round(estimate))
+
+
+class SystemStats:
+    """Compteurs système tenus à jour par deltas dans le cache Django
+
+    Les lectures (snapshot) coûtent un get_many ; les créations passent par
+    post_save, les suppressions par lots appliquent le nombre de lignes
+    supprimées. reconcile() recompte depuis la base toutes les
+    reconcile_interval secondes pour corriger la dérive (bulk_create,
+    suppressions hors de ces chemins).
+
+    Les layers actifs d'une room sur une fenêtre glissante sont estimés par
+    des HyperLogLog d'une minute, fusionnés à la lecture.
+
+    Tout cela suppose un cache partagé par les processus, aux incr()/add()
+    atomiques (Redis, Memcached). Sur un cache local (LocMemCache...), chaque
+    worker ne verrait que ses propres écritures : compteurs et layers actifs
+    sont alors lus en base à chaque appel, comme avant.
+    """
+
+    COUNTERS = ('layers', 'messages', 'burns')
+    PREFIX = 'lain:stats:'
+    LOCK_TIMEOUT = 5  # Verrou de fusion d'un sketch orphelin (processus tué) libéré après
+
+    def __init__(self, cache_alias: str = 'default', reconcile_interval: float = 300,
+                 window_minutes: int = 10, precision: int = 12):
+        self.cache_alias = cache_alias
+        self.reconcile_interval = reconcile_interval
+        self.window_minutes = window_minutes
+        self.precision = precision
+        self._reconcile_lock = threading.Lock()
+        self._activity_lock = threading.Lock()
+        self._sketches = {}  # clé de cache -> (minute, HyperLogLog des layers vus par ce processus)
+        self._dirty = set()  # Sketchs pas encore fusionnés dans le cache
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'STATS_CONFIG', {})
+        return cls(
+            cache_alias=config.get('CACHE', 'default'),
+            reconcile_interval=config.get('RECONCILE_INTERVAL', 300),
+            window_minutes=config.get('ACTIVE_WINDOW_MINUTES', 10),
+            precision=config.get('HLL_PRECISION', 12),
+        )
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def shared(self) -> bool:
+        return is_shared_cache(self.cache)
+
+    def add(self, name: str, delta: int):
+        if not delta or not self.shared:
+            return
+        try:
+            self.cache.incr(self.PREFIX + name, delta)
+        except ValueError:
+            pass  # Compteur absent (expiré, jamais calculé) : le prochain snapshot recompte
+
+    def set(self, name: str, value: int):
+        if not self.shared:
+            return
+        self.cache.set(self.PREFIX + name, value, timeout=None)
+
+    def invalidate(self):
+        """Force un recomptage au prochain snapshot (suppressions non comptées)"""
+        self.cache.delete(self.PREFIX + 'reconciled_at')
+
+    def count(self) -> dict:
+        """Compteurs lus en base (COUNT(*))"""
+        from .models import TrueAnonymousLayer, EmergencyBurn
+        from .partitions import message_models
+
+        return {
+            'layers': TrueAnonymousLayer.objects.count(),
+            'messages': sum(model.objects.count() for model in message_models()),
+            'burns': EmergencyBurn.objects.count(),
+        }
+
+    def reconcile(self) -> dict:
+        """Recompte les compteurs depuis la base"""
+        with self._reconcile_lock:
+            counts = self.count()
+            self.cache.set_many({self.PREFIX + name: value for name, value in counts.items()}, timeout=None)
+            self.cache.set(self.PREFIX + 'reconciled_at', time.time(), timeout=None)
+
+        return counts
+
+    def snapshot(self) -> dict:
+        if not self.shared:
+            return self.count()
+
+        keys = [self.PREFIX + name for name in self.COUNTERS + ('reconciled_at',)]
+        values = self.cache.get_many(keys)
+
+        reconciled_at = values.get(self.PREFIX + 'reconciled_at')
+        if len(values) < len(keys) or time.time() - reconciled_at > self.reconcile_interval:
+            return self.reconcile()
+
+        return {name: max(values[self.PREFIX + name], 0) for name in self.COUNTERS}
+
+    def _bucket_key(self, room_name: str, minute: int) -> str:
+        digest = hashlib.sha256(room_name.encode()).hexdigest()[:16]  # Clé de cache sûre
+        return f'{self.PREFIX}active:{digest}:{minute}'
+
+    def record_activity(self, room_name: str, layer_id):
+        """Ajoute le layer au sketch de la minute courante de la room
+
+        Le processus garde ses propres sketchs de la fenêtre et ne pousse que
+        ceux qui ont changé : un layer qui reparle ne coûte aucun accès cache.
+        """
+        if not self.shared:
+            return  # active_layers lit la base
+
+        minute = int(time.time() // 60)
+        key = self._bucket_key(room_name, minute)
+
+        with self._activity_lock:
+            for stale in [k for k, (m, _) in self._sketches.items() if m <= minute - self.window_minutes]:
+                del self._sketches[stale]
+                self._dirty.discard(stale)
+
+            if key not in self._sketches:
+                self._sketches[key] = (minute, HyperLogLog(self.precision))
+            sketch = self._sketches[key][1]
+            before = bytes(sketch.registers)
+            sketch.add(str(layer_id))
+            if sketch.registers != before:
+                self._dirty.add(key)
+
+            dirty = [(k, bytes(self._sketches[k][1].registers)) for k in self._dirty]
+
+        for dirty_key, registers in dirty:
+            if not self._merge(dirty_key, registers):
+                continue  # Verrou tenu par un autre processus : repoussé au prochain appel
+            with self._activity_lock:
+                entry = self._sketches.get(dirty_key)
+                if entry is None or bytes(entry[1].registers) == registers:
+                    self._dirty.discard(dirty_key)
+
+    def _merge(self, key: str, registers: bytes) -> bool:
+        """Fusionne (max registre par registre) dans le sketch du cache, sous verrou cache.add()
+
+        Sans verrou, deux processus feraient get → fusion → set en parallèle
+        et le dernier set effacerait les layers de l'autre.
+        """
+        lock_key = key + ':lock'
+        if not self.cache.add(lock_key, 1, timeout=self.LOCK_TIMEOUT):
+            return False
+
+        try:
+            sketch = HyperLogLog(self.precision, self.cache.get(key))
+            before = bytes(sketch.registers)
+            sketch.merge(HyperLogLog(self.precision, registers))
+            if sketch.registers != before:
+                self.cache.set(key, bytes(sketch.registers), timeout=(self.window_minutes + 1) * 60)
+        finally:
+            self.cache.delete(lock_key)
+        return True
+
+    def active_layers(self, room_name: str) -> int:
+        """Nombre estimé de layers distincts actifs dans la room sur la fenêtre"""
+        if not self.shared:
+            return self._count_active_layers(room_name)
+
+        minute = int(time.time() // 60)
+        keys = [self._bucket_key(room_name, minute - offset) for offset in range(self.window_minutes)]
+
+        sketch = HyperLogLog(self.precision)
+        for registers in self.cache.get_many(keys).values():
+            sketch.merge(HyperLogLog(self.precision, registers))
+        return sketch.count()
+
+    def _count_active_layers(self, room_name: str) -> int:
+        """Nombre exact de layers actifs, lu en base (cache local)"""
+        from .partitions import message_models
+
+        since = timezone.now() - timezone.timedelta(minutes=self.window_minutes)
+        layer_ids = set()
+        for model in message_models(start=since):
+            layer_ids.update(
+                model.objects.filter(room_name=room_name, timestamp__gte=since)
+                .values_list('layer_id', flat=True).distinct()
+            )
+        return len(layer_ids)
+
+
+_system_stats = None
+_system_stats_lock = threading.Lock()
+
+def get_system_stats() -> SystemStats:
+    """Récupère le service de statistiques du processus"""
+    global _system_stats
+
+    if _system_stats is None:
+        with _system_stats_lock:
+            if _system_stats is None:
+                _system_stats = SystemStats.from_settings()
+
+    return _system_stats
+
+
+def _on_save(sender, instance, created, **kwargs):
+    from .models import AbstractAnonymousMessage, TrueAnonymousLayer, EmergencyBurn
+
+    if not created:
+        return
+
+    try:
+        stats = get_system_stats()
+        if isinstance(instance, AbstractAnonymousMessage):
+            stats.add('messages', 1)
+            stats.record_activity(instance.room_name, instance.layer_id)
+        elif isinstance(instance, TrueAnonymousLayer):
+            stats.add('layers', 1)
+        elif isinstance(instance, EmergencyBurn):
+            stats.add('burns', 1)
+    except Exception as e:
+        # Les statistiques ne doivent jamais faire échouer une écriture
+        logger.warning(f"Stats update failed: {e}")
+
+def connect_signals():
+    # Pas de post_delete : il désactiverait les suppressions rapides de Django
+    # (le collecteur chargerait chaque ligne pour émettre le signal)
+    post_save.connect(_on_save, dispatch_uid='lain_system_stats')
@@ -1,3 +1,1076 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import os
+import tempfile
+import time
+import uuid
+from unittest import mock
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
+from lain_chat.singleflight import SingleFlightCache
 
+from . import burn, layer_keys, partitions
+from .benchmark import run_self_test
+from .db_benchmark import BENCH_TABLE, benchmark_database_split, compare_engine_profiles
+from .encryption import (
+    BATCH_INLINE_THRESHOLD, ENVELOPE_V2, ENVELOPE_V2_HEADER, ENVELOPE_V3, BatchExecutor, KeyRing, LayerEncryption,
+    decrypt_many, encrypt_many,
+)
+from .expiry import ExpiryWorker
+from .fragments import FragmentIntegrityError, FragmentStore
+from .plaintext_cache import PlaintextCache
+from .reencryption import MessageReencryptionJob
+from .routers import AnonymousMappingRouter, atomic_for, move_mapping_rows
+from .stats import HyperLogLog, SystemStats
+from .models import (
+    AnonymousMessage, DataFragment, EmergencyBurn, KeyRotation, LayerKey, LayerMapping, TrueAnonymousLayer,
+)
+
+
+def partitioned(enabled=True):
+    return override_settings(ANONYMIZATION_CONFIG={**settings.ANONYMIZATION_CONFIG, 'PARTITIONED_MESSAGES': enabled})
+
+
+def create_message(model, timestamp=None, room_name='general'):
+    message = model.objects.create(
+        layer_id=uuid.uuid4(),
+        room_name=room_name,
+        content_hash='0' * 64,
+        encrypted_content=b'\x02',
+        encryption_nonce='0' * 24,
+    )
+    if timestamp is not None:
+        # auto_now_add ignore la valeur passée à create()
+        model.objects.filter(pk=message.pk).update(timestamp=timestamp)
+    return message
+
+
+class MessagePartitionTests(TestCase):
+    """Partitions journalières (DDL transactionnel : chaque test repart sans tables)"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.today = self.now.date()
+
+    def days_ago(self, days):
+        return self.now - datetime.timedelta(days=days)
+
+    def test_single_table_when_disabled(self):
+        with partitioned(False):
+            self.assertIs(partitions.message_model_for_write(), AnonymousMessage)
+            self.assertEqual(partitions.message_models(), [AnonymousMessage])
+
+    @partitioned()
+    def test_writes_go_to_todays_partition(self):
+        model = partitions.message_model_for_write()
+        message = create_message(model)
+
+        self.assertEqual(model._meta.db_table, partitions.partition_table(self.today))
+        self.assertIn((self.today, model._meta.db_table), partitions.existing_partitions())
+        self.assertFalse(AnonymousMessage.objects.filter(pk=message.pk).exists())
+        self.assertEqual(partitions.find_message(message.pk).pk, message.pk)
+
+    @partitioned()
+    def test_reads_span_partitions_in_range(self):
+        legacy = create_message(AnonymousMessage, self.days_ago(3))
+        old = create_message(partitions.ensure_partition(self.days_ago(3).date()), self.days_ago(3))
+        recent = create_message(partitions.ensure_partition(self.days_ago(1).date()), self.days_ago(1))
+        current = create_message(partitions.message_model_for_write())
+
+        models = partitions.message_models(start=self.days_ago(2), end=self.now)
+        tables = [model._meta.db_table for model in models]
+        found = {message.pk for model in models for message in model.objects.all()}
+
+        self.assertEqual(tables, [
+            AnonymousMessage._meta.db_table,
+            partitions.partition_table(self.days_ago(1).date()),
+            partitions.partition_table(self.today),
+        ])
+        # La table unique est toujours lue, la partition hors plage jamais
+        self.assertEqual(found, {legacy.pk, recent.pk, current.pk})
+        self.assertNotIn(old.pk, found)
+        self.assertEqual(len(partitions.message_models()), 4)
+
+    @partitioned()
+    def test_drop_expired_partitions(self):
+        expired = partitions.ensure_partition(self.days_ago(10).date())
+        kept = partitions.ensure_partition(self.days_ago(2).date())
+        create_message(expired, self.days_ago(10))
+        create_message(kept, self.days_ago(2))
+
+        dropped = partitions.drop_expired_partitions(retention_days=7)
+
+        self.assertEqual(dropped, [expired._meta.db_table])
+        self.assertEqual(
+            [table for _, table in partitions.existing_partitions()],
+            [kept._meta.db_table]
+        )
+        self.assertEqual(kept.objects.count(), 1)
+
+    @partitioned()
+    def test_ensure_partition_is_idempotent(self):
+        day = self.days_ago(1).date()
+
+        self.assertIs(partitions.ensure_partition(day), partitions.ensure_partition(day))
+        self.assertEqual(len(partitions.existing_partitions()), 1)
+
+
+def temp_key_ring(test):
+    """Trousseau dans un répertoire jetable : jamais les clés de BASE_DIR"""
+    keys_dir = tempfile.TemporaryDirectory()
+    test.addCleanup(keys_dir.cleanup)
+    return KeyRing(keys_dir=keys_dir.name, poll_interval=0)
+
+
+def graveyard_tables(alias='default'):
+    return sorted(
+        table for table in connections[alias].introspection.table_names()
+        if table.startswith(burn.GRAVEYARD_PREFIX)
+    )
+
+
+def count_rows(table, alias='default'):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+# Le reaper tourne dans un thread (autre connexion) : les tests l'appellent eux-mêmes
+@mock.patch('anonymization.burn._reap_in_background')
+class EmergencyBurnTests(TestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        self.layer = TrueAnonymousLayer.objects.create(layer_name='lain')
+        LayerKey.objects.create(layer_id=self.layer.layer_id, seed=b'\x01' * 32)
+        LayerMapping.objects.create(
+            user_hash='0' * 64, layer_id=self.layer.layer_id, encrypted_link=b'link', salt='0' * 32
+        )
+        for _ in range(3):
+            create_message(AnonymousMessage)
+
+    def test_burn_swaps_tables_out(self, reaper):
+        result = burn.burn_all('test', '0' * 16, 'test')
+
+        self.assertEqual(AnonymousMessage.objects.count(), 0)
+        self.assertEqual(TrueAnonymousLayer.all_objects.count(), 0)
+        self.assertEqual(LayerKey.objects.count(), 0)
+        self.assertEqual(LayerMapping.objects.count(), 0)
+        self.assertTrue(EmergencyBurn.objects.filter(pk=result['burn_id']).exists())
+        reaper.assert_called_once()
+
+        burn_id = uuid.UUID(result['burn_id'])
+        graveyard = graveyard_tables()
+        self.assertIn(burn._graveyard_table(burn_id, 'layer_keys'), graveyard)
+        self.assertEqual(count_rows(burn._graveyard_table(burn_id, 'anonymous_messages')), 3)
+        self.assertEqual(count_rows(burn._graveyard_table(burn_id, 'anonymous_layers')), 1)
+        self.assertEqual(graveyard_tables('anonymous_mapping'), [burn._graveyard_table(burn_id, 'anonymous_mapping')])
+
+    def test_seeds_are_shredded_before_swap(self, reaper):
+        result = burn.burn_all('test', '0' * 16, 'test')
+
+        table = burn._graveyard_table(uuid.UUID(result['burn_id']), 'layer_keys')
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)} WHERE seed IS NOT NULL')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_messages_only_keeps_layers(self, reaper):
+        burn.burn_all('test', '0' * 16, 'test', messages_only=True)
+
+        self.assertEqual(AnonymousMessage.objects.count(), 0)
+        self.assertEqual(TrueAnonymousLayer.all_objects.count(), 1)
+        self.assertIsNotNone(LayerKey.objects.get(pk=self.layer.layer_id).purged_at)
+
+    def test_reap_resumes_after_interruption(self, reaper):
+        result = burn.burn_all('test', '0' * 16, 'test')
+        total = sum(count_rows(table) for table in graveyard_tables())
+        total += sum(count_rows(table, 'anonymous_mapping') for table in graveyard_tables('anonymous_mapping'))
+
+        # Processus interrompu après la première table
+        reap_table = burn._reap_table
+        calls = []
+
+        def crash_after_first(alias, table):
+            calls.append(table)
+            if len(calls) > 1:
+                raise RuntimeError("worker killed")
+            return reap_table(alias, table)
+
+        with mock.patch('anonymization.burn._reap_table', side_effect=crash_after_first):
+            partial = burn.reap_burned_tables()
+        self.assertEqual(len(graveyard_tables()) + len(graveyard_tables('anonymous_mapping')), result['tables'] - 1)
+
+        remaining = burn.reap_burned_tables()
+
+        self.assertEqual(graveyard_tables(), [])
+        self.assertEqual(graveyard_tables('anonymous_mapping'), [])
+        self.assertEqual(partial + remaining, total)
+        self.assertEqual(EmergencyBurn.objects.get(pk=result['burn_id']).objects_destroyed_count, total)
+        self.assertEqual(burn.reap_burned_tables(), 0)
+
+
+class LayerBurnStatusViewTests(TestCase):
+    """Seul le propriétaire du layer voit la progression de sa purge"""
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        User = get_user_model()
+        self.owner = User.objects.create_user('lain', password='present day')
+        self.other = User.objects.create_user('alice', password='present day')
+
+        self.layer = TrueAnonymousLayer.objects.create(layer_name='lain')
+        LayerKey.objects.create(layer_id=self.layer.layer_id, seed=None, shredded_at=timezone.now(), purged_count=4)
+        LayerMapping.objects.create(
+            user_hash=LayerMapping.blind_index(self.owner.id, settings.ENCRYPTION_CONFIG.get('BLIND_INDEX_EPOCH', 0)),
+            layer_id=self.layer.layer_id, encrypted_link=b'link', salt='0' * 32
+        )
+        self.url = reverse('anonymization:layer_burn_status', args=[self.layer.layer_id])
+
+    def get_status(self, user=None):
+        if user is not None:
+            self.client.force_login(user)
+        return self.client.get(self.url, HTTP_HOST='localhost')
+
+    def test_owner_sees_progress(self):
+        response = self.get_status(self.owner)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['messages_purged'], 4)
+        self.assertFalse(response.json()['completed'])
+
+    def test_others_get_not_found(self):
+        self.assertEqual(self.get_status().status_code, 404)
+        self.assertEqual(self.get_status(self.other).status_code, 404)
+
+    def test_unknown_layer_looks_the_same(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(
+            reverse('anonymization:layer_burn_status', args=[uuid.uuid4()]), HTTP_HOST='localhost'
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), self.get_status(self.other).json())
+
+
+@mock.patch.object(SystemStats, 'shared', new_callable=mock.PropertyMock, return_value=True)
+class SharedSystemStatsTests(TestCase):
+    """Deux instances sur un même cache simulent deux workers"""
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches['default'].clear()
+        self.workers = [SystemStats(window_minutes=2), SystemStats(window_minutes=2)]
+
+    def test_workers_merge_their_sketches(self, shared):
+        expected = HyperLogLog(12)
+        for i in range(50):
+            self.workers[i % 2].record_activity('general', f'layer-{i}')
+            expected.add(f'layer-{i}')
+
+        # Même estimation qu'un sketch unique ayant tout vu
+        self.assertEqual(self.workers[0].active_layers('general'), expected.count())
+
+    def test_locked_sketch_is_pushed_later(self, shared):
+        first, second = self.workers
+
+        with mock.patch.object(first.cache, 'add', return_value=False):
+            first.record_activity('general', 'layer-a')
+        self.assertEqual(second.active_layers('general'), 0)
+
+        first.record_activity('general', 'layer-b')
+        self.assertEqual(second.active_layers('general'), 2)
+
+    def test_repeated_layer_skips_cache(self, shared):
+        first = self.workers[0]
+        first.record_activity('general', 'layer-a')
+
+        with mock.patch.object(first.cache, 'add') as add:
+            first.record_activity('general', 'layer-a')
+        add.assert_not_called()
+
+
+class LocalSystemStatsTests(TestCase):
+    """Cache local (LocMemCache) : compteurs et layers actifs lus en base"""
+
+    def test_local_cache_reads_database(self):
+        stats = SystemStats()
+        self.assertFalse(stats.shared)
+
+        TrueAnonymousLayer.objects.create(layer_name='lain')
+        message = create_message(AnonymousMessage)
+        stats.set('messages', 0)
+
+        self.assertEqual(stats.snapshot()['layers'], 1)
+        self.assertEqual(stats.snapshot()['messages'], 1)
+        self.assertEqual(stats.active_layers(message.room_name), 1)
+
+
+@mock.patch.object(SingleFlightCache, 'shared', new_callable=mock.PropertyMock, return_value=True)
+class SingleFlightInvalidationTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import caches
+
+        caches['default'].clear()
+        self.cache = SingleFlightCache(ttl=60)
+        self.value = 'old'
+
+    def get(self):
+        return self.cache.get_or_compute('layers:test', lambda: self.value, shared_only=True)
+
+    def test_invalidation_waits_for_commit(self, shared):
+        self.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.value = 'new'
+            self.cache.invalidate('layers:test')
+            # Avant le commit, l'ancienne valeur reste servie (et n'est pas recalculée)
+            self.assertEqual(self.get(), 'old')
+
+        self.assertEqual(self.get(), 'new')
+
+    def test_late_recompute_does_not_resurrect_old_value(self, shared):
+        self.get()
+        _, version = self.cache._lookup('layers:test')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cache.invalidate('layers:test')
+        # Recalcul commencé avant l'invalidation, terminé après
+        self.cache._store('layers:test', 'old', 60, version)
+        self.value = 'new'
+
+        self.assertEqual(self.get(), 'new')
+
+    def test_local_cache_is_bypassed(self, shared):
+        shared.return_value = False
+        self.get()
+        self.value = 'new'
+
+        self.assertEqual(self.get(), 'new')
+
+
+class FragmentStoreTests(TestCase):
+
+    def setUp(self):
+        self.store = FragmentStore(fragment_size=4, batch_size=2)
+
+    def test_round_trip(self):
+        blob = b'present day, present time'
+        manifest = self.store.write(iter([blob[:7], blob[7:]]), 'export')
+
+        self.assertEqual(manifest.fragment_count, 7)
+        self.assertEqual(self.store.read_all(manifest.belongs_to_id, manifest), blob)
+
+    def test_missing_tail_is_detected_with_manifest(self):
+        manifest = self.store.write(b'0123456789', 'export')
+        DataFragment.objects.filter(belongs_to_id=manifest.belongs_to_id, fragment_index=2).delete()
+
+        with self.assertRaises(FragmentIntegrityError):
+            self.store.read_all(manifest.belongs_to_id, manifest)
+
+    def test_existing_blob_is_not_touched(self):
+        manifest = self.store.write(b'lain', 'export')
+
+        with self.assertRaises(FragmentIntegrityError):
+            self.store.write(b'alice', 'export', manifest.belongs_to_id)
+        self.assertEqual(self.store.read_all(manifest.belongs_to_id, manifest), b'lain')
+
+    def test_failed_write_removes_only_its_fragments(self):
+        other = self.store.write(b'navi', 'export')
+
+        def failing_source():
+            yield b'0123456789'  # 3 fragments, dont 2 déjà insérés
+            raise OSError("source closed")
+
+        belongs_to_id = uuid.uuid4()
+        with self.assertRaises(OSError):
+            self.store.write(failing_source(), 'export', belongs_to_id)
+
+        self.assertFalse(self.store.exists(belongs_to_id))
+        self.assertEqual(self.store.read_all(other.belongs_to_id, other), b'navi')
+
+
+class LayerShreddingTests(TestCase):
+
+    def setUp(self):
+        self.encryption = LayerEncryption(temp_key_ring(self), envelope_version=ENVELOPE_V3)
+        self.layer = TrueAnonymousLayer.objects.create(layer_name='lain')
+        self.addCleanup(layer_keys.get_layer_key_cache().clear)
+
+    def test_secure_delete_is_on(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA secure_delete')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    @mock.patch('anonymization.layer_keys.get_layer_purger')
+    def test_shredded_layer_no_longer_decrypts(self, purger):
+        layer_aead = self.encryption.resolve_layer_aead(self.layer.layer_id)
+        encrypted, nonce, _ = self.encryption.encrypt_message('present day', layer_aead=layer_aead)
+        self.assertEqual(encrypted[:1], bytes((ENVELOPE_V3,)))
+        self.assertEqual(self.encryption.decrypt_message(encrypted, nonce), 'present day')
+
+        with mock.patch('anonymization.layer_keys.checkpoint_layer_keys') as checkpoint:
+            with self.captureOnCommitCallbacks(execute=True):
+                layer_keys.shred_layer(self.layer.layer_id)
+
+        checkpoint.assert_called_once()
+        purger.return_value.schedule.assert_called_once_with(self.layer.layer_id)
+        self.assertIsNone(LayerKey.objects.get(pk=self.layer.layer_id).seed)
+        with self.assertRaises(ValueError):
+            self.encryption.decrypt_message(encrypted, nonce)
+        # Et aucune nouvelle graine pour ce layer
+        with self.assertRaises(layer_keys.LayerKeyShredded):
+            self.encryption.resolve_layer_aead(self.layer.layer_id)
+
+    def test_checkpoint_inside_transaction_does_not_raise(self):
+        # TestCase : transaction ouverte, SQLite refuse le checkpoint
+        with self.assertLogs('lain_encryption', 'WARNING'):
+            self.assertFalse(layer_keys.checkpoint_layer_keys())
+
+
+class KeyRingTests(SimpleTestCase):
+
+    def setUp(self):
+        keys_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(keys_dir.cleanup)
+        self.keys_dir = keys_dir.name
+        self.key_ring = KeyRing(keys_dir=self.keys_dir, poll_interval=0)
+
+    def expire(self, key_ring):
+        date = time.time() - KeyRing.ROTATION_INTERVAL - 1
+        key_ring._write_file(os.path.join(self.keys_dir, 'key_date.txt'), str(date).encode())
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_default_directory_is_outside_the_tree(self):
+        # manage.py test : ENCRYPTION_CONFIG['KEYS_DIR'] pointe vers un répertoire jetable
+        self.assertNotEqual(
+            os.path.realpath(KeyRing(poll_interval=0).keys_dir),
+            os.path.realpath(os.path.join(settings.BASE_DIR, '.lain_keys'))
+        )
+
+    def test_creates_key_in_empty_directory(self):
+        self.assertEqual(sorted(os.listdir(self.keys_dir)), ['key_date.txt', 'keys.lock', 'master.key'])
+        self.assertEqual(len(self.key_ring.keys), 1)
+
+    def test_old_ciphertexts_decrypt_after_rotation(self):
+        encryptions = {
+            version: LayerEncryption(self.key_ring, envelope_version=version)
+            for version in (1, ENVELOPE_V2)  # 1 : jeton Fernet, déchiffré par MultiFernet
+        }
+        encrypted = {
+            version: encryption.encrypt_message('present day', 'layer', 'wired')
+            for version, encryption in encryptions.items()
+        }
+        old_key_id = self.key_ring.current_key_id
+
+        self.expire(self.key_ring)
+        self.key_ring.load()
+
+        self.assertNotEqual(self.key_ring.current_key_id, old_key_id)
+        self.assertEqual(len(self.key_ring.keys), 2)
+        for version, (data, nonce, salt) in encrypted.items():
+            self.assertEqual(encryptions[version].decrypt_message(data, nonce, salt), 'present day')
+
+    def test_watcher_picks_up_rotation_by_another_process(self):
+        watching = KeyRing(keys_dir=self.keys_dir, poll_interval=0.02)
+        self.addCleanup(watching.stop_watching)
+        watching.start_watching()
+        old_snapshot = watching.snapshot
+
+        self.expire(self.key_ring)
+        self.key_ring.load()
+
+        self.assertTrue(self.wait_for(lambda: watching.current_key_id == self.key_ring.current_key_id))
+        self.assertIn(old_snapshot.master_key, watching.keys)
+        self.assertGreaterEqual(watching.status()['refresh_count'], 1)
+
+    def test_invalid_key_keeps_loaded_snapshot(self):
+        snapshot = self.key_ring.snapshot
+        with open(os.path.join(self.keys_dir, 'master.key'), 'wb') as f:
+            f.write(b'not a key')
+
+        with self.assertRaises(ValueError):
+            self.key_ring.load()
+
+        self.assertIs(self.key_ring.snapshot, snapshot)
+        with open(os.path.join(self.keys_dir, 'master.key'), 'rb') as f:
+            self.assertEqual(f.read(), b'not a key')  # Jamais régénérée
+
+    def test_watcher_counts_failed_reloads(self):
+        watching = KeyRing(keys_dir=self.keys_dir, poll_interval=0.02)
+        self.addCleanup(watching.stop_watching)
+        with open(os.path.join(self.keys_dir, 'master.key'), 'wb') as f:
+            f.write(b'not a key')
+
+        with self.assertLogs('lain_encryption', 'ERROR'):
+            watching.start_watching()
+            self.assertTrue(self.wait_for(lambda: watching.refresh_errors >= 1))
+        self.assertEqual(watching.current_key_id, self.key_ring.current_key_id)
+
+
+class ExpiryWorkerTests(TestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        self.worker = ExpiryWorker(batch_size=2, min_batch=1, max_batch=8, target_latency=0.05, max_pause=1.0)
+        self.now = timezone.now()
+
+    def expiring(self, model, obj, minutes):
+        model.objects.filter(pk=obj.pk).update(auto_destroy_at=self.now + datetime.timedelta(minutes=minutes))
+
+    def test_slow_batches_shrink_and_pause(self):
+        self.worker._adapt(0.2)
+        self.assertEqual(self.worker.batch_size, 1)
+        self.assertEqual(self.worker.pause, 0.2)
+
+        self.worker._adapt(0.001)
+        self.assertEqual(self.worker.batch_size, 2)
+        self.assertEqual(self.worker.pause, 0.1)
+
+        for _ in range(20):
+            self.worker._adapt(0.001)
+        self.assertEqual(self.worker.batch_size, 8)
+        self.assertEqual(self.worker.pause, 0.0)
+
+    def test_only_expired_messages_are_deleted(self):
+        expired = [create_message(AnonymousMessage) for _ in range(5)]
+        for message in expired:
+            self.expiring(AnonymousMessage, message, -1)
+        kept = create_message(AnonymousMessage)
+        self.expiring(AnonymousMessage, kept, 10)
+        forever = create_message(AnonymousMessage)
+
+        self.assertEqual(self.worker.expire_messages(), 5)
+        self.assertEqual(set(AnonymousMessage.objects.values_list('pk', flat=True)), {kept.pk, forever.pk})
+
+    @mock.patch('anonymization.layer_keys.get_layer_purger')
+    def test_expired_layers_are_tombstoned_and_purged_once(self, get_purger):
+        purger = get_purger.return_value
+        expired = TrueAnonymousLayer.objects.create(layer_name='expired')
+        self.expiring(TrueAnonymousLayer, expired, -1)
+        live = TrueAnonymousLayer.objects.create(layer_name='live')
+
+        with mock.patch('anonymization.layer_keys.purge_shredded_layers') as synchronous_purge:
+            with self.captureOnCommitCallbacks(execute=True):
+                stats = self.worker.run_once()
+
+        self.assertEqual(stats['layers'], 1)
+        self.assertIsNotNone(TrueAnonymousLayer.all_objects.get(pk=expired.pk).burned_at)
+        self.assertIsNone(LayerKey.objects.get(pk=expired.pk).seed)
+        self.assertTrue(TrueAnonymousLayer.objects.filter(pk=live.pk).exists())
+        # Une seule purge, dans le thread du LayerPurger
+        purger.schedule.assert_called_once_with(expired.pk)
+        purger.resume_pending.assert_called_once()
+        synchronous_purge.assert_not_called()
+
+        # Tombstoné : plus jamais repris par l'expiration
+        self.assertEqual(self.worker.run_once()['layers'], 0)
+
+    def test_purge_is_idempotent(self):
+        layer = TrueAnonymousLayer.objects.create(layer_name='lain')
+        LayerKey.objects.create(layer_id=layer.layer_id, seed=None, shredded_at=timezone.now())
+        message = create_message(AnonymousMessage)
+        AnonymousMessage.objects.filter(pk=message.pk).update(layer_id=layer.layer_id)
+        purger = layer_keys.LayerPurger(batch_size=1)
+
+        self.assertEqual(purger.purge(layer.layer_id), 1)
+        self.assertEqual(purger.purge(layer.layer_id), 0)
+        self.assertFalse(TrueAnonymousLayer.all_objects.filter(pk=layer.pk).exists())
+        self.assertIsNotNone(LayerKey.objects.get(pk=layer.layer_id).purged_at)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class MessageReencryptionJobTests(TestCase):
+
+    def setUp(self):
+        self.key_ring = temp_key_ring(self)
+        self.encryption = LayerEncryption(self.key_ring, envelope_version=ENVELOPE_V2)
+        self.now = timezone.now()
+
+    def create_messages(self, model, count, text='present day'):
+        messages = []
+        for _ in range(count):
+            encrypted, nonce, _ = self.encryption.encrypt_message(text)
+            messages.append(model.objects.create(
+                layer_id=uuid.uuid4(), room_name='wired', content_hash='0' * 64,
+                encrypted_content=encrypted, encryption_nonce=nonce,
+            ))
+        return messages
+
+    def rotate_key(self):
+        date = time.time() - KeyRing.ROTATION_INTERVAL - 1
+        self.key_ring._write_file(os.path.join(self.key_ring.keys_dir, 'key_date.txt'), str(date).encode())
+        self.key_ring.load()
+
+    def job(self, progress=None):
+        with mock.patch('anonymization.reencryption.get_encryption_instance', return_value=self.encryption):
+            return MessageReencryptionJob(chunk_size=2, workers=2, progress=progress)
+
+    def interrupt_after(self, chunks):
+        calls = []
+
+        def progress(processed, affected, rate):
+            calls.append(processed)
+            if len(calls) >= chunks:
+                raise Interrupted()
+        return progress
+
+    def key_ids(self, models):
+        return {
+            ENVELOPE_V2_HEADER.unpack_from(bytes(content))[1]
+            for model in models
+            for content in model.objects.values_list('encrypted_content', flat=True)
+        }
+
+    def assert_all_readable(self, models):
+        for model in models:
+            for message in model.objects.all():
+                self.assertEqual(self.encryption.decrypt_message(message.encrypted_content, None), 'present day')
+
+    def test_rewrites_every_message_under_the_new_key(self):
+        self.create_messages(AnonymousMessage, 5)
+        self.rotate_key()
+
+        rotation = self.job().run()
+
+        self.assertIsNotNone(rotation.completed_at)
+        self.assertEqual(rotation.affected_objects_count, 5)
+        self.assertEqual(self.key_ids([AnonymousMessage]), {self.key_ring.current_key_id})
+        self.assert_all_readable([AnonymousMessage])
+
+    def test_messages_on_the_new_key_are_skipped(self):
+        self.create_messages(AnonymousMessage, 3)
+        self.rotate_key()
+        self.create_messages(AnonymousMessage, 2)
+
+        rotation = self.job().run()
+
+        self.assertEqual(rotation.affected_objects_count, 3)
+        self.assertEqual(self.job().run().affected_objects_count, 0)  # Nouveau job : rien à refaire
+
+    def test_resumes_after_interruption(self):
+        self.create_messages(AnonymousMessage, 5)
+        self.rotate_key()
+
+        with self.assertRaises(Interrupted):
+            self.job(self.interrupt_after(1)).run()
+        checkpoint = KeyRotation.objects.get(completed_at__isnull=True)
+        self.assertIsNotNone(checkpoint.last_processed_id)
+        self.assertEqual(checkpoint.affected_objects_count, 2)
+
+        processed = []
+        rotation = self.job(lambda done, affected, rate: processed.append(done)).run()
+
+        self.assertEqual(rotation.pk, checkpoint.pk)
+        self.assertEqual(processed[-1], 3)  # Seuls les messages après le checkpoint sont relus
+        self.assertEqual(rotation.affected_objects_count, 5)
+        self.assertEqual(self.key_ids([AnonymousMessage]), {self.key_ring.current_key_id})
+
+    @partitioned()
+    def test_walks_partitions_and_resumes_in_the_current_table(self):
+        older = partitions.ensure_partition((self.now - datetime.timedelta(days=2)).date())
+        newer = partitions.ensure_partition(self.now.date())
+        models = [AnonymousMessage, older, newer]
+        for model in models:
+            self.create_messages(model, 3)
+        self.rotate_key()
+
+        # Interrompu dans la deuxième table (2 blocs dans la première)
+        with self.assertRaises(Interrupted):
+            self.job(self.interrupt_after(3)).run()
+        checkpoint = KeyRotation.objects.get(completed_at__isnull=True)
+        self.assertEqual(checkpoint.last_processed_table, older._meta.db_table)
+
+        processed = []
+        rotation = self.job(lambda done, affected, rate: processed.append(done)).run()
+
+        self.assertEqual(processed[-1], 4)  # 1 restant dans older + 3 dans newer
+        self.assertEqual(rotation.affected_objects_count, 9)
+        self.assertEqual(rotation.last_processed_table, newer._meta.db_table)
+        self.assertEqual(self.key_ids(models), {self.key_ring.current_key_id})
+        self.assert_all_readable(models)
+
+
+def create_mapping(using=None):
+    return LayerMapping.objects.using(using).create(
+        user_hash=uuid.uuid4().hex, layer_id=uuid.uuid4(), encrypted_link=b'link', salt='0' * 32,
+    )
+
+
+class AnonymousMappingRouterTests(TestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        self.router = AnonymousMappingRouter()
+
+    def test_routes_mappings_only(self):
+        self.assertEqual(self.router.db_for_read(LayerMapping), 'anonymous_mapping')
+        self.assertEqual(self.router.db_for_write(LayerMapping), 'anonymous_mapping')
+        self.assertIsNone(self.router.db_for_write(AnonymousMessage))
+        self.assertIsNone(self.router.db_for_read(TrueAnonymousLayer))
+
+    def test_migrates_mappings_only_into_mapping_database(self):
+        self.assertTrue(self.router.allow_migrate('anonymous_mapping', 'anonymization', 'layermapping'))
+        self.assertFalse(self.router.allow_migrate('default', 'anonymization', 'layermapping'))
+        self.assertFalse(self.router.allow_migrate('anonymous_mapping', 'anonymization', 'anonymousmessage'))
+        self.assertTrue(self.router.allow_migrate('default', 'anonymization', 'anonymousmessage'))
+
+    @override_settings(FRAGMENT_CONFIG={'DATABASES': ['default', 'anonymous_mapping']})
+    def test_fragment_databases_allowed(self):
+        self.assertTrue(AnonymousMappingRouter().allow_migrate('anonymous_mapping', 'anonymization', 'datafragment'))
+
+    def test_atomic_for_opens_one_transaction_per_database(self):
+        with mock.patch('anonymization.routers.transaction.atomic', wraps=transaction.atomic) as atomic:
+            with atomic_for(LayerMapping, AnonymousMessage, TrueAnonymousLayer):
+                pass
+        self.assertEqual([call.kwargs['using'] for call in atomic.call_args_list], ['anonymous_mapping', 'default'])
+
+    def test_atomic_for_rolls_back_both_databases(self):
+        with self.assertRaises(Interrupted):
+            with atomic_for(LayerMapping, AnonymousMessage):
+                create_mapping()
+                create_message(AnonymousMessage)
+                raise Interrupted()
+
+        self.assertFalse(LayerMapping.objects.exists())
+        self.assertFalse(AnonymousMessage.objects.exists())
+
+
+class MoveLayerMappingsTests(TransactionTestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        # Installation antérieure au routeur : la table existe aussi dans default
+        with connections['default'].schema_editor() as editor:
+            editor.create_model(LayerMapping)
+        self.addCleanup(self.drop_legacy_table)
+
+    def drop_legacy_table(self):
+        with connections['default'].schema_editor() as editor:
+            editor.delete_model(LayerMapping)
+
+    def create_legacy_mappings(self, count):
+        created_at = timezone.now() - datetime.timedelta(days=30)
+        mappings = [create_mapping(using='default') for _ in range(count)]
+        LayerMapping.objects.using('default').update(created_at=created_at)
+        return {mapping.pk for mapping in mappings}, created_at
+
+    def test_moves_rows_into_mapping_database(self):
+        pks, created_at = self.create_legacy_mappings(5)
+
+        output = io.StringIO()
+        call_command('move_layer_mappings', batch_size=2, stdout=output)
+
+        self.assertIn('anonymization.LayerMapping: 5 rows moved', output.getvalue())
+        self.assertFalse(LayerMapping.objects.using('default').exists())
+        self.assertEqual(set(LayerMapping.objects.values_list('pk', flat=True)), pks)
+        # Dates d'origine conservées malgré auto_now_add
+        self.assertEqual(set(LayerMapping.objects.values_list('created_at', flat=True)), {created_at})
+
+    def test_resumes_without_duplicates(self):
+        pks, _ = self.create_legacy_mappings(3)
+        # Lot copié mais pas encore supprimé de default (interruption entre les deux)
+        LayerMapping.objects.bulk_create(list(LayerMapping.objects.using('default').all()[:2]))
+
+        self.assertEqual(move_mapping_rows(batch_size=2), {'anonymization.LayerMapping': 3})
+        self.assertEqual(set(LayerMapping.objects.values_list('pk', flat=True)), pks)
+
+    def test_dry_run_counts_only(self):
+        self.create_legacy_mappings(2)
+
+        self.assertEqual(move_mapping_rows(dry_run=True), {'anonymization.LayerMapping': 2})
+        self.assertEqual(LayerMapping.objects.using('default').count(), 2)
+        self.assertFalse(LayerMapping.objects.exists())
+
+
+class DbBenchmarkTests(SimpleTestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def assert_real_databases_untouched(self):
+        for alias in ('default', 'anonymous_mapping'):
+            self.assertNotIn(BENCH_TABLE, connections[alias].introspection.table_names())
+
+    def test_database_split_runs_on_scratch_files(self):
+        results = benchmark_database_split(threads=2, writes=3)
+
+        split = results['split_databases']
+        self.assertEqual(split['writes'] + split['locked_errors'], 6)
+        self.assertEqual(len(split['databases']), 2)
+        self.assertNotIn('default', split['databases'])
+        self.assert_real_databases_untouched()
+
+    def test_engine_profiles_run_on_scratch_files(self):
+        results = compare_engine_profiles(threads=2, writes=3)
+
+        # Moteur stock : lecture puis écriture concurrentes, des « database is locked » sont attendus
+        self.assertEqual(results['stock']['writes'] + results['stock']['locked_errors'], 6)
+        self.assertEqual(results['tuned']['engines'], ['lain_chat.sqlite_backend'])
+        self.assertNotIn('lain_bench_tuned', connections.settings)
+        self.assert_real_databases_untouched()
+
+
+class PlaintextCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache = PlaintextCache(revocation_interval=1)
+        self.message_id = uuid.uuid4()
+        self.layer_id = uuid.uuid4()
+        self.cache.put(self.message_id, 'present day', self.layer_id)
+
+    def age_revocations(self, intervals):
+        self.cache._revocations_checked = time.monotonic() - intervals * self.cache.revocation_interval
+
+    def test_get_refreshes_revocations_in_background(self):
+        self.age_revocations(1.5)
+
+        with mock.patch.object(self.cache, '_refresh_revocations') as refresh, self.assertNumQueries(0):
+            self.assertEqual(self.cache.get(self.message_id), 'present day')
+            self.cache._revocation_refresh.join()
+
+        refresh.assert_called_once()
+
+    def test_get_is_safe_from_async_code(self):
+        self.age_revocations(1.5)
+
+        async def read():
+            return self.cache.get(self.message_id)
+
+        with mock.patch.object(self.cache, '_refresh_revocations'):
+            self.assertEqual(asyncio.run(read()), 'present day')
+            self.cache._revocation_refresh.join()
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_entries_not_served_without_recent_revocation_check(self):
+        self.age_revocations(2.5)
+
+        with mock.patch.object(self.cache, '_refresh_revocations'):
+            self.assertIsNone(self.cache.get(self.message_id))
+            self.cache._revocation_refresh.join()
+
+    def test_sync_evicts_layers_shredded_elsewhere(self):
+        other_id = uuid.uuid4()
+        self.cache.put(other_id, 'other layer', uuid.uuid4())
+        LayerKey.objects.create(layer_id=self.layer_id, seed=None, shredded_at=timezone.now())
+
+        self.cache.sync_revocations()
+
+        self.assertIsNone(self.cache.get(self.message_id))
+        self.assertEqual(self.cache.get(other_id), 'other layer')
+
+    def test_sync_clears_on_emergency_burn(self):
+        EmergencyBurn.objects.create(burn_type='total', objects_destroyed_count=0, triggered_by_hash='0' * 64)
+
+        self.cache.sync_revocations()
+
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+
+@override_settings(ENCRYPTION_CONFIG={
+    **settings.ENCRYPTION_CONFIG, 'BLIND_INDEX_EPOCH': 0, 'FRAGMENT_KEY': Fernet.generate_key().decode(),
+})
+class LayerMappingBlindIndexTests(TestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+
+        self.user = get_user_model().objects.create_user('lain', password='present day')
+
+    def epoch(self, epoch):
+        return override_settings(ENCRYPTION_CONFIG={**settings.ENCRYPTION_CONFIG, 'BLIND_INDEX_EPOCH': epoch})
+
+    def test_index_is_deterministic_per_epoch_and_layer(self):
+        layer_id = uuid.uuid4()
+
+        self.assertEqual(LayerMapping.blind_index(self.user.id, 0), LayerMapping.blind_index(self.user.id))
+        self.assertNotEqual(LayerMapping.blind_index(self.user.id, 0), LayerMapping.blind_index(self.user.id, 1))
+        self.assertNotEqual(LayerMapping.blind_index(self.user.id, 0), LayerMapping.blind_index(self.user.id, 0, layer_id))
+        self.assertEqual(LayerMapping.blind_index(self.user.id, 0, layer_id), LayerMapping.blind_index(self.user.id, 0, layer_id))
+
+    def test_epoch_rollover_keeps_previous_epoch_only(self):
+        mapping = LayerMapping.objects.create(
+            user_hash=LayerMapping.blind_index(self.user.id, 0), layer_id=uuid.uuid4(),
+            encrypted_link=b'link', salt='epoch:0',
+        )
+
+        with self.epoch(1):
+            self.assertEqual(list(LayerMapping.for_user(self.user.id)), [mapping])
+            self.assertTrue(LayerMapping.for_user_layer(self.user.id, mapping.layer_id).exists())
+        with self.epoch(2):
+            self.assertFalse(LayerMapping.for_user(self.user.id).exists())
+            self.assertFalse(LayerMapping.for_user_layer(self.user.id, mapping.layer_id).exists())
+
+    def test_fragments_are_not_linkable(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('anonymization:fragment_identity'), data='{"fragment_count": 3}',
+            content_type='application/json', HTTP_HOST='localhost'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        layer_ids = [uuid.UUID(fragment['id']) for fragment in response.json()['fragments']]
+        user_hashes = set(LayerMapping.objects.values_list('user_hash', flat=True))
+        self.assertEqual(len(user_hashes), 3)
+        self.assertNotIn(LayerMapping.blind_index(self.user.id), user_hashes)
+
+        # Hors de la liste des layers, mais chaque fragment reste vérifiable par son propriétaire
+        self.assertFalse(LayerMapping.for_user(self.user.id).exists())
+        for layer_id in layer_ids:
+            self.assertTrue(LayerMapping.for_user_layer(self.user.id, layer_id).exists())
+
+
+class BatchEncryptionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.encryption = LayerEncryption(temp_key_ring(self), envelope_version=ENVELOPE_V2)
+        patcher = mock.patch('anonymization.encryption.get_encryption_instance', return_value=self.encryption)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.executor = BatchExecutor(2)
+        self.addCleanup(self.executor.shutdown)
+        patcher = mock.patch('anonymization.encryption._get_batch_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def round_trip(self, count):
+        messages = [f'message {i}' for i in range(count)]
+
+        sealed = encrypt_many(messages)
+        self.assertTrue(all(result.ok for result in sealed))
+        opened = decrypt_many(result.value for result in sealed)
+
+        self.assertEqual([result.value for result in opened], messages)
+
+    def test_round_trip_inline(self):
+        with mock.patch.object(self.executor, 'map') as pool_map:
+            self.round_trip(BATCH_INLINE_THRESHOLD - 1)
+        pool_map.assert_not_called()
+
+    def test_round_trip_in_pool_keeps_order(self):
+        with mock.patch.object(self.executor, 'map', wraps=self.executor.map) as pool_map:
+            self.round_trip(200)
+
+        # Tranches dimensionnées sur executor.workers : 200 messages / (2 workers * 4) = 25 par tranche
+        chunks = list(pool_map.call_args_list[0].args[1])
+        self.assertEqual([len(chunk) for chunk in chunks], [25] * 8)
+
+    def test_partial_failure_is_reported_per_item(self):
+        sealed = [result.value for result in encrypt_many(f'message {i}' for i in range(100))]
+        encrypted_data, nonce, salt = sealed[42]
+        sealed[42] = (encrypted_data[:-1] + bytes([encrypted_data[-1] ^ 1]), nonce, salt)
+
+        results = decrypt_many(sealed)
+
+        self.assertEqual(len(results), 100)
+        self.assertFalse(results[42].ok)
+        self.assertIsNone(results[42].value)
+        self.assertTrue(results[42].error)
+        self.assertEqual([result.value for i, result in enumerate(results) if i != 42],
+                         [f'message {i}' for i in range(100) if i != 42])
+
+
+class EnvelopeV2Tests(SimpleTestCase):
+
+    def setUp(self):
+        self.key_ring = temp_key_ring(self)
+        self.v1 = LayerEncryption(self.key_ring, envelope_version=1)
+        self.v2 = LayerEncryption(self.key_ring, envelope_version=ENVELOPE_V2)
+
+    def seal(self, text='present day'):
+        encrypted, nonce, _ = self.v2.encrypt_message(text)
+        return bytearray(encrypted), nonce
+
+    def assert_rejected(self, encrypted, nonce):
+        with self.assertRaises(ValueError):
+            self.v2.decrypt_message(bytes(encrypted), nonce)
+
+    def test_header_layout(self):
+        encrypted, nonce = self.seal()
+
+        version, key_id, header_nonce = ENVELOPE_V2_HEADER.unpack_from(encrypted)
+        self.assertEqual(version, ENVELOPE_V2)
+        self.assertEqual(key_id, self.key_ring.current_key_id)
+        self.assertEqual(header_nonce.hex(), nonce)
+        self.assertEqual(len(encrypted), ENVELOPE_V2_HEADER.size + len('present day') + 16)
+
+    def test_v1_and_v2_read_each_other(self):
+        token, nonce, salt = self.v1.encrypt_message('legacy', 'layer', 'general')
+        self.assertEqual(bytes(token[:1]), b'g')  # Token Fernet
+        self.assertEqual(self.v2.decrypt_message(token, nonce, salt), 'legacy')
+
+        encrypted, nonce = self.seal()
+        self.assertEqual(self.v1.decrypt_message(bytes(encrypted), nonce), 'present day')
+
+    def test_truncated_envelope_is_rejected(self):
+        encrypted, nonce = self.seal()
+
+        for size in (0, 1, ENVELOPE_V2_HEADER.size, ENVELOPE_V2_HEADER.size + 15, len(encrypted) - 1):
+            with self.subTest(size=size):
+                self.assert_rejected(encrypted[:size], nonce)
+
+    def test_tampered_header_is_rejected(self):
+        # Octets 1-4 : id de clé (clé inconnue) ; 5-16 : nonce (authentifié comme donnée associée)
+        for position in (1, 4, 5, ENVELOPE_V2_HEADER.size - 1):
+            with self.subTest(position=position):
+                encrypted, nonce = self.seal()
+                encrypted[position] ^= 1
+                self.assert_rejected(encrypted, nonce)
+
+    def test_tampered_ciphertext_is_rejected(self):
+        encrypted, nonce = self.seal()
+        encrypted[-1] ^= 1
+
+        self.assert_rejected(encrypted, nonce)
+
+    def test_unknown_version_byte_is_rejected(self):
+        encrypted, nonce = self.seal()
+        encrypted[0] = 0x04
+
+        with self.assertRaisesMessage(ValueError, 'Unknown envelope version 04'):
+            self.v2.decrypt_message(bytes(encrypted), nonce)
+
+
+class EncryptionSelfTestTests(TestCase):
+
+    def results(self):
+        return {name: (passed, detail) for name, passed, detail in run_self_test()}
+
+    def test_all_checks_pass(self):
+        failures = {name: detail for name, (passed, detail) in self.results().items() if not passed}
+
+        self.assertEqual(failures, {})
+        self.assertFalse(LayerKey.objects.exists())  # Graine du layer de mesure supprimée
+
+    def test_rotation_check_needs_a_new_key(self):
+        with mock.patch.object(KeyRing, 'rotate', lambda ring: ring.load()):
+            passed, detail = self.results()['key_rotation']
+
+        self.assertFalse(passed)
+        self.assertEqual(detail, 'master key unchanged by rotation')
+
+    def test_rotation_check_needs_rewritten_tokens(self):
+        with mock.patch.object(LayerEncryption, 'rotate_token', lambda encryptor, encrypted_data: encrypted_data):
+            passed, _ = self.results()['key_rotation']
+
+        self.assertFalse(passed)
@@ -8,6 +8,7 @@ urlpatterns = [
     path('create/', views.CreateLayerView.as_view(), name='create_layer'),
     path('switch/<uuid:layer_id>/', views.SwitchLayerView.as_view(), name='switch_layer'),
     path('burn/<uuid:layer_id>/', views.BurnLayerView.as_view(), name='burn_layer'),
+    path('burn/<uuid:layer_id>/status/', views.LayerBurnStatusView.as_view(), name='layer_burn_status'),
     path('fragment/', views.FragmentIdentityView.as_view(), name='fragment_identity'),
     
     # Modes spéciaux
@@ -2,6 +2,7 @@ import json
 import hashlib
 import time
 from django.shortcuts import render
+from django.urls import reverse
 from django.http import JsonResponse
 from django.views.generic import TemplateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -9,10 +10,18 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
+from django.db import router, transaction
 
-from .models import TrueAnonymousLayer, LayerMapping, AnonymousMessage, EmergencyBurn
-from .encryption import LayerEncryption, ZeroKnowledgeAuth
+from .models import TrueAnonymousLayer, LayerMapping, LayerKey, EmergencyBurn
+from .routers import atomic_for
+from .encryption import LayerEncryption, ZeroKnowledgeAuth, get_key_ring
+from .stats import get_system_stats
+from .burn import burn_all
+from .plaintext_cache import get_plaintext_cache
+from .layer_keys import get_layer_key_cache
+from security.kdf_pool import get_kdf_pool
+from lain_chat.write_buffer import get_write_buffer
+from lain_chat.singleflight import get_single_flight_cache
 
 class CreateLayerView(View):
     """Création d'un nouveau layer anonyme"""
@@ -24,7 +33,7 @@ class CreateLayerView(View):
             anonymization_level = data.get('anonymization_level', 1)
             
             # Créer le layer anonyme
-            with transaction.atomic():
+            with atomic_for(TrueAnonymousLayer, LayerMapping):
                 layer = TrueAnonymousLayer.objects.create(
                     layer_name=layer_name,
                     corruption_level=anonymization_level
@@ -32,9 +41,8 @@ class CreateLayerView(View):
                 
                 # Créer le mapping chiffré si utilisateur connecté
                 if request.user.is_authenticated:
-                    user_hash, salt = LayerMapping.generate_user_hash(
-                        request.user.id
-                    )
+                    epoch = settings.ENCRYPTION_CONFIG.get('BLIND_INDEX_EPOCH', 0)
+                    user_hash = LayerMapping.blind_index(request.user.id, epoch)
                     
                     # Chiffrer le lien
                     encryption_key = settings.ENCRYPTION_CONFIG['MASTER_KEY'].encode()
@@ -48,11 +56,15 @@ class CreateLayerView(View):
                         user_hash=user_hash,
                         layer_id=layer.layer_id,
                         encrypted_link=encrypted_link,
-                        salt=salt
+                        salt=f'epoch:{epoch}'
                     )
                     
                
                     request.user.increment_layer_count()
+                    # Base de TrueAnonymousLayer : ouverte en premier, committée en dernier
+                    get_single_flight_cache().invalidate(
+                        layer_list_cache_key(request.user.id), using=router.db_for_write(TrueAnonymousLayer)
+                    )
             
             return JsonResponse({
                 'success': True,
@@ -102,20 +114,16 @@ class SwitchLayerView(View):
                 }, status=404)
             
             if request.user.is_authenticated:
-                user_hash, _ = LayerMapping.generate_user_hash(request.user.id)
-                
-                if not LayerMapping.objects.filter(
-                    user_hash=user_hash,
-                    layer_id=layer.layer_id
-                ).exists():
+                if not LayerMapping.for_user_layer(request.user.id, layer.layer_id).exists():
                     return JsonResponse({
                         'success': False,
                         'error': 'Access denied to this layer'
                     }, status=403)
             
             
+            # Une seule écriture par intervalle, même si le layer est très sollicité
             layer.last_active = timezone.now()
-            layer.save()
+            get_write_buffer().touch(TrueAnonymousLayer, layer.pk, 'last_active', layer.last_active)
             
             return JsonResponse({
                 'success': True,
@@ -161,30 +169,25 @@ class BurnLayerView(View):
             
             # Vérifier les permissions
             if request.user.is_authenticated:
-                user_hash, _ = LayerMapping.generate_user_hash(request.user.id)
-                
-                if not LayerMapping.objects.filter(
-                    user_hash=user_hash,
-                    layer_id=layer.layer_id
-                ).exists():
+                if not LayerMapping.for_user_layer(request.user.id, layer.layer_id).exists():
                     return JsonResponse({
                         'success': False,
                         'error': 'Access denied'
                     }, status=403)
             
             # Destruction complète
-            with transaction.atomic():
+            with atomic_for(TrueAnonymousLayer):
                 layer_id = layer.layer_id
                 layer_name_copy = layer.layer_name
                 
-                # Supprimer tous les messages associés
-                AnonymousMessage.objects.filter(layer_id=layer_id).delete()
-                
-                # Supprimer les mappings
-                LayerMapping.objects.filter(layer_id=layer_id).delete()
-                
-                # Supprimer le layer
-                layer.delete()
+                # Tombstone + crypto-shredding : le layer disparaît des lectures et ses
+                # messages sont illisibles immédiatement. Messages, mappings et layer
+                # sont supprimés par lots en arrière-plan après le commit.
+                layer.burn_layer()
+                if request.user.is_authenticated:
+                    get_single_flight_cache().invalidate(
+                        layer_list_cache_key(request.user.id), using=router.db_for_write(TrueAnonymousLayer)
+                    )
                 
                 # Log de l'événement (anonymisé)
                 if request.user.is_authenticated:
@@ -201,11 +204,15 @@ class BurnLayerView(View):
                     reason=f'Manual burn of layer {layer_name_copy}'
                 )
             
-            return JsonResponse({
+            response = {
                 'success': True,
                 'message': f'Layer "{layer_name_copy}" burned successfully',
-                'burn_id': 'classified'
-            })
+                'burn_id': 'classified',
+            }
+            if request.user.is_authenticated:
+                # Seul le propriétaire peut suivre la purge
+                response['status_url'] = reverse('anonymization:layer_burn_status', args=[layer_id])
+            return JsonResponse(response, status=202)
             
         except Exception as e:
             return JsonResponse({
@@ -214,6 +221,32 @@ class BurnLayerView(View):
                 'details': str(e) if settings.DEBUG else None
             }, status=500)
 
+class LayerBurnStatusView(View):
+    """Progression de la purge d'un layer brûlé, pour son propriétaire uniquement
+
+    Le propriétaire est reconnu par l'index aveugle de son mapping, supprimé
+    en fin de purge. Tout autre cas (id inconnu, layer d'un autre, anonyme,
+    purge terminée) reçoit la même 404 : l'endpoint ne révèle rien d'un UUID.
+    """
+    
+    def get(self, request, layer_id, *args, **kwargs):
+        layer_key = None
+        if request.user.is_authenticated and LayerMapping.for_user_layer(request.user.id, layer_id).exists():
+            layer_key = LayerKey.objects.filter(pk=layer_id, shredded_at__isnull=False).first()
+        
+        if layer_key is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Burn not found'
+            }, status=404)
+        
+        return JsonResponse({
+            'success': True,
+            'shredded': True,
+            'messages_purged': layer_key.purged_count,
+            'completed': layer_key.purged_at is not None
+        })
+
 class FragmentIdentityView(View):
     """Fragmentation d'identité en plusieurs layers"""
     
@@ -224,7 +257,7 @@ class FragmentIdentityView(View):
             
             fragments = []
             
-            with transaction.atomic():
+            with atomic_for(TrueAnonymousLayer, LayerMapping):
                 for i in range(fragment_count):
                     fragment_name = f"fragment_{i+1}_{int(time.time())}"
                     
@@ -235,10 +268,9 @@ class FragmentIdentityView(View):
                     
                     
                     if request.user.is_authenticated:
-                        user_hash, salt = LayerMapping.generate_user_hash(
-                            request.user.id,
-                            f"fragment_{i}"  
-                        )
+                        # Index propre au fragment : les fragments d'un utilisateur ne sont pas reliables entre eux
+                        epoch = settings.ENCRYPTION_CONFIG.get('BLIND_INDEX_EPOCH', 0)
+                        user_hash = LayerMapping.blind_index(request.user.id, epoch, layer.layer_id)
                         
                         encryption_key = settings.ENCRYPTION_CONFIG['FRAGMENT_KEY'].encode()
                         encrypted_link = LayerMapping.encrypt_link(
@@ -251,7 +283,7 @@ class FragmentIdentityView(View):
                             user_hash=user_hash,
                             layer_id=layer.layer_id,
                             encrypted_link=encrypted_link,
-                            salt=salt
+                            salt=f'epoch:{epoch}'
                         )
                     
                     fragments.append({
@@ -260,6 +292,7 @@ class FragmentIdentityView(View):
                         'corruption_level': layer.corruption_level
                     })
             
+            # Pas d'invalidation de la liste des layers : les fragments n'y apparaissent pas
             return JsonResponse({
                 'success': True,
                 'fragments': fragments,
@@ -288,37 +321,23 @@ class EmergencyBurnView(View):
                     'error': 'Invalid confirmation code'
                 }, status=400)
             
-            destroyed_count = 0
+            # Log de l'événement
+            trigger_hash = hashlib.sha256(
+                f"{request.user.id if request.user.is_authenticated else 'anonymous'}:{time.time()}".encode()
+            ).hexdigest()
             
-            with transaction.atomic():
-                # Compter avant destruction
-                layers_count = TrueAnonymousLayer.objects.count()
-                messages_count = AnonymousMessage.objects.count()
-                mappings_count = LayerMapping.objects.count()
-                
-                # Destruction totale
-                TrueAnonymousLayer.objects.all().delete()
-                AnonymousMessage.objects.all().delete()
-                LayerMapping.objects.all().delete()
-                
-                destroyed_count = layers_count + messages_count + mappings_count
-                
-                # Log de l'événement
-                trigger_hash = hashlib.sha256(
-                    f"{request.user.id if request.user.is_authenticated else 'anonymous'}:{time.time()}".encode()
-                ).hexdigest()
-                
-                EmergencyBurn.objects.create(
-                    burn_type='total_destruction',
-                    objects_destroyed_count=destroyed_count,
-                    triggered_by_hash=trigger_hash,
-                    reason='Emergency burn - total data destruction'
-                )
+            # Destruction totale : clés détruites puis tables échangées contre des tables vides
+            result = burn_all(
+                burn_type='total_destruction',
+                triggered_by_hash=trigger_hash,
+                reason='Emergency burn - total data destruction'
+            )
             
             return JsonResponse({
                 'success': True,
                 'message': 'Emergency burn completed',
-                'objects_destroyed': destroyed_count,
+                'burn_id': result['burn_id'],
+                'tables_burned': result['tables'],
                 'warning': 'All data has been permanently destroyed'
             })
             
@@ -329,32 +348,38 @@ class EmergencyBurnView(View):
                 'details': str(e) if settings.DEBUG else None
             }, status=500)
 
+def layer_list_cache_key(user_id) -> str:
+    # Index aveugle plutôt que l'id utilisateur dans la clé de cache
+    return f'layers:{LayerMapping.blind_index(user_id)}'
+
+def _list_user_layers(user_id) -> list:
+    # Récupérer les layers via les mappings
+    layer_ids = list(LayerMapping.for_user(user_id).values_list('layer_id', flat=True))
+    
+    user_layers = TrueAnonymousLayer.objects.filter(
+        layer_id__in=layer_ids
+    ).order_by('-last_active')
+    
+    return [{
+        'id': str(layer.layer_id)[:8] + '...',  
+        'name': layer.layer_name,
+        'corruption_level': layer.corruption_level,
+        'last_active': layer.last_active.isoformat(),
+        'is_expired': layer.is_expired()
+    } for layer in user_layers]
+
 class LayerListAPIView(View):
     """API pour lister les layers accessibles"""
     
     def get(self, request, *args, **kwargs):
         try:
-            layers = []
-            
             if request.user.is_authenticated:
-                # Récupérer les layers via les mappings
-                user_hash, _ = LayerMapping.generate_user_hash(request.user.id)
-                
-                mappings = LayerMapping.objects.filter(user_hash=user_hash)
-                layer_ids = [mapping.layer_id for mapping in mappings]
-                
-                user_layers = TrueAnonymousLayer.objects.filter(
-                    layer_id__in=layer_ids
-                ).order_by('-last_active')
-                
-                for layer in user_layers:
-                    layers.append({
-                        'id': str(layer.layer_id)[:8] + '...',  
-                        'name': layer.layer_name,
-                        'corruption_level': layer.corruption_level,
-                        'last_active': layer.last_active.isoformat(),
-                        'is_expired': layer.is_expired()
-                    })
+                user_id = request.user.id
+                layers = get_single_flight_cache().get_or_compute(
+                    layer_list_cache_key(user_id),
+                    lambda: _list_user_layers(user_id),
+                    shared_only=True  # Invalidé par création, fragmentation et burn
+                )
             else:
                 # Mode anonyme - pas de layers persistants
                 layers = [{
@@ -378,32 +403,42 @@ class LayerListAPIView(View):
                 'details': str(e) if settings.DEBUG else None
             }, status=500)
 
+def _anonymization_status() -> dict:
+    # Statistiques anonymisées
+    # Compteurs incrémentaux : pas de COUNT(*) à chaque appel
+    counters = get_system_stats().snapshot()
+    total_layers = counters['layers']
+    total_messages = counters['messages']
+    total_burns = counters['burns']
+    
+    return {
+        'anonymization_enabled': settings.ANONYMIZATION_CONFIG.get('ENABLED', True),
+        'zero_knowledge_auth': settings.ANONYMIZATION_CONFIG.get('ZERO_KNOWLEDGE_AUTH', True),
+        'encryption_active': True,
+        'key_ring': get_key_ring().status(),
+        'plaintext_cache': get_plaintext_cache().stats(),
+        'layer_key_cache': get_layer_key_cache().stats(),
+        'write_buffer': get_write_buffer().stats(),
+        'single_flight': get_single_flight_cache().stats(),
+        'kdf_pool': get_kdf_pool().stats(),
+        'total_layers': total_layers,
+        'total_messages': total_messages,
+        'emergency_burns': total_burns,
+        'layer_rotation_hours': settings.ANONYMIZATION_CONFIG.get('LAYER_ROTATION_HOURS', 24),
+        'message_retention_days': settings.ANONYMIZATION_CONFIG.get('MESSAGE_RETENTION_DAYS', 7),
+        'system_status': 'operational',
+        'wired_connection': 'stable',
+        'reality_border_integrity': 'degraded',  # Easter egg
+        'protocol_seven_active': True
+    }
+
 class AnonymizationStatusAPIView(View):
     """Status de l'anonymisation système"""
     
     def get(self, request, *args, **kwargs):
         try:
-            # Statistiques anonymisées
-            total_layers = TrueAnonymousLayer.objects.count()
-            total_messages = AnonymousMessage.objects.count()
-            total_burns = EmergencyBurn.objects.count()
-            
-            
-            
-            status = {
-                'anonymization_enabled': settings.ANONYMIZATION_CONFIG.get('ENABLED', True),
-                'zero_knowledge_auth': settings.ANONYMIZATION_CONFIG.get('ZERO_KNOWLEDGE_AUTH', True),
-                'encryption_active': True,
-                'total_layers': total_layers,
-                'total_messages': total_messages,
-                'emergency_burns': total_burns,
-                'layer_rotation_hours': settings.ANONYMIZATION_CONFIG.get('LAYER_ROTATION_HOURS', 24),
-                'message_retention_days': settings.ANONYMIZATION_CONFIG.get('MESSAGE_RETENTION_DAYS', 7),
-                'system_status': 'operational',
-                'wired_connection': 'stable',
-                'reality_border_integrity': 'degraded',  # Easter egg
-                'protocol_seven_active': True
-            }
+            # Un seul calcul par expiration, même avec de nombreux clients qui interrogent
+            status = get_single_flight_cache().get_or_compute('anonymization_status', _anonymization_status)
             
             return JsonResponse({
                 'success': True,
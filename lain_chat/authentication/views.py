@@ -13,6 +13,8 @@ import hashlib
 import secrets
 import random
 
+from security.kdf_pool import KDFPoolSaturated
+
 # Générateur de noms anonymes 
 LAIN_NAMES = [
     'Layer01', 'Layer02', 'Layer03', 'Layer04', 'Layer05',
@@ -57,7 +59,12 @@ class LainLoginView(View):
             return render(request, 'auth/login.html')
         
     
-        user = authenticate(request, username=user.username, password=password)
+        try:
+            user = authenticate(request, username=user.username, password=password)
+        except KDFPoolSaturated:
+            messages.error(request, 'Too many connection attempts, retry in a moment')
+            return render(request, 'auth/login.html', status=503)
+        
         if user:
             login(request, user)
             
@@ -136,6 +143,10 @@ class LainRegisterView(View):
             messages.success(request, f'Welcome to the Wired, {username}!')
             return redirect('chat:index')
             
+        except KDFPoolSaturated:
+            messages.error(request, 'Too many registrations in progress, retry in a moment')
+            return render(request, 'auth/register.html', status=503)
+            
         except Exception as e:
             messages.error(request, 'Registration failed. Please try again.')
             return render(request, 'auth/register.html')
@@ -10,6 +10,8 @@ from django.utils import timezone
 from django.conf import settings
 import logging
 
+from .registry import get_room_registry
+
 try:
     from anonymization.encryption import generate_secure_session, generate_layer_hash
 except ImportError:
@@ -23,6 +25,8 @@ logger = logging.getLogger('lain_consumer')
 try:
     from anonymization.models import TrueAnonymousLayer, AnonymousMessage, LayerMapping
     from anonymization.encryption import LayerEncryption
+    from anonymization.expiry import ensure_expiry_task
+    from anonymization.partitions import message_model_for_write, recent_room_messages
     ANONYMIZATION_AVAILABLE = True
 except ImportError:
     ANONYMIZATION_AVAILABLE = False
@@ -60,7 +64,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'chat_{self.room_name}'
         self.user = self.scope.get('user')
         
-        self.room_corruption_level = ROOM_CORRUPTION_LEVELS.get(self.room_name, 0)
+        # Registre en mémoire : une lecture de dict, la base n'est lue qu'après invalidation
+        room_info = await get_room_registry().aget(self.room_name)
+        self.room_corruption_level = ROOM_CORRUPTION_LEVELS.get(
+            self.room_name, room_info['corruption_level'] if room_info else 0
+        )
         self.corruption_delay = CORRUPTION_DELAYS.get(self.room_corruption_level, 0)
         
         
@@ -85,6 +93,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
+        if ANONYMIZATION_AVAILABLE:
+            ensure_expiry_task()
+        
         await self.accept()
         
         
@@ -104,6 +115,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         else:
             await self.send_system_message('Room corruption level: 0/10 - Messages are permanent')
         
+        await self.send_room_history()
        
         await self.broadcast_user_count()
         
@@ -111,6 +123,41 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.send_room_specific_quote()
     
     
+    async def send_room_history(self):
+        """Rejoue les derniers messages de la salle à l'arrivant"""
+        if not ANONYMIZATION_AVAILABLE:
+            return
+        
+        try:
+            history = await self.load_room_history()
+        except Exception as e:
+            logger.error(f"Room history unavailable: {e}")
+            return
+        
+        for event in history:
+            await self.chat_message(event)
+    
+    @database_sync_to_async
+    def load_room_history(self):
+        # Messages chauds : déchiffrés une fois par processus, puis servis par le cache de texte clair
+        limit = getattr(settings, 'ANONYMIZATION_CONFIG', {}).get('ROOM_HISTORY_SIZE', 50)
+        if not limit:
+            return []
+        
+        messages = recent_room_messages(self.room_name, limit)
+        history = []
+        for message, result in zip(messages, AnonymousMessage.decrypt_batch(messages)):
+            if not result.ok:
+                continue  # Layer brûlé ou clé perdue : le message n'est plus lisible
+            history.append({
+                'layer_name': 'anonymous',
+                'message': result.value,
+                'timestamp': message.timestamp.isoformat(),
+                'layer_id': str(message.layer_id),
+                'metadata': {'history': True, 'is_ephemeral': message.is_ephemeral, 'room_name': self.room_name},
+            })
+        return history
+    
     async def send_room_specific_quote(self):
         """Envoie une citation spécifique à la room"""
         room_quotes = {
@@ -312,7 +359,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         try:
            
-            anonymous_message = AnonymousMessage()
+            anonymous_message = message_model_for_write()()
             anonymous_message.room_name = room_name
             
            
@@ -413,23 +460,23 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 await self.send_system_message(f'Session ID: {self.secure_session_id[:16]}...')
                 return
             
-            from anonymization.encryption import LayerEncryption
+            from anonymization.encryption import get_encryption_instance
             
-            # Test de chiffrement 
-            encryptor = LayerEncryption()
+            # Test de chiffrement (instance partagée : ni lecture de clé sur disque, ni accès base)
+            encryptor = get_encryption_instance()
             test_message = f"Encryption test from session {self.secure_session_id[:8]} at {int(time.time())}"
             
             # Chiffrer
-            start_time = time.time()
+            start_time = time.perf_counter()
             encrypted_data, nonce, salt = encryptor.encrypt_message(
                 test_message, self.current_layer_id, self.room_name
             )
-            encrypt_time = time.time() - start_time
+            encrypt_time = time.perf_counter() - start_time
             
             # Déchiffrer
-            start_time = time.time()
+            start_time = time.perf_counter()
             decrypted = encryptor.decrypt_message(encrypted_data, nonce, salt)
-            decrypt_time = time.time() - start_time
+            decrypt_time = time.perf_counter() - start_time
             
             if decrypted == test_message:
                 await self.send_system_message('AES-256-GCM: OPERATIONAL')
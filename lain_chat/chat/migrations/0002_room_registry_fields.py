@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="room",
+            name="corruption_level",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="display_name",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="is_custom",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="reality_anchor",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="room",
+            name="theme",
+            field=models.CharField(default="default", max_length=30),
+        ),
+    ]
@@ -19,6 +19,13 @@ class Room(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     
+    # Présentation des rooms personnalisées (servies par chat.registry)
+    display_name = models.CharField(max_length=50, blank=True)
+    theme = models.CharField(max_length=30, default='default')
+    corruption_level = models.IntegerField(default=0)
+    reality_anchor = models.BooleanField(default=True)
+    is_custom = models.BooleanField(default=False)
+    
     class Meta:
         db_table = 'chat_rooms'
         verbose_name = 'Chat Room'
@@ -27,12 +34,22 @@ class Room(models.Model):
     def __str__(self):
         return f"#{self.name} (Layer {self.layer_level})"
     
+    def as_info(self) -> dict:
+        """Entrée du registre de rooms"""
+        return {
+            'name': self.display_name or self.name,
+            'description': self.description,
+            'theme': self.theme,
+            'corruption_level': self.corruption_level,
+            'reality_anchor': self.reality_anchor,
+            'created_at': self.created_at,
+            'is_custom': self.is_custom
+        }
+    
     def get_active_layers_count(self):
-        from anonymization.models import AnonymousMessage
-        return AnonymousMessage.objects.filter(
-            room_name=self.name,
-            timestamp__gte=timezone.now() - timezone.timedelta(minutes=10)
-        ).values('layer_id').distinct().count()
+        # Estimation HyperLogLog sur les 10 dernières minutes, sans requête SQL
+        from anonymization.stats import get_system_stats
+        return get_system_stats().active_layers(self.name)
 
 class RoomHistory(models.Model):
     """Historique anonymisé des rooms"""
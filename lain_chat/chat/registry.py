@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+
+logger = logging.getLogger('lain_consumer')
+
+
+DEFAULT_ROOMS = {
+    'general': {
+        'name': 'General',
+        'description': 'The main Wired connection point',
+        'theme': 'default',
+        'corruption_level': 0,
+        'reality_anchor': True
+    },
+    'cyberia': {
+        'name': 'Cyberia',
+        'description': 'The club where reality blurs with dreams',
+        'theme': 'cyberia',
+        'corruption_level': 2,
+        'reality_anchor': False
+    },
+    'protocol7': {
+        'name': 'Protocol 7',
+        'description': 'The consciousness layer',
+        'theme': 'protocol',
+        'corruption_level': 1,
+        'reality_anchor': True
+    },
+    'knights': {
+        'name': 'Knights of Eastern Calculus',
+        'description': 'Digital purity',
+        'theme': 'knights',
+        'corruption_level': 0,
+        'reality_anchor': True
+    },
+    'wired': {
+        'name': 'The Wired',
+        'description': 'Pure information space',
+        'theme': 'wired',
+        'corruption_level': 3,
+        'reality_anchor': False
+    },
+    'navi': {
+        'name': 'NAVI Interface',
+        'description': 'Direct neural interface layer',
+        'theme': 'navi',
+        'corruption_level': 1,
+        'reality_anchor': True
+    },
+    'phantom': {
+        'name': 'Phantom Layer',
+        'description': 'Between digital and analog existence',
+        'theme': 'ph',
+        'corruption_level': 4,
+        'reality_anchor': False
+    },
+    'masami': {
+        'name': 'Masami Domain',
+        'description': ' god realm',
+        'theme': 'undefined',
+        'corruption_level': 5,
+        'reality_anchor': False
+    }
+}
+
+
+class RoomExists(ValueError):
+    """Une room porte déjà cet identifiant"""
+
+
+class RoomRegistry:
+    """Rooms par défaut (code) et personnalisées (modèle Room), lues depuis un dict en mémoire
+
+    Le dict est reconstruit depuis la base au premier accès après une
+    invalidation. Une création ou suppression invalide le processus courant et
+    diffuse l'invalidation aux autres workers sur le groupe GROUP du channel
+    layer ; reload_interval borne la fraîcheur si un message est perdu.
+
+    Chaque invalidation incrémente une génération : un rechargement commencé
+    avant n'est pas gardé. InMemoryChannelLayer ne sort pas du processus : la
+    diffusion n'a lieu qu'avec un channel layer partagé (Redis), sinon les
+    autres workers ne se resynchronisent qu'après reload_interval.
+    """
+
+    GROUP = 'lain_room_registry'
+
+    def __init__(self, reload_interval: float = 60):
+        self.reload_interval = reload_interval
+        self.origin = uuid.uuid4().hex  # Ignore ses propres diffusions
+        self._rooms = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()  # Un seul rechargement à la fois
+        self._state_lock = threading.Lock()  # Court : jamais tenu pendant une requête
+        self._listener = None
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'ROOM_REGISTRY_CONFIG', {})
+        return cls(reload_interval=config.get('RELOAD_INTERVAL', 60))
+
+    def _load(self) -> dict:
+        from .models import Room
+
+        rooms = {room_id: dict(info) for room_id, info in DEFAULT_ROOMS.items()}
+        for room in Room.objects.filter(is_active=True, is_custom=True).order_by('created_at'):
+            rooms.setdefault(room.name, room.as_info())
+        return rooms
+
+    def _fresh(self):
+        rooms = self._rooms
+        if rooms is not None and time.monotonic() - self._loaded_at < self.reload_interval:
+            return rooms
+        return None
+
+    def _snapshot(self) -> dict:
+        rooms = self._fresh()
+        if rooms is not None:
+            return rooms
+
+        with self._lock:
+            rooms = self._fresh()
+            if rooms is None:
+                generation = self._generation
+                rooms = self._load()
+                with self._state_lock:
+                    # Invalidé pendant la lecture : résultat servi à cet appel, pas gardé
+                    if self._generation == generation:
+                        self._rooms = rooms
+                        self._loaded_at = time.monotonic()
+            return rooms
+
+    def get(self, room_id: str):
+        return self._snapshot().get(room_id)
+
+    async def aget(self, room_id: str):
+        """get() depuis un consumer : le rechargement éventuel se fait hors de la boucle"""
+        rooms = self._fresh()
+        if rooms is None:
+            rooms = await database_sync_to_async(self._snapshot)()
+        return rooms.get(room_id)
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._snapshot()
+
+    def all(self) -> dict:
+        """Copie de surface du registre (sûre à passer aux templates)"""
+        return dict(self._snapshot())
+
+    def invalidate(self):
+        with self._state_lock:
+            self._generation += 1
+            self._rooms = None
+
+    def create(self, room_id: str, info: dict):
+        from .models import Room
+
+        if room_id in DEFAULT_ROOMS:
+            raise RoomExists(room_id)
+
+        try:
+            with transaction.atomic():
+                room = Room.objects.create(
+                    name=room_id,
+                    display_name=info['name'],
+                    description=info.get('description', ''),
+                    theme=info.get('theme', 'default'),
+                    corruption_level=info.get('corruption_level', 0),
+                    reality_anchor=info.get('reality_anchor', True),
+                    is_custom=True
+                )
+        except IntegrityError:
+            raise RoomExists(room_id)
+
+        self._changed()
+        return room
+
+    def delete(self, room_id: str) -> bool:
+        """Supprime une room personnalisée (les rooms par défaut ne le sont jamais)"""
+        from .models import Room
+
+        deleted, _ = Room.objects.filter(name=room_id, is_custom=True).delete()
+        if deleted:
+            self._changed()
+        return bool(deleted)
+
+    def _changed(self):
+        self.invalidate()
+        transaction.on_commit(self._broadcast)
+
+    @staticmethod
+    def _shared_channel_layer():
+        """Channel layer commun aux workers, ou None (absent ou en mémoire)"""
+        channel_layer = get_channel_layer()
+        if channel_layer is None or isinstance(channel_layer, InMemoryChannelLayer):
+            return None
+        return channel_layer
+
+    def _broadcast(self):
+        channel_layer = self._shared_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(channel_layer.group_send)(self.GROUP, {
+                'type': 'room_registry.invalidate',
+                'origin': self.origin,
+            })
+        except Exception as e:
+            # Les autres workers se resynchroniseront au plus tard après reload_interval
+            logger.warning(f"Room registry broadcast failed: {e}")
+
+    async def _listen(self, channel_layer):
+        channel = await channel_layer.new_channel()
+
+        while True:
+            # Réabonnement périodique : l'appartenance aux groupes expire côté Redis
+            await channel_layer.group_add(self.GROUP, channel)
+            try:
+                message = await asyncio.wait_for(channel_layer.receive(channel), timeout=self.reload_interval)
+            except asyncio.TimeoutError:
+                continue
+            if message.get('type') == 'room_registry.invalidate' and message.get('origin') != self.origin:
+                self.invalidate()
+
+    def _run_listener(self, channel_layer):
+        while True:
+            try:
+                asyncio.run(self._listen(channel_layer))
+            except Exception as e:
+                logger.warning(f"Room registry listener failed: {e}")
+            # Invalidations manquées pendant la coupure : on relit la base
+            self.invalidate()
+            time.sleep(min(self.reload_interval, 5))
+
+    def start_listener(self):
+        """Démarre l'écoute des invalidations dans un thread (une par processus, au démarrage)"""
+        channel_layer = self._shared_channel_layer()
+        if channel_layer is None:
+            return None
+
+        with self._state_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._run_listener, args=(channel_layer,),
+                    name='lain-room-registry', daemon=True
+                )
+                self._listener.start()
+
+        return self._listener
+
+
+_room_registry = None
+_room_registry_lock = threading.Lock()
+
+def get_room_registry() -> RoomRegistry:
+    """Récupère le registre de rooms du processus"""
+    global _room_registry
+
+    if _room_registry is None:
+        with _room_registry_lock:
+            if _room_registry is None:
+                _room_registry = RoomRegistry.from_settings()
+
+    return _room_registry
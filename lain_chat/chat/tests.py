@@ -1,2 +1,88 @@
+import datetime
+import uuid
+from unittest import mock
+from asgiref.sync import async_to_sync
 from django.test import TestCase
+from django.utils import timezone
+
+from anonymization.models import AnonymousMessage
+from anonymization.plaintext_cache import PlaintextCache
+
+from .consumers import ChatConsumer
+from .registry import DEFAULT_ROOMS, RoomRegistry
+
+
+class RoomRegistryTests(TestCase):
+
+    def setUp(self):
+        self.registry = RoomRegistry(reload_interval=60)
+
+    def test_created_room_is_visible(self):
+        self.registry.all()
+        self.registry.create('lain-room', {'name': 'Lain'})
+
+        self.assertEqual(self.registry.get('lain-room')['name'], 'Lain')
+
+    def test_reload_raced_by_invalidation_is_not_kept(self):
+        load = self.registry._load
+
+        def invalidated_during_load():
+            rooms = load()
+            self.registry.invalidate()  # Diffusion reçue pendant la requête
+            return rooms
+
+        with mock.patch.object(self.registry, '_load', side_effect=invalidated_during_load):
+            self.assertIn('general', self.registry.all())
+
+        self.assertIsNone(self.registry._rooms)
+        with mock.patch.object(self.registry, '_load', return_value=dict(DEFAULT_ROOMS)) as reload:
+            self.registry.all()
+        reload.assert_called_once()
+
+    def test_in_memory_channel_layer_has_no_listener(self):
+        # InMemoryChannelLayer (settings) : rien à écouter hors du processus
+        self.assertIsNone(self.registry.start_listener())
+
+
+class RoomHistoryTests(TestCase):
+    databases = {'default', 'anonymous_mapping'}
+
+    def setUp(self):
+        self.cache = PlaintextCache()
+        patcher = mock.patch('anonymization.plaintext_cache.get_plaintext_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.consumer = ChatConsumer()
+        self.consumer.room_name = 'wired'
+
+    def save(self, text, room_name='wired', auto_destroy_at=None):
+        message = AnonymousMessage(room_name=room_name, auto_destroy_at=auto_destroy_at)
+        message.save_encrypted(text, str(uuid.uuid4()), room_name)
+        return message
+
+    def test_replays_room_messages_through_plaintext_cache(self):
+        self.save('present day')
+        self.save('present time')
+        self.save('other room', room_name='general')
+        self.save('burned', auto_destroy_at=timezone.now() - datetime.timedelta(seconds=1))
+
+        history = async_to_sync(self.consumer.load_room_history)()
+
+        self.assertEqual([event['message'] for event in history], ['present day', 'present time'])
+        self.assertTrue(all(event['metadata']['history'] for event in history))
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+        # Arrivant suivant : servi par le cache, sans déchiffrement
+        with mock.patch('anonymization.encryption.decrypt_many') as decrypt_many:
+            decrypt_many.return_value = []
+            history = async_to_sync(self.consumer.load_room_history)()
+        self.assertEqual([event['message'] for event in history], ['present day', 'present time'])
+        self.assertEqual(self.cache.stats()['hits'], 2)
+
+    def test_history_disabled(self):
+        self.save('present day')
+
+        with self.settings(ANONYMIZATION_CONFIG={'ROOM_HISTORY_SIZE': 0}):
+            self.assertEqual(async_to_sync(self.consumer.load_room_history)(), [])
 
@@ -10,6 +10,9 @@ import uuid
 import hashlib
 import random
 
+from lain_chat.singleflight import get_single_flight_cache
+from .registry import get_room_registry, RoomExists
+
 try:
     from anonymization.models import TrueAnonymousLayer, AnonymousMessage
     ANONYMIZATION_AVAILABLE = True
@@ -17,79 +20,21 @@ except ImportError:
     ANONYMIZATION_AVAILABLE = False
 
 
-LAIN_ROOMS = {
-    'general': {
-        'name': 'General',
-        'description': 'The main Wired connection point',
-        'theme': 'default',
-        'corruption_level': 0,
-        'reality_anchor': True
-    },
-    'cyberia': {
-        'name': 'Cyberia',
-        'description': 'The club where reality blurs with dreams',
-        'theme': 'cyberia',
-        'corruption_level': 2,
-        'reality_anchor': False
-    },
-    'protocol7': {
-        'name': 'Protocol 7',
-        'description': 'The consciousness layer',
-        'theme': 'protocol',
-        'corruption_level': 1,
-        'reality_anchor': True
-    },
-    'knights': {
-        'name': 'Knights of Eastern Calculus',
-        'description': 'Digital purity',
-        'theme': 'knights',
-        'corruption_level': 0,
-        'reality_anchor': True
-    },
-    'wired': {
-        'name': 'The Wired',
-        'description': 'Pure information space',
-        'theme': 'wired',
-        'corruption_level': 3,
-        'reality_anchor': False
-    },
-    'navi': {
-        'name': 'NAVI Interface',
-        'description': 'Direct neural interface layer',
-        'theme': 'navi',
-        'corruption_level': 1,
-        'reality_anchor': True
-    },
-    'phantom': {
-        'name': 'Phantom Layer',
-        'description': 'Between digital and analog existence',
-        'theme': 'ph',
-        'corruption_level': 4,
-        'reality_anchor': False
-    },
-    'masami': {
-        'name': 'Masami Domain',
-        'description': ' god realm',
-        'theme': 'undefined',
-        'corruption_level': 5,
-        'reality_anchor': False
-    }
-}
-
 def index(request):
     """Page d'accueil avec liste des rooms"""
+    rooms = get_room_registry().all()
     return render(request, 'chat/index.html', {
-        'rooms': LAIN_ROOMS,
-        'total_rooms': len(LAIN_ROOMS)
+        'rooms': rooms,
+        'total_rooms': len(rooms)
     })
 
 def room(request, room_name):
-    if room_name not in LAIN_ROOMS:
+    registry = get_room_registry()
+    room_info = registry.get(room_name)
+    if room_info is None:
         messages.error(request, f'Room "{room_name}" does not exist in the Wired.')
         return redirect('chat:index')
     
-    room_info = LAIN_ROOMS[room_name]
-    
     
     session_id = generate_anonymous_session_id(request)
     
@@ -97,7 +42,7 @@ def room(request, room_name):
         'room_name': room_name,
         'room_info': room_info,
         'session_id': session_id,
-        'rooms': LAIN_ROOMS,
+        'rooms': registry.all(),
         'anonymization_enabled': ANONYMIZATION_AVAILABLE,
     }
     
@@ -106,7 +51,7 @@ def room(request, room_name):
 def room_list(request):
     """API pour obtenir la liste des rooms"""
     rooms_data = []
-    for room_id, room_info in LAIN_ROOMS.items():
+    for room_id, room_info in get_room_registry().all().items():
         user_count = random.randint(1, 15)
         
         rooms_data.append({
@@ -129,7 +74,7 @@ def create_layer(request):
         return handle_layer_creation(request)
     
     return render(request, 'chat/create_layer.html', {
-        'existing_rooms': LAIN_ROOMS
+        'existing_rooms': get_room_registry().all()
     })
 
 @require_http_methods(["POST"])
@@ -154,11 +99,6 @@ def handle_layer_creation(request):
         layer_id = generate_layer_id(layer_name)
         
         
-        if layer_id in LAIN_ROOMS:
-            messages.error(request, 'A layer with this name already exists.')
-            return redirect('chat:create_layer')
-        
-        
         new_layer = {
             'name': layer_name,
             'description': layer_description or f'Custom layer: {layer_name}',
@@ -170,7 +110,12 @@ def handle_layer_creation(request):
         }
         
         
-        LAIN_ROOMS[layer_id] = new_layer
+        # Persisté dans Room et diffusé aux autres workers
+        try:
+            get_room_registry().create(layer_id, new_layer)
+        except RoomExists:
+            messages.error(request, 'A layer with this name already exists.')
+            return redirect('chat:create_layer')
         
         
         if ANONYMIZATION_AVAILABLE:
@@ -191,10 +136,10 @@ def handle_layer_creation(request):
 
 def layer_info(request, room_name):
    
-    if room_name not in LAIN_ROOMS:
+    room_info = get_room_registry().get(room_name)
+    if room_info is None:
         return JsonResponse({'error': 'Layer not found'}, status=404)
     
-    room_info = LAIN_ROOMS[room_name]
     user_count = random.randint(1, 15)  
     
     return JsonResponse({
@@ -208,19 +153,23 @@ def layer_info(request, room_name):
         'is_custom': room_info.get('is_custom', False)
     })
 
-@csrf_exempt
-def layer_status(request, room_name):
-    if room_name not in LAIN_ROOMS:
-        return JsonResponse({'error': 'Layer not found'}, status=404)
-    
+def _layer_stats() -> dict:
     # Simuler des stat (mettre des vrai un jour si pas flemme)
-    stats = {
+    return {
         'active_connections': random.randint(1, 12),
         'messages_today': random.randint(50, 500),
         'corruption_events': random.randint(0, 5),
         'reality_distortions': random.randint(0, 3),
         'uptime_minutes': random.randint(60, 1440)
     }
+
+@csrf_exempt
+def layer_status(request, room_name):
+    if room_name not in get_room_registry():
+        return JsonResponse({'error': 'Layer not found'}, status=404)
+    
+    # Tableaux de bord interrogés en boucle : un seul calcul par room et par expiration
+    stats = get_single_flight_cache().get_or_compute(f'layer_status:{room_name}', _layer_stats)
     
     return JsonResponse({
         'room_name': room_name,
@@ -232,8 +181,7 @@ def layer_status(request, room_name):
 def delete_layer(request, room_name):
     """Suppression d'un layer personnalisé"""
     if request.method == 'POST':
-        if room_name in LAIN_ROOMS and LAIN_ROOMS[room_name].get('is_custom', False):
-            del LAIN_ROOMS[room_name]
+        if get_room_registry().delete(room_name):
             messages.success(request, f'Layer "{room_name}" deleted from the Wired.')
         else:
             messages.error(request, 'Cannot delete default Wired layers.')
@@ -303,5 +251,5 @@ def random_lain_quote(request):
 def room_not_found(request, room_name):
     return render(request, 'chat/room_not_found.html', {
         'room_name': room_name,
-        'available_rooms': LAIN_ROOMS
+        'available_rooms': get_room_registry().all()
     }, status=404)
\ No newline at end of file
@@ -13,6 +13,18 @@ import chat.routing
 django_asgi_app = get_asgi_application()
 
 from security.middleware import WebSocketSecurityMiddleware
+from anonymization.encryption import get_key_ring
+from anonymization.layer_keys import get_layer_purger
+from chat.registry import get_room_registry
+
+# Chargement unique des clés au démarrage du worker
+get_key_ring()
+
+# Purges de layers brûlés interrompues par un arrêt : reprises sans attendre expire_messages
+get_layer_purger().resume_pending()
+
+# Invalidations du registre des rooms diffusées par les autres workers (channel layer partagé)
+get_room_registry().start_listener()
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
@@ -1,10 +1,16 @@
 import environ
 from pathlib import Path
 import os
+import sys
+import tempfile
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# manage.py test : journaux (et clés) dans un répertoire jetable, jamais dans l'arbre
+TESTING = sys.argv[1:2] == ['test']
+TEST_DIR = Path(tempfile.gettempdir()) / 'lain_chat_test'
+
 
 env = environ.Env(
     DEBUG=(bool, False)
@@ -83,17 +89,31 @@ TEMPLATES = [
 ASGI_APPLICATION = 'lain_chat.asgi.application'
 
 
+# Backend SQLite réglé (WAL, BEGIN IMMEDIATE...) : voir lain_chat/sqlite_backend
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'lain_chat.sqlite_backend',
         'NAME': BASE_DIR / 'lain_chat.sqlite3',
+        # Graines de layer (LayerKey) : contenu supprimé écrasé par des zéros, sinon
+        # une graine « détruite » se relit dans les pages libres du fichier
+        'PRAGMAS': {'secure_delete': 'ON'},
     },
     'anonymous_mapping': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'lain_chat.sqlite_backend',
         'NAME': BASE_DIR / 'lain_anonymous.sqlite3',
     },
 }
 
+# LayerMapping dans anonymous_mapping : un verrou d'écriture SQLite séparé.
+# DataFragment et KeyRotation peuvent y être ajoutés (puis migrate --database anonymous_mapping)
+# Installation existante : migrate --database anonymous_mapping, puis manage.py move_layer_mappings
+# pour y déplacer les mappings restés dans default
+DATABASE_ROUTERS = ['anonymization.routers.AnonymousMappingRouter']
+DATABASE_ROUTING = {
+    'MAPPING_DATABASE': 'anonymous_mapping',
+    'MAPPING_MODELS': ['anonymization.LayerMapping'],
+}
+
 #  PostgreSQL (pour plus tard)
 """
 DATABASES = {
@@ -123,6 +143,9 @@ DATABASES = {
 """
 
 
+# InMemoryChannelLayer ne sort pas du processus : avec plusieurs workers, ni
+# les messages de groupe ni les invalidations du registre des rooms ne les
+# atteignent (configuration Redis ci-dessous)
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels.layers.InMemoryChannelLayer',
@@ -191,6 +214,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.MinimalUser'
 
+# PBKDF2 calculé hors du processus ASGI (voir KDF_POOL_CONFIG) ; remplace le
+# PBKDF2PasswordHasher par défaut, même algorithme donc hash existants valides
+PASSWORD_HASHERS = [
+    'security.hashers.OffloadedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 
 
 
@@ -261,8 +294,8 @@ CONN_MAX_AGE = 60
 SILENCED_SYSTEM_CHECKS = []  
 
 
-LOGS_DIR = BASE_DIR / 'logs'
-LOGS_DIR.mkdir(exist_ok=True)
+LOGS_DIR = TEST_DIR / 'logs' if TESTING else BASE_DIR / 'logs'
+LOGS_DIR.mkdir(parents=True, exist_ok=True)
 
 LOGGING = {
     'version': 1,
@@ -280,9 +313,11 @@ LOGGING = {
     'handlers': {
         'security_file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'security.event_pipeline.BatchedFileHandler',
             'filename': LOGS_DIR / 'security.log',
             'formatter': 'secure',
+            'batch_size': 256,
+            'flush_interval': 1.0,  # Délai max avant écriture, y compris pour les loggers directs
         },
         'console': {
             'level': 'INFO',
@@ -350,6 +385,9 @@ ANONYMIZATION_CONFIG = {
     'ZERO_KNOWLEDGE_AUTH': env.bool('ZERO_KNOWLEDGE_AUTH', True),
     'LAYER_ROTATION_HOURS': env.int('AUTO_LAYER_ROTATION_HOURS', 24),
     'MESSAGE_RETENTION_DAYS': 7,
+    # Une table de messages par jour : la rétention supprime des partitions entières
+    'PARTITIONED_MESSAGES': env.bool('PARTITIONED_MESSAGES', False),
+    'ROOM_HISTORY_SIZE': 50,  # Messages rejoués à l'arrivée dans une salle (0 = aucun)
     'KEY_ROTATION_HOURS': 6,
     'IP_LOGGING': False,
     'METADATA_STRIPPING': True,
@@ -367,10 +405,112 @@ ANONYMIZATION_CONFIG = {
 }
 
 
+# Audit des fuites dans les réponses (thread d'arrière-plan, échantillonné)
+SECURITY_AUDIT_CONFIG = {
+    'RESPONSE_AUDIT_ENABLED': env.bool('RESPONSE_AUDIT_ENABLED', True),
+    'RESPONSE_AUDIT_SAMPLE_RATE': env.float('RESPONSE_AUDIT_SAMPLE_RATE', 0.1),
+    'RESPONSE_AUDIT_QUEUE_SIZE': 256,
+    'RESPONSE_AUDIT_MAX_BYTES': 512 * 1024,
+}
+
+# Pipeline des événements de sécurité (file bornée + thread d'écriture)
+SECURITY_LOGGING_CONFIG = {
+    'ASYNC': env.bool('SECURITY_LOGGING_ASYNC', True),
+    'QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 256,
+    'FLUSH_INTERVAL': 1.0,
+    'AGGREGATION_WINDOW': 5.0,
+}
+
+# Table de rate limiting en mémoire partagée entre les workers ASGI locaux
+RATE_LIMIT_SHARED_MEMORY = {
+    'ENABLED': env.bool('RATE_LIMIT_SHARED_MEMORY', True),
+    'NAME': env('RATE_LIMIT_SHM_NAME', default='lain_rate_limit'),
+    'SLOTS': 65536,
+    'STRIPES': 1024,
+}
+
+# Stockage fragmenté des gros blobs chiffrés (anonymization.fragments)
+FRAGMENT_CONFIG = {
+    'FRAGMENT_SIZE': 64 * 1024,
+    'DATABASES': ['default'],  # ['default', 'anonymous_mapping'] pour répartir les fragments
+    'BATCH_SIZE': 32,
+}
+
+# Expiration par lots (anonymization.expiry) : commande expire_messages,
+# ou tâche asynchrone dans chaque processus ASGI si IN_PROCESS. Sans l'un ni
+# l'autre, les purges de layers brûlés ne sont reprises qu'au démarrage des
+# workers ASGI (asgi.py) : planifier expire_messages hors ASGI.
+EXPIRY_CONFIG = {
+    'IN_PROCESS': env.bool('EXPIRY_IN_PROCESS', False),
+    'INTERVAL': 30,
+    'BATCH_SIZE': 1000,
+    'TARGET_LATENCY': 0.05,  # Latence visée par lot (s) ; au-delà, lots plus petits et pause
+    'MAX_PAUSE': 2.0,
+}
+
+# Compteurs des API de statut (anonymization.stats), recomptés depuis la base
+# toutes les RECONCILE_INTERVAL secondes. Tenus dans CACHE seulement si c'est
+# un cache partagé (Redis, Memcached) ; avec LocMemCache, lus en base
+STATS_CONFIG = {
+    'CACHE': 'default',
+    'RECONCILE_INTERVAL': 300,
+    'ACTIVE_WINDOW_MINUTES': 10,
+    'HLL_PRECISION': 12,
+}
+
+# Cache à remplissage unique (lain_chat.singleflight) des API de statut et de listing.
+# Les listes de layers (invalidées à chaque écriture) ne sont mises en cache
+# que si CACHE est partagé entre workers (Redis, Memcached)
+SINGLE_FLIGHT_CONFIG = {
+    'CACHE': 'default',
+    'TTL': 5,  # Fraîcheur (s), ±JITTER
+    'STALE_TTL': 30,  # Valeur périmée encore servie pendant le recalcul
+    'JITTER': 0.1,
+    'LOCK_TIMEOUT': 10,
+    'WAIT_TIMEOUT': 5,
+}
+
+# Registre des rooms (chat.registry) : invalidé par diffusion sur le channel
+# layer (Redis seulement, écouté dès le démarrage dans asgi.py), rechargé au
+# plus tard après RELOAD_INTERVAL secondes
+ROOM_REGISTRY_CONFIG = {
+    'RELOAD_INTERVAL': 60,
+}
+
+# Tampon d'écriture (lain_chat.write_buffer) : last_active et compteurs
+# écrits au plus une fois par INTERVAL ; INTERVAL = 0 écrit immédiatement
+WRITE_BUFFER_CONFIG = {
+    'INTERVAL': 5.0,
+    'MAX_PENDING': 1000,  # Flush anticipé au-delà de ce nombre de lignes en attente
+    'BATCH_SIZE': 500,
+}
+
+KDF_POOL_CONFIG = {
+    'ENABLED': env.bool('KDF_POOL_ENABLED', True),
+    'WORKERS': env.int('KDF_POOL_WORKERS', 2),
+    'MAX_PENDING': 16,  # Dérivations simultanées max avant refus
+    'ADMISSION_TIMEOUT': 0.5,
+    'TASK_TIMEOUT': 10.0,
+}
+
+
 ENCRYPTION_CONFIG = {
     'MASTER_KEY': env('ENCRYPTION_MASTER_KEY', default=''),
     'LAYER_SALT_KEY': env('LAYER_SALT_KEY', default=''),
     'FRAGMENT_KEY': env('FRAGMENT_ENCRYPTION_KEY', default=''),
+    'KEYS_DIR': TEST_DIR / 'keys' if TESTING else BASE_DIR / '.lain_keys',
+    'KEY_RING_POLL_SECONDS': 30,
+    # 1 = jeton Fernet historique, 2 = enveloppe binaire AES-GCM,
+    # 3 = AES-GCM sous la sous-clé du layer (crypto-shredding) ; lecture de tous
+    'ENVELOPE_VERSION': 3,
+    'LAYER_KEY_CACHE_SIZE': 1024,
+    'LAYER_KEY_CACHE_TTL': 60,  # Délai max avant qu'un autre processus oublie une clé brûlée
+    'BATCH_WORKERS': 0,  # encrypt_many/decrypt_many : 0 = os.cpu_count()
+    'PLAINTEXT_CACHE_SIZE': 2048,  # Messages déchiffrés gardés en mémoire (0 = désactivé)
+    'PLAINTEXT_CACHE_TTL': 300,
+    'PLAINTEXT_CACHE_REVOCATION_INTERVAL': 1,  # Relecture des burns des autres workers (secondes)
+    'BLIND_INDEX_EPOCH': env.int('BLIND_INDEX_EPOCH', 0),  # Incrémenter pour faire tourner les index
 }
 
 
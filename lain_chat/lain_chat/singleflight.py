@@ -0,0 +1,209 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+
+
+logger = logging.getLogger('lain_models')
+
+# Modules des backends CACHES communs à tous les processus, aux incr()/add() atomiques
+SHARED_BACKENDS = ('redis', 'memcached')
+
+
+def is_shared_cache(cache) -> bool:
+    """Vrai si les écritures dans ce cache sont vues par tous les workers (pas LocMemCache)"""
+    module = type(cache).__module__
+    return any(name in module for name in SHARED_BACKENDS)
+
+
+class SingleFlightCache:
+    """Cache à remplissage unique au-dessus d'un backend CACHES
+
+    Chaque entrée est (valeur, frais_jusqu_a) et vit ttl + stale_ttl secondes :
+    - fraîche : renvoyée telle quelle ;
+    - périmée : renvoyée aussitôt, un seul appelant la recalcule en arrière-plan
+      (stale-while-revalidate) ;
+    - absente : un seul calcul par clé. Dans le processus, les autres appelants
+      attendent son résultat ; entre processus, un verrou cache.add() fait
+      attendre les autres jusqu'à wait_timeout avant qu'ils calculent eux-mêmes.
+    Les TTL sont tirés dans ±jitter pour que les clés n'expirent pas ensemble.
+
+    invalidate() change la version de la clé après le commit en cours : une
+    entrée calculée avant (y compris un recalcul en arrière-plan qui se
+    termine après) porte l'ancienne version et n'est plus servie. Sur un
+    cache local, l'invalidation n'atteindrait pas les autres workers : les
+    entrées shared_only n'y sont pas mises en cache du tout.
+    """
+
+    PREFIX = 'lain:sf:'
+
+    def __init__(self, cache_alias: str = 'default', ttl: float = 5, stale_ttl: float = 30,
+                 jitter: float = 0.1, lock_timeout: float = 10, wait_timeout: float = 5):
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.jitter = jitter
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self._inflight = {}  # clé -> threading.Event du calcul en cours dans ce processus
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.computations = 0
+        self.waits = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'SINGLE_FLIGHT_CONFIG', {})
+        return cls(
+            cache_alias=config.get('CACHE', 'default'),
+            ttl=config.get('TTL', 5),
+            stale_ttl=config.get('STALE_TTL', 30),
+            jitter=config.get('JITTER', 0.1),
+            lock_timeout=config.get('LOCK_TIMEOUT', 10),
+            wait_timeout=config.get('WAIT_TIMEOUT', 5),
+        )
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    @property
+    def shared(self) -> bool:
+        return is_shared_cache(self.cache)
+
+    def _lookup(self, key: str):
+        """(entrée, version courante) ; entrée None si absente ou d'une version invalidée"""
+        values = self.cache.get_many([self.PREFIX + key, self.PREFIX + 'version:' + key])
+        version = values.get(self.PREFIX + 'version:' + key)
+        entry = values.get(self.PREFIX + key)
+        if entry is not None and entry[2] != version:
+            entry = None
+        return entry, version
+
+    def _store(self, key: str, value, ttl: float, version):
+        ttl = self._jittered(ttl)
+        self.cache.set(self.PREFIX + key, (value, time.time() + ttl, version), timeout=ttl + self.stale_ttl)
+
+    def _compute(self, key: str, compute, ttl: float, version, locked: bool = True):
+        """Calcule et stocke la valeur ; libère le verrou inter-processus si on le tient"""
+        try:
+            value = compute()
+            self._store(key, value, ttl, version)
+            self.computations += 1
+            return value
+        finally:
+            if locked:
+                self.cache.delete(self.PREFIX + 'lock:' + key)
+
+    def _revalidate(self, key: str, compute, ttl: float, version):
+        try:
+            self._compute(key, compute, ttl, version)
+        except Exception as e:
+            logger.warning(f"Background refresh of {key} failed: {e}")
+        finally:
+            connections.close_all()
+
+    def _wait_for_value(self, key: str):
+        """Attend qu'un autre processus remplisse la clé ; None après wait_timeout"""
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            entry, _ = self._lookup(key)
+            if entry is not None:
+                return entry
+            delay = min(delay * 2, 0.2)
+        return None
+
+    def get_or_compute(self, key: str, compute, ttl: float = None, shared_only: bool = False):
+        """Valeur de la clé ; shared_only pour les clés invalidées par des écritures"""
+        if shared_only and not self.shared:
+            return compute()
+
+        ttl = self.ttl if ttl is None else ttl
+        entry, version = self._lookup(key)
+
+        if entry is not None:
+            value, fresh_until, _ = entry
+            if fresh_until > time.time():
+                self.hits += 1
+                return value
+
+            self.stale_hits += 1
+            if self.cache.add(self.PREFIX + 'lock:' + key, 1, timeout=self.lock_timeout):
+                threading.Thread(
+                    target=self._revalidate, args=(key, compute, ttl, version),
+                    name='lain-singleflight-refresh', daemon=True
+                ).start()
+            return value
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = self._inflight[key] = threading.Event()
+
+        if not leader:
+            # Même processus : on attend le calcul en cours
+            self.waits += 1
+            event.wait(self.wait_timeout)
+            entry, _ = self._lookup(key)
+            return entry[0] if entry is not None else compute()
+
+        try:
+            if not self.cache.add(self.PREFIX + 'lock:' + key, 1, timeout=self.lock_timeout):
+                self.waits += 1
+                entry = self._wait_for_value(key)
+                if entry is not None:
+                    return entry[0]
+                return self._compute(key, compute, ttl, version, locked=False)  # Verrou orphelin ou calcul trop long
+
+            return self._compute(key, compute, ttl, version)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def invalidate(self, key: str, using: str = None):
+        """Invalide la clé après le commit de la transaction en cours sur using (aussitôt hors transaction)
+
+        Avant le commit, un autre worker pourrait recalculer l'ancienne valeur
+        et la remettre en cache.
+        """
+        # La version doit survivre à toute entrée qu'elle invalide
+        timeout = self.ttl * (1 + self.jitter) + self.stale_ttl + 60
+        transaction.on_commit(
+            lambda: self.cache.set(self.PREFIX + 'version:' + key, uuid.uuid4().hex, timeout=timeout),
+            using=using
+        )
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'computations': self.computations,
+            'waits': self.waits,
+        }
+
+
+_single_flight_cache = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight_cache() -> SingleFlightCache:
+    """Récupère le cache à remplissage unique du processus"""
+    global _single_flight_cache
+
+    if _single_flight_cache is None:
+        with _single_flight_lock:
+            if _single_flight_cache is None:
+                _single_flight_cache = SingleFlightCache.from_settings()
+
+    return _single_flight_cache
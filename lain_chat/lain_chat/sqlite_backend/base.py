@@ -0,0 +1,34 @@
+from django.db.backends.sqlite3 import base
+
+
+# Profil par défaut ; surchargeable par base via DATABASES[alias]['PRAGMAS']
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',         # Lecteurs et écrivain ne se bloquent plus
+    'synchronous': 'NORMAL',       # Sûr en WAL : seul le dernier commit peut être perdu sur coupure
+    'busy_timeout': 5000,          # ms d'attente du verrou avant « database is locked »
+    'cache_size': -64000,          # Négatif = KiB (64 Mo)
+    'mmap_size': 268435456,        # 256 Mo lus par mmap
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Backend SQLite réglé pour la charge concurrente des threads ASGI
+
+    Applique les PRAGMA à chaque connexion et ouvre les transactions avec
+    BEGIN IMMEDIATE : l'écrivain prend le verrou dès le début au lieu d'échouer
+    lors de la promotion lecture -> écriture (busy_timeout ne s'y applique pas).
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+
+        pragmas = {**DEFAULT_PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE', 'IMMEDIATE')
+        self.cursor().execute(f'BEGIN {mode}')
@@ -0,0 +1,163 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+
+
+logger = logging.getLogger('lain_models')
+
+
+class WriteBuffer:
+    """Coalesce en mémoire les écritures fréquentes et peu critiques
+
+    touch() garde la dernière valeur d'un champ (horodatage last_active...),
+    increment() cumule un compteur. flush() écrit le tout en quelques requêtes :
+    un bulk_update par (modèle, champ) pour les touches, un UPDATE ... SET
+    champ = champ + n par (modèle, champ, n) pour les compteurs. Une ligne
+    très sollicitée ne coûte plus qu'une écriture par intervalle.
+    """
+
+    def __init__(self, interval: float = 5.0, max_pending: int = 1000, batch_size: int = 500):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._touches = defaultdict(dict)  # (modèle, champ) -> {pk: valeur}
+        self._increments = defaultdict(lambda: defaultdict(int))  # (modèle, champ) -> {pk: n}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self.flushes = 0
+        self.coalesced = 0
+        self.rows_written = 0
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'WRITE_BUFFER_CONFIG', {})
+        return cls(
+            interval=config.get('INTERVAL', 5.0),
+            max_pending=config.get('MAX_PENDING', 1000),
+            batch_size=config.get('BATCH_SIZE', 500),
+        )
+
+    def _added(self, is_new: bool):
+        if is_new:
+            self._pending += 1
+        else:
+            self.coalesced += 1
+        return self.interval <= 0 or self._pending >= self.max_pending
+
+    def touch(self, model, pk, field: str, value):
+        """Écrit value dans model.field pour pk au prochain flush (la dernière valeur gagne)"""
+        with self._lock:
+            values = self._touches[(model, field)]
+            is_new = pk not in values
+            values[pk] = value
+            full = self._added(is_new)
+
+        self._after_add(full)
+
+    def increment(self, model, pk, field: str, amount: int = 1):
+        """Ajoute amount à model.field pour pk au prochain flush"""
+        with self._lock:
+            counters = self._increments[(model, field)]
+            is_new = pk not in counters
+            counters[pk] += amount
+            full = self._added(is_new)
+
+        self._after_add(full)
+
+    def _after_add(self, full: bool):
+        if full:
+            self.flush()
+        elif self._worker is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='lain-write-buffer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._pending:
+                continue  # Rien à écrire : ce thread n'a ouvert aucune connexion
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write buffer flush failed: {e}")
+            finally:
+                connections.close_all()
+
+    def _restore(self, touches, increments):
+        """Remet en attente un flush échoué (les valeurs plus récentes gardent la priorité)"""
+        with self._lock:
+            for key, values in touches.items():
+                for pk, value in values.items():
+                    self._touches[key].setdefault(pk, value)
+            for key, counters in increments.items():
+                for pk, amount in counters.items():
+                    self._increments[key][pk] += amount
+            self._pending = sum(map(len, self._touches.values())) + sum(map(len, self._increments.values()))
+
+    def flush(self) -> int:
+        """Écrit les touches et compteurs en attente ; renvoie le nombre de lignes écrites"""
+        with self._flush_lock:
+            with self._lock:
+                touches, self._touches = self._touches, defaultdict(dict)
+                increments, self._increments = self._increments, defaultdict(lambda: defaultdict(int))
+                self._pending = 0
+
+            if not touches and not increments:
+                return 0
+
+            written = 0
+            try:
+                for (model, field), values in touches.items():
+                    objects = [model(pk=pk, **{field: value}) for pk, value in values.items()]
+                    # _base_manager : pas de filtre de manager par défaut (layers tombstonés...)
+                    written += model._base_manager.bulk_update(objects, [field], batch_size=self.batch_size)
+
+                for (model, field), counters in increments.items():
+                    by_amount = defaultdict(list)
+                    for pk, amount in counters.items():
+                        by_amount[amount].append(pk)
+                    for amount, pks in by_amount.items():
+                        written += model._base_manager.filter(pk__in=pks).update(**{field: F(field) + amount})
+            except Exception:
+                self._restore(touches, increments)
+                raise
+
+            self.flushes += 1
+            self.rows_written += written
+            return written
+
+    def stats(self) -> dict:
+        return {
+            'pending': self._pending,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+        }
+
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+def get_write_buffer() -> WriteBuffer:
+    """Récupère le tampon d'écriture du processus (vidé aussi à l'arrêt)"""
+    global _write_buffer
+
+    if _write_buffer is None:
+        with _write_buffer_lock:
+            if _write_buffer is None:
+                _write_buffer = WriteBuffer.from_settings()
+                atexit.register(_write_buffer.flush)
+
+    return _write_buffer
@@ -0,0 +1,257 @@
+import atexit
+import logging
+import queue
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from django.conf import settings
+
+
+class BatchedFileHandler(logging.FileHandler):
+    """FileHandler qui accumule les lignes et les écrit en un seul appel
+
+    Le tampon est écrit dès batch_size lignes, et au plus tard flush_interval
+    secondes après la première ligne en attente : un thread commun à tous les
+    handlers s'en charge, que le pipeline d'événements tourne ou non (les
+    loggers qui écrivent directement n'y passent pas).
+    """
+
+    _instances = weakref.WeakSet()
+    _flusher = None
+    _flusher_lock = threading.Lock()
+
+    def __init__(self, filename, mode='a', encoding=None, delay=False, errors=None,
+                 batch_size=256, flush_interval=1.0):
+        super().__init__(filename, mode=mode, encoding=encoding, delay=delay, errors=errors)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self._first_buffered = None
+        BatchedFileHandler._instances.add(self)
+
+    def emit(self, record):
+        # Appelé par handle() sous self.lock, comme flush()
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+
+        if self._first_buffered is None:
+            self._first_buffered = time.monotonic()
+            self._ensure_flusher()
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.buffer:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(''.join(self.buffer))
+                self.buffer.clear()
+            self._first_buffered = None
+            super().flush()
+        finally:
+            self.release()
+
+    def flush_if_due(self, now):
+        first_buffered = self._first_buffered
+        if first_buffered is not None and now - first_buffered >= self.flush_interval:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    @classmethod
+    def flush_all(cls):
+        for handler in list(cls._instances):
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+    @classmethod
+    def _ensure_flusher(cls):
+        if cls._flusher is not None:
+            return
+
+        with cls._flusher_lock:
+            if cls._flusher is None:
+                cls._flusher = threading.Thread(
+                    target=cls._run_flusher, name='lain-log-flush', daemon=True
+                )
+                cls._flusher.start()
+                atexit.register(cls.flush_all)
+
+    @classmethod
+    def _run_flusher(cls):
+        while True:
+            handlers = list(cls._instances)
+            interval = min((handler.flush_interval for handler in handlers), default=1.0)
+            time.sleep(max(interval / 2, 0.05))
+
+            now = time.monotonic()
+            for handler in handlers:
+                try:
+                    handler.flush_if_due(now)
+                except Exception:
+                    pass
+
+
+class SecurityEventPipeline:
+    """File d'événements de sécurité vidée par un thread d'écriture unique
+
+    Les événements identiques reçus dans la même fenêtre sont fusionnés en une
+    seule ligne avec un compteur. Quand la file est pleine, les événements sont
+    jetés (et comptés) plutôt que de bloquer la requête. Un événement qui ne
+    peut pas être formaté est jeté et compté de même : il n'arrête jamais le
+    thread, qui est de toute façon relancé par submit() s'il est mort.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=256, flush_interval=1.0, aggregation_window=5.0):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.aggregation_window = aggregation_window
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'SECURITY_LOGGING_CONFIG', {})
+        return cls(
+            queue_size=config.get('QUEUE_SIZE', 10000),
+            batch_size=config.get('BATCH_SIZE', 256),
+            flush_interval=config.get('FLUSH_INTERVAL', 1.0),
+            aggregation_window=config.get('AGGREGATION_WINDOW', 5.0),
+        )
+
+    def submit(self, secure_logger, level, event_type, details):
+        """Met un événement en file sans jamais bloquer l'appelant"""
+        if not secure_logger.logger.isEnabledFor(level):
+            return
+
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait((secure_logger, level, event_type, details))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _ensure_worker(self):
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            return
+
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                if self._worker is None:
+                    atexit.register(self.stop)
+                elif not self._stopping.is_set():
+                    logging.getLogger('lain_security').error("Security event worker died, restarting")
+                self._worker = threading.Thread(
+                    target=self._run, name='lain-security-log', daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        pending = OrderedDict()
+        window_start = time.monotonic()
+
+        while True:
+            urgent = self._collect(pending)
+
+            now = time.monotonic()
+            if (urgent or len(pending) >= self.batch_size
+                    or now - window_start >= self.aggregation_window
+                    or self._stopping.is_set()):
+                self._flush(pending)
+                window_start = now
+                if urgent:
+                    # Le reste attend le thread lain-log-flush (flush_interval au plus)
+                    BatchedFileHandler.flush_all()
+
+            if self._stopping.is_set() and self.queue.empty():
+                return
+
+    def _collect(self, pending):
+        """Lit un lot d'événements et les agrège ; renvoie True si un flush immédiat est requis"""
+        urgent = False
+        try:
+            item = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return False
+
+        for _ in range(self.batch_size):
+            try:
+                secure_logger, level, event_type, details = item
+                safe_details = secure_logger._sanitize_details(details) if details else "None"
+                key = (secure_logger.logger.name, level, event_type, safe_details)
+
+                entry = pending.get(key)
+                if entry is None:
+                    pending[key] = [secure_logger, 1]
+                else:
+                    entry[1] += 1
+
+                if level >= logging.ERROR:
+                    urgent = True
+            except Exception:
+                # Événement inexploitable : compté avec les événements jetés
+                with self._dropped_lock:
+                    self.dropped += 1
+
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+        return urgent
+
+    def _flush(self, pending):
+        for (name, level, event_type, safe_details), (secure_logger, count) in pending.items():
+            try:
+                secure_logger._emit(level, event_type, safe_details, count)
+            except Exception:
+                pass
+        pending.clear()
+
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            logging.getLogger('lain_security').warning(
+                f"SECURITY_EVENT:EVENTS_DROPPED:ID:{secrets.token_hex(8)}:DETAILS:{{'dropped': {dropped}}}"
+            )
+
+    def stop(self, timeout=2.0):
+        """Vide la file avant l'arrêt du processus"""
+        if self._worker is None:
+            return
+
+        self._stopping.set()
+        self._worker.join(timeout)
+        BatchedFileHandler.flush_all()
+
+
+_event_pipeline = None
+_event_pipeline_lock = threading.Lock()
+
+def get_event_pipeline() -> SecurityEventPipeline:
+    """Récupère l'instance singleton du pipeline d'événements"""
+    global _event_pipeline
+
+    if _event_pipeline is None:
+        with _event_pipeline_lock:
+            if _event_pipeline is None:
+                _event_pipeline = SecurityEventPipeline.from_settings()
+
+    return _event_pipeline
@@ -0,0 +1,21 @@
+import base64
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.utils.encoding import force_bytes
+
+from .kdf_pool import get_kdf_pool, pbkdf2_sha256
+
+
+class OffloadedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 de Django, calculé dans le pool KDF
+
+    Même algorithme et même format : les hash existants restent valides.
+    Lève KDFPoolSaturated si le pool refuse la dérivation. Le thread appelant
+    (login, register) attend toujours la fin du calcul : seul le GIL est libéré.
+    """
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        hash = get_kdf_pool().run(pbkdf2_sha256, force_bytes(password), force_bytes(salt), iterations)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return "%s$%d$%s$%s" % (self.algorithm, iterations, salt, hash)
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+
+logger = logging.getLogger('lain_security')
+
+
+class KDFPoolSaturated(Exception):
+    """Trop de dérivations en attente : la requête est refusée plutôt que mise en file"""
+
+
+def pbkdf2_sha256(password: bytes, salt: bytes, iterations: int, dklen: int = None) -> bytes:
+    """Exécuté dans un processus du pool (fonction de module : picklable)"""
+    return hashlib.pbkdf2_hmac('sha256', password, salt, iterations, dklen)
+
+
+class KDFPool:
+    """Pool de processus borné pour les KDF coûteuses (PBKDF2, hash de mots de passe)
+
+    Le calcul sort du processus ASGI : une rafale de connexions ne monopolise
+    plus le GIL. Le thread sync qui appelle run() reste en revanche bloqué sur
+    le résultat pendant toute la dérivation ; c'est max_pending qui borne le
+    nombre de ces threads occupés : au-delà, l'appelant attend au plus
+    admission_timeout puis reçoit KDFPoolSaturated.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16, admission_timeout: float = 0.5,
+                 task_timeout: float = 10.0, enabled: bool = True):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.admission_timeout = admission_timeout
+        self.task_timeout = task_timeout
+        self.enabled = enabled
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        config = getattr(settings, 'KDF_POOL_CONFIG', {})
+        return cls(
+            workers=config.get('WORKERS', 2),
+            max_pending=config.get('MAX_PENDING', 16),
+            admission_timeout=config.get('ADMISSION_TIMEOUT', 0.5),
+            task_timeout=config.get('TASK_TIMEOUT', 10.0),
+            enabled=config.get('ENABLED', True),
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # spawn : pas de fork d'un processus qui porte des threads et des connexions DB
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+
+    def run(self, func, *args):
+        """Exécute func(*args) dans le pool et attend le résultat"""
+        if not self.enabled:
+            return func(*args)
+
+        start_time = time.perf_counter()
+        if not self._slots.acquire(timeout=self.admission_timeout):
+            with self._metrics_lock:
+                self.rejected += 1
+            raise KDFPoolSaturated(f"KDF pool saturated ({self.max_pending} pending)")
+
+        with self._metrics_lock:
+            self.in_flight += 1
+            self.submitted += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+        try:
+            future = self._get_executor().submit(func, *args)
+            queued_at = time.perf_counter()
+            result = future.result(timeout=self.task_timeout)
+
+            with self._metrics_lock:
+                self.total_wait += queued_at - start_time
+                self.total_run += time.perf_counter() - queued_at
+            return result
+
+        except BrokenProcessPool:
+            # Worker tué (OOM...) : le prochain appel recrée le pool
+            with self._executor_lock:
+                self._executor = None
+            with self._metrics_lock:
+                self.failed += 1
+            raise
+
+        except Exception:
+            with self._metrics_lock:
+                self.failed += 1
+            raise
+
+        finally:
+            with self._metrics_lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        completed = max(self.submitted - self.failed, 1)
+        return {
+            'enabled': self.enabled,
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'queue_depth': max(self.in_flight - self.workers, 0),
+            'peak_in_flight': self.peak_in_flight,
+            'max_pending': self.max_pending,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'avg_admission_ms': round(self.total_wait / completed * 1000, 3),
+            'avg_run_ms': round(self.total_run / completed * 1000, 3),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_kdf_pool = None
+_kdf_pool_lock = threading.Lock()
+
+def get_kdf_pool() -> KDFPool:
+    """Récupère le pool KDF du processus"""
+    global _kdf_pool
+
+    if _kdf_pool is None:
+        with _kdf_pool_lock:
+            if _kdf_pool is None:
+                _kdf_pool = KDFPool.from_settings()
+
+    return _kdf_pool
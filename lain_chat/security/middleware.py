@@ -1,28 +1,42 @@
+import copy
 import hashlib
 import time
 import re
+import queue
+import random
+import threading
 from django.utils.deprecation import MiddlewareMixin
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden, QueryDict
 from django.conf import settings
 from django.core.cache import cache
 import logging
 import secrets
 from urllib.parse import urlparse
 
+from .event_pipeline import get_event_pipeline
+from .ratelimit import get_shared_rate_limit_table
+
 
 class SecureLogger:
     def __init__(self, name):
         self.logger = logging.getLogger(name)
+        self.asynchronous = getattr(settings, 'SECURITY_LOGGING_CONFIG', {}).get('ASYNC', True)
     
     def log_security_event(self, level, event_type, details=None):
-        
-        timestamp = int(time.time())
-        event_id = secrets.token_hex(8)
-        
+        """Met l'événement en file ; formatage et écriture se font hors requête"""
+        if self.asynchronous:
+            get_event_pipeline().submit(self, level, event_type, details)
+            return
         
         safe_details = self._sanitize_details(details) if details else "None"
+        self._emit(level, event_type, safe_details)
+    
+    def _emit(self, level, event_type, safe_details, count=1):
+        event_id = secrets.token_hex(8)
         
         message = f"SECURITY_EVENT:{event_type}:ID:{event_id}:DETAILS:{safe_details}"
+        if count > 1:
+            message += f":COUNT:{count}"
         self.logger.log(level, message)
     
     def _sanitize_details(self, details):
@@ -40,6 +54,121 @@ class SecureLogger:
 
 security_logger = SecureLogger('lain_security')
 
+
+class ResponseLeakAuditor:
+    """Audit échantillonné des réponses, exécuté hors du chemin de requête"""
+    
+    # Patterns à éviter dans les réponses (compilés une fois, scan direct sur les bytes)
+    SENSITIVE_PATTERNS = [
+        re.compile(rb'\b(?:\d{1,3}\.){3}\d{1,3}\b'),
+        re.compile(rb'password\s*[:=]\s*\w+', re.IGNORECASE),
+        re.compile(rb'secret\s*[:=]\s*\w+', re.IGNORECASE),
+        re.compile(rb'token\s*[:=]\s*\w+', re.IGNORECASE),
+    ]
+    
+    AUDITED_CONTENT_TYPES = ('text/', 'application/json', 'application/javascript')
+    
+    # Réponses non auditées (file pleine) : un avertissement au plus par intervalle
+    DROP_REPORT_INTERVAL = 60
+    
+    def __init__(self):
+        config = getattr(settings, 'SECURITY_AUDIT_CONFIG', {})
+        self.enabled = config.get('RESPONSE_AUDIT_ENABLED', True)
+        self.sample_rate = config.get('RESPONSE_AUDIT_SAMPLE_RATE', 0.1)
+        self.max_bytes = config.get('RESPONSE_AUDIT_MAX_BYTES', 512 * 1024)
+        self.queue = queue.Queue(maxsize=config.get('RESPONSE_AUDIT_QUEUE_SIZE', 256))
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._dropped_reported = time.monotonic()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._skipped_prefixes = tuple(
+            prefix for prefix in (settings.STATIC_URL, settings.MEDIA_URL) if prefix
+        )
+    
+    def submit(self, request, response):
+        """Met la réponse en file d'audit si elle est échantillonnée"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return
+        
+        if getattr(response, 'streaming', False):
+            return
+        
+        if request.path.startswith(self._skipped_prefixes):
+            return
+        
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(self.AUDITED_CONTENT_TYPES):
+            return
+        
+        content = response.content
+        if not content:
+            return
+        
+        self._ensure_worker()
+        try:
+            # Les bytes sont immuables : pas de copie du corps
+            self.queue.put_nowait(content)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+    
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name='lain-response-audit', daemon=True
+                )
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            try:
+                content = self.queue.get(timeout=self.DROP_REPORT_INTERVAL)
+            except queue.Empty:
+                self.report_dropped()
+                continue
+            
+            try:
+                self.scan(content)
+            except Exception:
+                pass
+            finally:
+                self.queue.task_done()
+            self.report_dropped()
+    
+    def report_dropped(self, force=False) -> int:
+        """Signale les réponses jetées depuis le dernier avertissement ; renvoie leur nombre"""
+        if not force and time.monotonic() - self._dropped_reported < self.DROP_REPORT_INTERVAL:
+            return 0
+        
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+            self._dropped_reported = time.monotonic()
+        if dropped:
+            security_logger.log_security_event(
+                logging.WARNING, 'RESPONSE_AUDIT_DROPPED', {'dropped': dropped}
+            )
+        return dropped
+    
+    def scan(self, content):
+        """Recherche des données sensibles dans le corps (bornée à max_bytes)"""
+        for pattern in self.SENSITIVE_PATTERNS:
+            if pattern.search(content, 0, self.max_bytes):
+                security_logger.log_security_event(
+                    logging.WARNING,
+                    'SENSITIVE_DATA_LEAK',
+                    {'pattern': pattern.pattern[:20].decode('ascii', errors='ignore')}
+                )
+                return True
+        return False
+
+
+response_auditor = ResponseLeakAuditor()
+
 class SecurityHardeningMiddleware(MiddlewareMixin):
     
     
@@ -182,6 +311,9 @@ class AdvancedSecurityMiddleware(MiddlewareMixin):
         self.cache_cleanup_interval = 300  
         self.last_cleanup = time.time()
         
+        # Table partagée entre workers locaux (None => cache Django / mémoire)
+        self.shared_rate_table = get_shared_rate_limit_table()
+        
         super().__init__(get_response)
     
     def process_request(self, request):
@@ -255,8 +387,6 @@ class AdvancedSecurityMiddleware(MiddlewareMixin):
     
     def _is_rate_limited(self, request):
         """Système de rate limiting production"""
-        self._cleanup_memory_cache()
-        
         # Générer une clé unique basée sur l'empreinte anonyme
         client_key = f"rate_limit:{getattr(request, 'anonymous_fingerprint', 'unknown')}"
         
@@ -264,6 +394,16 @@ class AdvancedSecurityMiddleware(MiddlewareMixin):
         limit_type = self._get_limit_type(request.path)
         limit_config = self.rate_limits[limit_type]
         
+        if self.shared_rate_table is not None:
+            return self.shared_rate_table.hit(
+                client_key,
+                limit_config['requests'],
+                limit_config['window'],
+                limit_config['burst']
+            )
+        
+        self._cleanup_memory_cache()
+        
         current_time = int(time.time())
         window_start = current_time - limit_config['window']
         
@@ -537,31 +677,9 @@ class AdvancedSecurityMiddleware(MiddlewareMixin):
         
         response['Server'] = 'WebServer/1.0'
     
-    def _validate_response_content(self, response):
-        
-        # Vérifier qu'on ne leak pas d'infos sensibles dans le contenu
-        if hasattr(response, 'content') and response.content:
-            try:
-                content_str = response.content.decode('utf-8', errors='ignore').lower()
-                
-                # Patterns à éviter dans les réponses
-                sensitive_patterns = [
-                    r'\b(?:\d{1,3}\.){3}\d{1,3}\b',  
-                    r'password\s*[:=]\s*\w+',       
-                    r'secret\s*[:=]\s*\w+',          
-                    r'token\s*[:=]\s*\w+',          
-                ]
-                
-                for pattern in sensitive_patterns:
-                    if re.search(pattern, content_str):
-                        security_logger.log_security_event(
-                            logging.WARNING,
-                            'SENSITIVE_DATA_LEAK',
-                            {'pattern': pattern[:20]}
-                        )
-                        break
-            except:
-                pass  
+    def _validate_response_content(self, request, response):
+        """Délègue l'audit de fuite à l'auditeur en arrière-plan"""
+        response_auditor.submit(request, response)
     
    
     
@@ -584,13 +702,82 @@ class AdvancedSecurityMiddleware(MiddlewareMixin):
         
         self._remove_fingerprinting_headers(response)
         
-        self._validate_response_content(response)
+        self._validate_response_content(request, response)
         
         return response
 
+class WebSocketScopeAnonymizer:
+    """Réécriture unique du scope WebSocket, partagée par les middlewares WebSocket"""
+    
+    ALLOWED_PATH_PREFIXES = ('/ws/chat/', '/ws/layer/', '/ws/test/')
+    ALLOWED_PATH = re.compile('|'.join(re.escape(prefix) for prefix in ALLOWED_PATH_PREFIXES))
+    
+    # Gabarit figé des headers essentiels
+    ESSENTIAL_HEADERS = (
+        (b'host', b'127.0.0.1:8000'),
+        (b'connection', b'Upgrade'),
+        (b'upgrade', b'websocket'),
+        (b'sec-websocket-version', b'13'),
+    )
+    # Headers de handshake transmis, dans cet ordre
+    FORWARDED_HEADERS = (b'sec-websocket-key', b'sec-websocket-protocol')
+    
+    IDENTIFYING_FIELDS = frozenset({
+        'user', 'session', 'cookies', 'auth',
+        'remote_addr', 'forwarded_for', 'client', 'headers'
+    })
+    
+    # IP anonymisée définitive toujours localhost
+    ANONYMOUS_CLIENT = ('127.0.0.1', 0)
+    
+    def __init__(self, passthrough_fields=None):
+        # None : tous les champs non identifiants sont conservés
+        self.passthrough_fields = passthrough_fields
+    
+    def is_allowed_path(self, path):
+        return self.ALLOWED_PATH.match(path) is not None
+    
+    def anonymize(self, scope):
+        """Construit le scope anonymisé en une seule passe"""
+        forwarded = {}
+        for name, value in scope.get('headers', ()):
+            if name in self.FORWARDED_HEADERS:
+                forwarded[name] = value  # Header répété : le dernier l'emporte
+        
+        headers = list(self.ESSENTIAL_HEADERS)
+        headers.extend((name, forwarded[name]) for name in self.FORWARDED_HEADERS if name in forwarded)
+        
+        anonymized_scope = {
+            'type': scope['type'],
+            'path': scope['path'],
+            'query_string': scope.get('query_string', b''),
+            'root_path': scope.get('root_path', ''),
+            'scheme': scope.get('scheme', 'ws'),
+            'server': scope.get('server', ('localhost', 8000)),
+            'subprotocols': scope.get('subprotocols', []),
+            'client': self.ANONYMOUS_CLIENT,
+            'headers': headers,
+        }
+        
+        if self.passthrough_fields is None:
+            for key, value in scope.items():
+                if key not in anonymized_scope and key.lower() not in self.IDENTIFYING_FIELDS:
+                    anonymized_scope[key] = value
+        else:
+            for key in self.passthrough_fields:
+                if key in scope:
+                    anonymized_scope[key] = scope[key]
+        
+        return anonymized_scope
+
+
 class WebSocketSecurityMiddleware:
     """Middleware de sécurité spécialement conçu pour les WebSockets"""
     
+    anonymizer = WebSocketScopeAnonymizer(
+        passthrough_fields=('route', 'url_route', 'channel_layer')
+    )
+    
     def __init__(self, inner):
         self.inner = inner
         self.security_logger = SecureLogger('lain_websocket_security')
@@ -598,9 +785,7 @@ class WebSocketSecurityMiddleware:
     async def __call__(self, scope, receive, send):
         if scope['type'] == 'websocket':
             
-            scope = self._anonymize_websocket_scope(scope)
-            
-            
+            # Rejet avant toute réécriture et avant la session d'AuthMiddlewareStack
             if not self._validate_websocket_connection(scope):
                 
                 await send({
@@ -609,59 +794,17 @@ class WebSocketSecurityMiddleware:
                 })
                 return
             
+            scope = self.anonymizer.anonymize(scope)
             scope['security_validated'] = True
             scope['anonymization_level'] = 'maximum'
         
         return await self.inner(scope, receive, send)
     
-    def _anonymize_websocket_scope(self, scope):
-        """Anonymisation robuste du scope WebSocket"""
-        anonymized_scope = {
-            'type': scope['type'],
-            'path': scope['path'],
-            'query_string': scope.get('query_string', b''),
-            'root_path': scope.get('root_path', ''),
-            'scheme': scope.get('scheme', 'ws'),
-            'server': scope.get('server', ('localhost', 8000)),
-            'subprotocols': scope.get('subprotocols', []),
-        }
-        
-        
-        anonymized_scope['client'] = ('127.0.0.1', 0)
-        
-        
-        essential_headers = {
-            b'host': b'127.0.0.1:8000',
-            b'connection': b'Upgrade',
-            b'upgrade': b'websocket',
-            b'sec-websocket-version': b'13',
-        }
-        
-       
-        original_headers = dict(scope.get('headers', []))
-        for key in [b'sec-websocket-key', b'sec-websocket-protocol']:
-            if key in original_headers:
-                essential_headers[key] = original_headers[key]
-        
-        anonymized_scope['headers'] = list(essential_headers.items())
-        
-        
-        safe_fields = ['route', 'url_route', 'channel_layer']
-        for key in safe_fields:
-            if key in scope:
-                anonymized_scope[key] = scope[key]
-        
-        return anonymized_scope
-    
     def _validate_websocket_connection(self, scope):
         """Validation des connexions WebSocket"""
-        # Vérifier que le path est autorisé
-        allowed_paths = ['/ws/chat/', '/ws/layer/', '/ws/test/']
-        
         path = scope['path']
-        for allowed_path in allowed_paths:
-            if path.startswith(allowed_path):
-                return True
+        if self.anonymizer.is_allowed_path(path):
+            return True
         
         # Log de tentative de connexion non autorisée
         self.security_logger.log_security_event(
@@ -672,102 +815,142 @@ class WebSocketSecurityMiddleware:
         
         return False
 
+# Caractères de contrôle supprimés et échappement HTML, en une passe chacun
+_CONTROL_CHARS = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+_HTML_ESCAPES = str.maketrans({'<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#x27;'})
+
+
+def sanitize_input_value(value):
+    """Nettoyage d'une chaîne de caractères"""
+    if not isinstance(value, str):
+        return value
+    
+    value = value.translate(_CONTROL_CHARS)
+    
+    if len(value) > 1000:
+        value = value[:1000]
+    
+    return value.translate(_HTML_ESCAPES)
+
+
+class LazySanitizedQueryDict(QueryDict):
+    """QueryDict dont les valeurs sont nettoyées au premier accès, puis mises en cache"""
+    
+    def __init__(self, *args, **kwargs):
+        self._sanitized_keys = set()
+        super().__init__(*args, **kwargs)
+    
+    @classmethod
+    def wrap(cls, query_dict):
+        """Enveloppe un QueryDict existant sans toucher à ses valeurs"""
+        wrapped = cls(mutable=True, encoding=query_dict.encoding)
+        dict.update(wrapped, dict.items(query_dict))
+        return wrapped
+    
+    def _sanitize_key(self, key):
+        if key in self._sanitized_keys:
+            return
+        
+        try:
+            values = dict.__getitem__(self, key)
+        except KeyError:
+            return
+        
+        dict.__setitem__(self, key, [sanitize_input_value(value) for value in values])
+        self._sanitized_keys.add(key)
+    
+    def __getitem__(self, key):
+        self._sanitize_key(key)
+        return super().__getitem__(key)
+    
+    def _getlist(self, key, default=None, force_list=False):
+        self._sanitize_key(key)
+        return super()._getlist(key, default, force_list)
+    
+    def lists(self):
+        for key in self:
+            self._sanitize_key(key)
+        return super().lists()
+    
+    def pop(self, key, *args):
+        self._sanitize_key(key)
+        self._sanitized_keys.discard(key)
+        return super().pop(key, *args)
+    
+    def popitem(self):
+        key, values = super().popitem()
+        if key not in self._sanitized_keys:
+            values = [sanitize_input_value(value) for value in values]
+        self._sanitized_keys.discard(key)
+        return key, values
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._sanitized_keys.add(key)
+    
+    def setlist(self, key, list_):
+        super().setlist(key, list_)
+        self._sanitized_keys.add(key)
+    
+    def __copy__(self):
+        # Les copies sont des QueryDict ordinaires contenant les valeurs nettoyées
+        result = QueryDict(mutable=True, encoding=self.encoding)
+        for key, value in self.lists():
+            result.setlist(key, value)
+        return result
+    
+    def __deepcopy__(self, memo):
+        result = QueryDict(mutable=True, encoding=self.encoding)
+        memo[id(self)] = result
+        for key, value in self.lists():
+            result.setlist(copy.deepcopy(key, memo), copy.deepcopy(value, memo))
+        return result
+
+
 class RequestSanitizationMiddleware(MiddlewareMixin):
     """Middleware pour nettoyer et valider toutes les entrées utilisateur"""
     
     def process_request(self, request):
         
         
-        # Nettoyer les paramètres GET
+        # Nettoyer les paramètres GET (à la lecture seulement)
         if request.GET:
-            request.GET = self._sanitize_query_dict(request.GET)
+            request.GET = LazySanitizedQueryDict.wrap(request.GET)
         
-        # Nettoyer les données POST
-        if request.method == 'POST' and request.POST:
-            request.POST = self._sanitize_query_dict(request.POST)
+        # Nettoyer les données POST sans forcer le parsing du body
+        if request.method == 'POST':
+            self._defer_post_sanitization(request)
         
         return None
     
-    def _sanitize_query_dict(self, query_dict):
-        """Nettoyage d'un QueryDict"""
-        sanitized = query_dict.copy()
-        
-        for key in sanitized.keys():
-            values = sanitized.getlist(key)
-            sanitized.setlist(key, [self._sanitize_string(value) for value in values])
-        
-        return sanitized
-    
-    def _sanitize_string(self, value):
-        """Nettoyage d'une chaîne de caractères"""
-        if not isinstance(value, str):
-            return value
-        
-        value = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', value)
+    def _defer_post_sanitization(self, request):
+        """Le body n'est parsé qu'au premier accès à request.POST / request.FILES"""
+        if hasattr(request, '_post'):
+            request._post = LazySanitizedQueryDict.wrap(request._post)
+            return
         
-        if len(value) > 1000:
-            value = value[:1000]
+        load_post_and_files = request._load_post_and_files
         
-        value = value.replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;').replace("'", '&#x27;')
+        def load_and_sanitize():
+            load_post_and_files()
+            request._post = LazySanitizedQueryDict.wrap(request._post)
         
-        return value
+        request._load_post_and_files = load_and_sanitize
 
 class AnonymousWebSocketMiddleware:
     """Middleware WebSocket d'anonymisation - Version production finale"""
     
+    anonymizer = WebSocketScopeAnonymizer()
+    
     def __init__(self, inner):
         self.inner = inner
     
     async def __call__(self, scope, receive, send):
         """Point d'entrée ASGI3"""
         if scope['type'] == 'websocket':
-            scope = self._anonymize_scope(scope)
+            scope = self.anonymizer.anonymize(scope)
         
         return await self.inner(scope, receive, send)
-    
-    def _anonymize_scope(self, scope):
-        """Anonymisation complète et définitive du scope WebSocket"""
-        anonymized_scope = {
-            'type': scope['type'],
-            'path': scope['path'],
-            'query_string': scope.get('query_string', b''),
-            'root_path': scope.get('root_path', ''),
-            'scheme': scope.get('scheme', 'ws'),
-            'server': scope.get('server', ('localhost', 8000)),
-            'subprotocols': scope.get('subprotocols', []),
-        }
-        
-        # IP anonymisée définitive toujours localhost
-        anonymized_scope['client'] = ('127.0.0.1', 0)
-        
-        essential_headers = {
-            b'host': b'127.0.0.1:8000',
-            b'connection': b'Upgrade',
-            b'upgrade': b'websocket',
-            b'sec-websocket-version': b'13',
-        }
-        
-        original_headers = dict(scope.get('headers', []))
-        for key in [b'sec-websocket-key', b'sec-websocket-protocol']:
-            if key in original_headers:
-                essential_headers[key] = original_headers[key]
-        
-        anonymized_scope['headers'] = list(essential_headers.items())
-        
-        for key in scope:
-            if key not in anonymized_scope and key not in ['client', 'headers']:
-                if not self._is_identifying_field(key):
-                    anonymized_scope[key] = scope[key]
-        
-        return anonymized_scope
-    
-    def _is_identifying_field(self, field_name):
-        """Détermine si un champ peut être identifiant"""
-        identifying_fields = {
-            'user', 'session', 'cookies', 'auth', 
-            'remote_addr', 'forwarded_for'
-        }
-        return field_name.lower() in identifying_fields
 
 
 
@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrous inter-processus, table désactivée
+    fcntl = None
+
+
+logger = logging.getLogger('lain_security')
+
+
+class SharedRateLimitTable:
+    """Table de rate limiting partagée entre les workers locaux
+
+    Table de taille fixe en mémoire partagée (multiprocessing.shared_memory),
+    adressage ouvert sur le hash de la clé client, découpée en bandes
+    verrouillées indépendamment (fcntl entre processus, threading.Lock dans
+    le processus). Chaque slot garde le compteur de la fenêtre courante et de
+    la précédente : les slots dont la fenêtre a plus d'une période de retard
+    sont considérés libres et réutilisés.
+    """
+
+    MAGIC = b'LAINRL01'
+    HEADER = struct.Struct('<8sII')
+    HEADER_SIZE = 64
+    # key_hash, bucket, count, previous_count, tokens, padding, last_refill
+    SLOT = struct.Struct('<QQIIiiQ')
+    SLOT_KEY = struct.Struct('<QQ')
+    MAX_PROBES = 16
+
+    def __init__(self, name, slots=65536, stripes=1024, lock_dir=None):
+        if fcntl is None:
+            raise RuntimeError("Shared rate limiting requires POSIX file locks")
+        if slots % stripes:
+            raise ValueError("slots must be a multiple of stripes")
+
+        self.name = name
+        self.slots = slots
+        self.stripes = stripes
+        self.stripe_size = slots // stripes
+        self.probes = min(self.MAX_PROBES, self.stripe_size)
+        self._thread_locks = [threading.Lock() for _ in range(stripes)]
+
+        lock_path = os.path.join(lock_dir or tempfile.gettempdir(), f'{name}.lock')
+        self._lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        # Octet « init » après les bandes : sérialise création et attachement
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, stripes)
+        try:
+            self.shm = self._open_segment()
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, stripes)
+
+        self.buf = self.shm.buf
+
+    def _open_segment(self):
+        size = self.HEADER_SIZE + self.slots * self.SLOT.size
+
+        try:
+            shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            self.HEADER.pack_into(shm.buf, 0, self.MAGIC, self.slots, self.stripes)
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=self.name)
+            magic, slots, stripes = self.HEADER.unpack_from(shm.buf, 0)
+            if magic != self.MAGIC or slots != self.slots or stripes != self.stripes:
+                shm.close()
+                raise ValueError(f"Shared rate limit table '{self.name}' has an incompatible layout")
+
+        # Le segment doit survivre aux workers : pas de nettoyage par le resource tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+    @staticmethod
+    def _hash(client_key):
+        digest = hashlib.blake2b(client_key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1  # 0 = slot vide
+
+    @contextmanager
+    def _locked(self, stripe):
+        with self._thread_locks[stripe]:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, stripe)
+
+    def _find_slot(self, key_hash, bucket):
+        """Renvoie l'offset du slot de la clé, ou d'un slot libre/expiré/le plus ancien"""
+        stripe = key_hash % self.stripes
+        base = stripe * self.stripe_size
+        home = (key_hash // self.stripes) % self.stripe_size
+
+        candidate = None
+        oldest = None
+        oldest_bucket = None
+
+        for probe in range(self.probes):
+            offset = self.HEADER_SIZE + (base + (home + probe) % self.stripe_size) * self.SLOT.size
+            slot_key, slot_bucket = self.SLOT_KEY.unpack_from(self.buf, offset)
+
+            if slot_key == key_hash:
+                return offset
+
+            if slot_key == 0:
+                # Aucune clé n'a pu être placée plus loin
+                return candidate if candidate is not None else offset
+
+            if candidate is None and slot_bucket < bucket - 1:
+                candidate = offset
+
+            if oldest_bucket is None or slot_bucket < oldest_bucket:
+                oldest, oldest_bucket = offset, slot_bucket
+
+        return candidate if candidate is not None else oldest
+
+    def hit(self, client_key, requests, window, burst, now=None):
+        """Enregistre une requête ; renvoie True si la limite est dépassée"""
+        now = time.time() if now is None else now
+        key_hash = self._hash(client_key)
+        bucket = int(now // window)
+        current_time = int(now)
+
+        with self._locked(key_hash % self.stripes):
+            offset = self._find_slot(key_hash, bucket)
+            slot_key, slot_bucket, count, previous, tokens, _, last_refill = self.SLOT.unpack_from(self.buf, offset)
+
+            if slot_key != key_hash:
+                slot_bucket, count, previous, tokens, last_refill = bucket, 0, 0, 0, current_time
+
+            # Rotation de la fenêtre temporelle
+            if slot_bucket != bucket:
+                previous = count if slot_bucket == bucket - 1 else 0
+                count = 0
+
+            # Fenêtre glissante approchée : part restante de la fenêtre précédente
+            elapsed = now - bucket * window
+            total_requests = previous * (1 - elapsed / window) + count
+
+            tokens_to_add = int((current_time - last_refill) * (requests / window))
+            tokens = min(burst, tokens + tokens_to_add)
+            last_refill = current_time
+
+            limited = total_requests >= requests
+            if not limited:
+                if tokens <= 0:
+                    limited = total_requests >= (requests // 2)
+                else:
+                    tokens -= 1
+
+            if not limited:
+                count += 1
+
+            self.SLOT.pack_into(
+                self.buf, offset, key_hash, bucket, count, previous, tokens, 0, last_refill
+            )
+
+        return limited
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        os.close(self._lock_fd)
+
+
+_shared_table = None
+_shared_table_lock = threading.Lock()
+_shared_table_failed = False
+
+def get_shared_rate_limit_table():
+    """Récupère la table partagée du processus, ou None si indisponible"""
+    global _shared_table, _shared_table_failed
+
+    if _shared_table is not None or _shared_table_failed:
+        return _shared_table
+
+    config = getattr(settings, 'RATE_LIMIT_SHARED_MEMORY', {})
+    if not config.get('ENABLED', False):
+        _shared_table_failed = True
+        return None
+
+    with _shared_table_lock:
+        if _shared_table is None and not _shared_table_failed:
+            try:
+                _shared_table = SharedRateLimitTable(
+                    name=config.get('NAME', 'lain_rate_limit'),
+                    slots=config.get('SLOTS', 65536),
+                    stripes=config.get('STRIPES', 1024),
+                    lock_dir=config.get('LOCK_DIR'),
+                )
+            except Exception as e:
+                logger.warning(f"Shared rate limit table unavailable, using cache fallback: {e}")
+                _shared_table_failed = True
+
+    return _shared_table
@@ -1,3 +1,392 @@
-from django.test import TestCase
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from multiprocessing import resource_tracker, shared_memory
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, identify_hasher, make_password
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, override_settings
 
+from . import ratelimit
+from .event_pipeline import SecurityEventPipeline
+from .hashers import OffloadedPBKDF2PasswordHasher
+from .kdf_pool import KDFPool, KDFPoolSaturated, pbkdf2_sha256
+from .middleware import (
+    LazySanitizedQueryDict, ResponseLeakAuditor, SecureLogger, WebSocketScopeAnonymizer, WebSocketSecurityMiddleware,
+)
+from .ratelimit import SharedRateLimitTable
+
+
+class LazySanitizedQueryDictTests(SimpleTestCase):
+    """Toute lecture d'une valeur renvoie la version nettoyée"""
+
+    def make(self, query_string):
+        return LazySanitizedQueryDict.wrap(QueryDict(query_string, mutable=True))
+
+    def test_values_are_sanitized_on_access(self):
+        data = self.make('q=%3Cscript%3E&tags=%3Ca%3E&tags=b%00')
+
+        self.assertEqual(data['q'], '&lt;script&gt;')
+        self.assertEqual(data.get('q'), '&lt;script&gt;')
+        self.assertEqual(data.getlist('tags'), ['&lt;a&gt;', 'b'])
+        self.assertEqual(dict(data.lists()), {'q': ['&lt;script&gt;'], 'tags': ['&lt;a&gt;', 'b']})
+
+    def test_values_are_sanitized_once(self):
+        data = self.make('q=%3Cb%3E')
+
+        data['q']
+        self.assertEqual(data['q'], '&lt;b&gt;')
+
+    def test_pop_returns_sanitized_values(self):
+        data = self.make('q=%3Cb%3E&r=ok')
+
+        self.assertEqual(data.pop('q'), ['&lt;b&gt;'])
+        self.assertNotIn('q', data)
+        self.assertEqual(data.pop('missing', None), None)
+
+    def test_popitem_returns_sanitized_values(self):
+        data = self.make('q=%3Cb%3E')
+
+        self.assertEqual(data.popitem(), ('q', ['&lt;b&gt;']))
+
+    def test_assigned_values_are_kept_as_is(self):
+        data = self.make('q=a')
+
+        data['q'] = '<trusted>'
+        self.assertEqual(data['q'], '<trusted>')
+
+    def test_copy_is_sanitized(self):
+        data = self.make('q=%3Cb%3E')
+
+        copied = data.copy()
+        self.assertEqual(type(copied), QueryDict)
+        self.assertEqual(copied['q'], '&lt;b&gt;')
+
+
+def _hit_in_child(name, lock_dir, hits):
+    table = SharedRateLimitTable(name, slots=64, stripes=4, lock_dir=lock_dir)
+    try:
+        for _ in range(hits):
+            table.hit('shared-client', 10 ** 6, 60, 10 ** 6, now=1000.0)
+    finally:
+        table.close()
+
+
+@unittest.skipIf(ratelimit.fcntl is None, "POSIX file locks required")
+class SharedRateLimitTableTests(SimpleTestCase):
+
+    def setUp(self):
+        self.name = f'lain_rl_test_{os.getpid()}_{self._testMethodName}'[:30]
+        self.lock_dir = tempfile.mkdtemp()
+        self.tables = []
+
+    def tearDown(self):
+        for table in self.tables:
+            table.close()
+        # Réenregistré pour que unlink() puisse le désenregistrer sans erreur
+        resource_tracker.register(f'/{self.name}', 'shared_memory')
+        shared_memory.SharedMemory(name=self.name).unlink()
+
+    def open_table(self, slots=64, stripes=4):
+        table = SharedRateLimitTable(self.name, slots=slots, stripes=stripes, lock_dir=self.lock_dir)
+        self.tables.append(table)
+        return table
+
+    def slot_count(self, table, client_key, bucket):
+        offset = table._find_slot(table._hash(client_key), bucket)
+        return table.SLOT.unpack_from(table.buf, offset)[2]
+
+    def test_limits_after_threshold(self):
+        table = self.open_table()
+
+        # Client neuf sans jetons : la moitié de la limite passe
+        results = [table.hit('client', 10, 60, 20, now=1000.0) for _ in range(6)]
+        self.assertEqual(results, [False] * 5 + [True])
+
+    def test_clients_are_independent(self):
+        table = self.open_table()
+
+        for _ in range(6):
+            table.hit('noisy', 10, 60, 20, now=1000.0)
+        self.assertFalse(table.hit('quiet', 10, 60, 20, now=1000.0))
+
+    def test_window_expires(self):
+        table = self.open_table()
+
+        for _ in range(6):
+            table.hit('client', 10, 60, 20, now=1000.0)
+        self.assertTrue(table.hit('client', 10, 60, 20, now=1001.0))
+        self.assertFalse(table.hit('client', 10, 60, 20, now=1200.0))
+
+    def test_state_is_shared_between_attachments(self):
+        first = self.open_table()
+        second = self.open_table()
+
+        for _ in range(5):
+            first.hit('client', 10, 60, 20, now=1000.0)
+        self.assertTrue(second.hit('client', 10, 60, 20, now=1000.0))
+
+    def test_concurrent_processes_do_not_lose_hits(self):
+        table = self.open_table()
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_hit_in_child, args=(self.name, self.lock_dir, 250))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+            self.assertEqual(worker.exitcode, 0)
+
+        self.assertEqual(self.slot_count(table, 'shared-client', int(1000.0 // 60)), 1000)
+
+    def test_incompatible_layout_is_rejected(self):
+        self.open_table()
+
+        with self.assertRaises(ValueError):
+            self.open_table(slots=128)
+
+
+class KDFPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = KDFPool(workers=1, max_pending=1, admission_timeout=0.05)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_runs_in_pool(self):
+        result = self.pool.run(pbkdf2_sha256, b'password', b'salt', 1000)
+
+        self.assertEqual(result, hashlib.pbkdf2_hmac('sha256', b'password', b'salt', 1000))
+        self.assertEqual(self.pool.stats()['submitted'], 1)
+
+    def test_saturated_pool_rejects(self):
+        # Le seul slot est tenu par une tâche longue dans un autre thread
+        busy = threading.Thread(target=self.pool.run, args=(time.sleep, 1))
+        busy.start()
+        deadline = time.monotonic() + 30
+        while self.pool.in_flight == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        try:
+            with self.assertRaises(KDFPoolSaturated):
+                self.pool.run(pbkdf2_sha256, b'password', b'salt', 1000)
+            self.assertEqual(self.pool.stats()['rejected'], 1)
+        finally:
+            busy.join()
+
+
+class OffloadedPBKDF2PasswordHasherTests(SimpleTestCase):
+
+    def test_verifies_stock_hashes(self):
+        encoded = PBKDF2PasswordHasher().encode('present day', 'saltsaltsalt', iterations=1000)
+
+        self.assertIsInstance(identify_hasher(encoded), OffloadedPBKDF2PasswordHasher)
+        self.assertTrue(check_password('present day', encoded))
+        self.assertFalse(check_password('present time', encoded))
+
+    def test_encodes_like_stock_hasher(self):
+        offloaded = OffloadedPBKDF2PasswordHasher().encode('present day', 'saltsaltsalt', iterations=1000)
+        stock = PBKDF2PasswordHasher().encode('present day', 'saltsaltsalt', iterations=1000)
+
+        self.assertEqual(offloaded, stock)
+        self.assertTrue(PBKDF2PasswordHasher().verify('present day', make_password('present day')))
+
+    def test_saturated_pool_propagates(self):
+        saturated = KDFPool(max_pending=1, admission_timeout=0.01)
+        saturated._slots.acquire()
+        encoded = PBKDF2PasswordHasher().encode('present day', 'saltsaltsalt', iterations=1000)
+
+        # Les vues de connexion traduisent cette exception en 503
+        with mock.patch('security.hashers.get_kdf_pool', return_value=saturated):
+            with self.assertRaises(KDFPoolSaturated):
+                check_password('present day', encoded)
+
+
+class SecurityEventPipelineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pipeline = SecurityEventPipeline(flush_interval=0.01, aggregation_window=0)
+        self.secure_logger = SecureLogger('lain_test_pipeline')
+        self.addCleanup(self.pipeline.stop)
+
+    def wait_for(self, logs, text):
+        deadline = time.monotonic() + 5
+        while not any(text in line for line in logs.output) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return any(text in line for line in logs.output)
+
+    def test_poison_event_does_not_stop_logging(self):
+        with self.assertLogs('lain_security', 'WARNING') as dropped:
+            with self.assertLogs('lain_test_pipeline', 'INFO') as logs:
+                # _sanitize_details appelle key.lower() : une clé int lève AttributeError
+                self.pipeline.submit(self.secure_logger, logging.INFO, 'POISON', {1: 'x'})
+                self.pipeline.submit(self.secure_logger, logging.INFO, 'AFTER_POISON', {'k': 'v'})
+
+                self.assertTrue(self.wait_for(logs, 'AFTER_POISON'))
+            self.assertTrue(self.wait_for(dropped, "EVENTS_DROPPED"))
+
+        self.assertTrue(self.pipeline._worker.is_alive())
+        self.assertFalse(any(':POISON:' in line for line in logs.output))
+
+    def test_dead_worker_is_restarted(self):
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        self.pipeline._worker = dead
+
+        with self.assertLogs('lain_security', 'ERROR'):
+            with self.assertLogs('lain_test_pipeline', 'INFO') as logs:
+                self.pipeline.submit(self.secure_logger, logging.INFO, 'AFTER_RESTART', None)
+                self.assertTrue(self.wait_for(logs, 'AFTER_RESTART'))
+
+        self.assertIsNot(self.pipeline._worker, dead)
+
+
+@override_settings(SECURITY_AUDIT_CONFIG={'RESPONSE_AUDIT_SAMPLE_RATE': 1.0, 'RESPONSE_AUDIT_QUEUE_SIZE': 1})
+class ResponseLeakAuditorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.auditor = ResponseLeakAuditor()
+        self.request = RequestFactory().get('/api/status/')
+        log = mock.patch('security.middleware.security_logger.log_security_event')
+        self.log_security_event = log.start()
+        self.addCleanup(log.stop)
+
+    def fill_queue(self, responses):
+        # Sans worker, la file d'une place déborde dès la deuxième réponse
+        with mock.patch.object(self.auditor, '_ensure_worker'):
+            for _ in range(responses):
+                self.auditor.submit(self.request, HttpResponse(b'present day', content_type='text/plain'))
+
+    def test_dropped_responses_are_reported(self):
+        self.fill_queue(3)
+
+        self.assertEqual(self.auditor.report_dropped(force=True), 2)
+        self.log_security_event.assert_called_once_with(logging.WARNING, 'RESPONSE_AUDIT_DROPPED', {'dropped': 2})
+        self.assertEqual(self.auditor.dropped, 0)
+
+    def test_reports_are_rate_limited(self):
+        self.fill_queue(2)
+        self.auditor.report_dropped(force=True)
+        self.auditor.queue.get_nowait()
+        self.fill_queue(3)
+
+        self.assertEqual(self.auditor.report_dropped(), 0)
+        self.assertEqual(self.auditor.dropped, 2)
+
+        self.auditor._dropped_reported -= ResponseLeakAuditor.DROP_REPORT_INTERVAL
+        self.assertEqual(self.auditor.report_dropped(), 2)
+        self.assertEqual(self.log_security_event.call_count, 2)
+
+    def test_worker_reports_while_idle(self):
+        self.fill_queue(2)
+        self.auditor.queue.get_nowait()
+        self.auditor._dropped_reported -= ResponseLeakAuditor.DROP_REPORT_INTERVAL
+
+        with mock.patch.object(ResponseLeakAuditor, 'DROP_REPORT_INTERVAL', 0.01):
+            self.auditor._ensure_worker()
+            deadline = time.monotonic() + 2
+            while not self.log_security_event.called and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.log_security_event.assert_called_with(logging.WARNING, 'RESPONSE_AUDIT_DROPPED', {'dropped': 1})
+
+
+def websocket_scope(path='/ws/chat/general/', headers=()):
+    return {
+        'type': 'websocket',
+        'path': path,
+        'query_string': b'',
+        'client': ('203.0.113.7', 51234),
+        'headers': [
+            (b'host', b'lain.example'),
+            (b'user-agent', b'NAVI'),
+            (b'cookie', b'sessionid=abc'),
+            (b'sec-websocket-key', b'dGhlIHNhbXBsZSBub25jZQ=='),
+            *headers,
+        ],
+        'user': object(),
+        'session': {'id': 'abc'},
+        'cookies': {'sessionid': 'abc'},
+        'url_route': {'kwargs': {'room_name': 'general'}},
+        'state': {'layer': 'wired'},
+    }
+
+
+class WebSocketScopeAnonymizerTests(SimpleTestCase):
+
+    def test_scope_is_rewritten(self):
+        scope = WebSocketScopeAnonymizer().anonymize(websocket_scope())
+
+        self.assertEqual(scope['client'], WebSocketScopeAnonymizer.ANONYMOUS_CLIENT)
+        self.assertEqual(scope['headers'], [
+            *WebSocketScopeAnonymizer.ESSENTIAL_HEADERS,
+            (b'sec-websocket-key', b'dGhlIHNhbXBsZSBub25jZQ=='),
+        ])
+        for field in ('user', 'session', 'cookies'):
+            self.assertNotIn(field, scope)
+        self.assertEqual(scope['state'], {'layer': 'wired'})
+        self.assertEqual(scope['url_route'], {'kwargs': {'room_name': 'general'}})
+
+    def test_passthrough_fields_restrict_the_scope(self):
+        scope = WebSocketScopeAnonymizer(passthrough_fields=('url_route',)).anonymize(websocket_scope())
+
+        self.assertIn('url_route', scope)
+        self.assertNotIn('state', scope)
+
+    def test_last_repeated_handshake_header_wins(self):
+        scope = WebSocketScopeAnonymizer().anonymize(websocket_scope(headers=[
+            (b'sec-websocket-protocol', b'lain.v1'),
+            (b'sec-websocket-protocol', b'lain.v2'),
+        ]))
+
+        protocols = [value for name, value in scope['headers'] if name == b'sec-websocket-protocol']
+        self.assertEqual(protocols, [b'lain.v2'])
+        self.assertEqual(scope['headers'][-2][0], b'sec-websocket-key')
+
+    def test_allowed_paths(self):
+        anonymizer = WebSocketScopeAnonymizer()
+
+        self.assertTrue(anonymizer.is_allowed_path('/ws/chat/general/'))
+        self.assertTrue(anonymizer.is_allowed_path('/ws/layer/1234/'))
+        self.assertFalse(anonymizer.is_allowed_path('/ws/admin/'))
+        self.assertFalse(anonymizer.is_allowed_path('/api/ws/chat/'))
+
+
+class WebSocketSecurityMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.inner = mock.AsyncMock()
+        self.send = mock.AsyncMock()
+        self.middleware = WebSocketSecurityMiddleware(self.inner)
+
+    def call(self, scope):
+        async_to_sync(self.middleware)(scope, mock.AsyncMock(), self.send)
+
+    def test_disallowed_path_is_closed_before_rewriting(self):
+        with mock.patch.object(self.middleware.security_logger, 'log_security_event') as log_security_event:
+            self.call(websocket_scope('/ws/admin/'))
+
+        self.send.assert_awaited_once_with({'type': 'websocket.close', 'code': 1008})
+        self.inner.assert_not_awaited()
+        self.assertEqual(log_security_event.call_args.args[1], 'UNAUTHORIZED_WEBSOCKET_PATH')
+
+    def test_allowed_path_reaches_inner_application_anonymized(self):
+        self.call(websocket_scope())
+
+        scope = self.inner.call_args.args[0]
+        self.assertTrue(scope['security_validated'])
+        self.assertEqual(scope['client'], WebSocketScopeAnonymizer.ANONYMOUS_CLIENT)
+        self.assertNotIn('session', scope)
+        self.assertNotIn('state', scope)  # Hors des passthrough_fields
+        self.send.assert_not_awaited()
 
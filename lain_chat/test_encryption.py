@@ -30,7 +30,7 @@ def test_encryption_system():
         encrypted_data, nonce, salt = encryptor.encrypt_message(test_message, layer_id, room_name)
         print(f"    Message chiffré (taille: {len(encrypted_data)} bytes)")
         print(f"    Nonce généré: {nonce[:16]}...")
-        print(f"    Sel généré: {len(salt)} bytes")
+        print(f"    Sel généré: {len(salt) if salt else 0} bytes")
         
         # Déchiffrer
         decrypted_message = encryptor.decrypt_message(encrypted_data, nonce, salt)
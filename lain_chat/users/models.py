@@ -30,18 +30,23 @@ class MinimalUser(AbstractUser):
         """Génère un hash unique pour cette session"""
         data = f"{self.id}:{timezone.now().timestamp()}"
         self.session_hash = hashlib.sha256(data.encode()).hexdigest()
-        self.save()
+        self.save(update_fields=['session_hash'])
         return self.session_hash
     
     def clear_session_hash(self):
         """Efface le hash de session (déconnexion)"""
         self.session_hash = None
-        self.save()
+        self.save(update_fields=['session_hash'])
     
     def increment_layer_count(self):
-        """Incrémente le compteur de layers"""
-        self.layers_created_count += 1
-        self.save()
+        """Incrémente le compteur de layers (écrit au prochain flush du tampon)
+
+        L'attribut en mémoire n'est pas modifié : un save() complet avant le
+        flush l'écrirait, et le flush ajouterait encore 1 par-dessus.
+        """
+        from lain_chat.write_buffer import get_write_buffer
+        
+        get_write_buffer().increment(type(self), self.pk, 'layers_created_count')
     
     def __str__(self):
         return f"User {self.username} (ID: {self.id})"
\ No newline at end of file
@@ -1,3 +1,33 @@
+from unittest import mock
+from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-# Create your tests here.
+from lain_chat.write_buffer import WriteBuffer
+
+
+class IncrementLayerCountTests(TestCase):
+    """Le compteur n'est écrit que par le flush du tampon"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('lain', password='present day')
+        self.buffer = WriteBuffer(interval=60)
+
+    def increment(self):
+        with mock.patch('lain_chat.write_buffer.get_write_buffer', return_value=self.buffer):
+            self.user.increment_layer_count()
+
+    def test_counter_is_written_on_flush(self):
+        self.increment()
+        self.increment()
+        self.buffer.flush()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.layers_created_count, 2)
+
+    def test_full_save_before_flush_does_not_double_count(self):
+        self.increment()
+        self.user.save()
+        self.buffer.flush()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.layers_created_count, 1)